@@ -2,12 +2,21 @@
 
 # Notebook/backend/ai_core.py
 import os
+import math
+import hashlib
 import logging
-import fitz  # PyMuPDF
-import re
+import time
+import uuid
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Iterator
+import numpy as np
+import faiss
 # Near the top of ai_core.py
 from langchain_community.vectorstores import FAISS
-from langchain_ollama import OllamaEmbeddings, ChatOllama
+from langchain_community.vectorstores.utils import DistanceStrategy
+from ollama_pool import PooledOllamaEmbeddings, PooledChatOllama
 # Removed incorrect OllamaLLM import if it was there from previous attempts
 from langchain.text_splitter import RecursiveCharacterTextSplitter # <<<--- ENSURE THIS IS PRESENT
 from langchain.docstore.document import Document
@@ -17,56 +26,130 @@ from config import (
     OLLAMA_BASE_URL, OLLAMA_MODEL, OLLAMA_EMBED_MODEL, FAISS_FOLDER,
     DEFAULT_PDFS_FOLDER, UPLOAD_FOLDER, RAG_CHUNK_K, MULTI_QUERY_COUNT,
     ANALYSIS_MAX_CONTEXT_LENGTH, OLLAMA_REQUEST_TIMEOUT, RAG_SEARCH_K_PER_QUERY,
-    SUB_QUERY_PROMPT_TEMPLATE, SYNTHESIS_PROMPT_TEMPLATE, ANALYSIS_PROMPTS
+    SUB_QUERY_PROMPT_TEMPLATE, SYNTHESIS_PROMPT_TEMPLATE, ANALYSIS_PROMPTS,
+    DOC_TEXT_CACHE_MAX_MB, QUERY_EMBED_CACHE_MAX_MB, RAG_PIPELINED, RAG_LATENCY_BUDGET_SECONDS,
+    RAG_HYBRID_ENABLED, RAG_SPARSE_K_PER_QUERY, RAG_RRF_K, RAG_KEYWORD_QUERY_MAX_TERMS,
+    RAG_RERANK_MODE, RAG_RERANK_CANDIDATES, RAG_MMR_LAMBDA, RAG_CONTEXT_TOKEN_BUDGET, ANALYSIS_MAX_CONTEXT_TOKENS,
+    ANSWER_CACHE_ENABLED, ANSWER_CACHE_MAX_ENTRIES, ANSWER_CACHE_TTL_SECONDS, ANSWER_CACHE_SIMILARITY,
+    ANALYSIS_CACHE_ENABLED, ANALYSIS_MAP_REDUCE_ENABLED, ANALYSIS_SECTION_CHARS, ANALYSIS_MAP_WORKERS, ANALYSIS_REDUCE_FANIN,
+    ANALYSIS_SECTION_NOTES_PROMPT, ANALYSIS_NOTES_MERGE_PROMPT,
+    FAISS_WAL_ENABLED, FAISS_WAL_COMPACT_MB, FAISS_TOMBSTONE_COMPACT_RATIO, FAISS_INDEX_TYPE, FAISS_ANN_MIN_VECTORS, FAISS_MMAP_ENABLED
 )
 from utils import parse_llm_response, escape_html # Added escape_html for potential use
+import pdf_extract
+import text_store
+from caching import LRUCache, SemanticCache
+import embedding_pipeline
+import vector_wal
+import ann_index
+import embedding_cache
+import chunk_store
+import sparse_index
+import reranker
+import context_packer
+import ollama_gateway
+import ollama_pool
+import database
 
 logger = logging.getLogger(__name__)
 
 # --- Global State (managed within functions) ---
-document_texts_cache = {}
+# Bounded LRU of document texts for analysis; filled lazily from the text store
+document_texts_cache = LRUCache("document_texts", DOC_TEXT_CACHE_MAX_MB * 1024 * 1024)
+# LRU of recent query embeddings (float32 vectors), keyed by (embed model, normalized query)
+query_embedding_cache = LRUCache("query_embeddings", QUERY_EMBED_CACHE_MAX_MB * 1024 * 1024, size_fn=lambda v: v.nbytes + 100)
+# Answers to recent chat questions, reused for near-identical questions over the same chunks
+answer_cache = SemanticCache("chat_answers", ANSWER_CACHE_MAX_ENTRIES, ANSWER_CACHE_TTL_SECONDS, ANSWER_CACHE_SIMILARITY)
+_index_generation = 0 # Bumped (under _search_view_lock) whenever chunks are added or deleted; invalidates answer_cache
+# Striped locks by analysis cache key, so concurrent requests (or the precompute pass) run the LLM once
+# per key. A fixed array (rather than a lock per key) keeps memory bounded; keys sharing a stripe
+# just wait for each other.
+_ANALYSIS_LOCK_STRIPES = 64
+_analysis_locks = tuple(threading.Lock() for _ in range(_ANALYSIS_LOCK_STRIPES))
+# Bounded pool for map-reduce analysis requests to Ollama (shared by /analyze and the precompute pass)
+_analysis_executor = ThreadPoolExecutor(max_workers=max(ANALYSIS_MAP_WORKERS, 1), thread_name_prefix="analysis")
+# Background workers for pipelined RAG (sub-query generation overlaps retrieval)
+_rag_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="rag")
+# Per-stage timings of the most recent RAG search (exposed via /status)
+_rag_timings_lock = threading.Lock()
+latest_rag_timings: dict = {}
+latest_context_stats: dict = {} # Tokens used by the latest packed context (see context_packer)
+# Serializes index writers (concurrent upload jobs, request handlers)
+vector_store_write_lock = threading.RLock()
+# Held briefly by searches while they capture index/docstore/tombstones, and by writers while they swap
+# or renumber them, so a search never pairs an index with positions from another snapshot
+_search_view_lock = threading.Lock()
+_compaction_thread: threading.Thread | None = None
+_index_is_mmapped = False # True while vector_store.index is a read-only memory map of index.faiss
+_tombstones: set[int] = set() # Positions of deleted chunks whose vectors are still in the index (dropped by the next compaction)
 vector_store = None
-embeddings: OllamaEmbeddings | None = None
-llm: ChatOllama | None = None
+bm25_index: sparse_index.BM25Index | None = None # Sparse index over the same positions (RAG_HYBRID_ENABLED)
+_SNAPSHOT_TMP_FOLDER = ".snapshot-tmp"
+_SNAPSHOT_COMMIT_MARKER = "COMMITTED"
+embeddings: PooledOllamaEmbeddings | None = None # Routed across OLLAMA_BASE_URLS (ollama_pool)
+llm: PooledChatOllama | None = None
+_ai_components_lock = threading.Lock()
 
 # --- Initialization Functions ---
 
-# ai_core.py (only showing the modified function)
-def initialize_ai_components() -> tuple[OllamaEmbeddings | None, ChatOllama | None]:
-    """Initializes Ollama Embeddings and LLM instances globally.
+def create_ai_components() -> tuple[PooledOllamaEmbeddings, PooledChatOllama]:
+    """Creates the global Ollama Embeddings and LLM instances without contacting Ollama.
+
+    Both are routed across the Ollama servers in OLLAMA_BASE_URLS (see ollama_pool). Creating them
+    is cheap, so the index can be opened while the models are still being probed
+    (see check_ai_components).
 
     Returns:
-        tuple[OllamaEmbeddings | None, ChatOllama | None]: The initialized embeddings and llm objects,
-                                                          or (None, None) if initialization fails.
+        tuple[PooledOllamaEmbeddings, PooledChatOllama]: The (possibly already existing) embeddings and llm objects.
     """
     global embeddings, llm
-    if embeddings and llm:
-        logger.info("AI components already initialized.")
+    with _ai_components_lock:
+        if embeddings and llm:
+            return embeddings, llm
+        # One ChatOllama + OllamaEmbeddings per server, each with a keep-alive connection pool sized to the gateway
+        backend_urls = [backend.base_url for backend in ollama_pool.pool.backends]
+        ollama_pool.pool.create_clients(OLLAMA_MODEL, OLLAMA_EMBED_MODEL, ollama_gateway.http_client_kwargs())
+        logger.info(f"Initializing Ollama Embeddings: model={OLLAMA_EMBED_MODEL}, base_urls={backend_urls}, timeout={OLLAMA_REQUEST_TIMEOUT}s")
+        embeddings = PooledOllamaEmbeddings(model=OLLAMA_EMBED_MODEL)
+        logger.info(f"Initializing Ollama LLM: model={OLLAMA_MODEL}, base_urls={backend_urls}, timeout={OLLAMA_REQUEST_TIMEOUT}s")
+        llm = PooledChatOllama(model=OLLAMA_MODEL)
         return embeddings, llm
 
-    try:
-        # Use the new OllamaEmbeddings from langchain_ollama
-        logger.info(f"Initializing Ollama Embeddings: model={OLLAMA_EMBED_MODEL}, base_url={OLLAMA_BASE_URL}, timeout={OLLAMA_REQUEST_TIMEOUT}s")
-        embeddings = OllamaEmbeddings(
-            model=OLLAMA_EMBED_MODEL,
-            base_url=OLLAMA_BASE_URL,
-            #request_timeout=OLLAMA_REQUEST_TIMEOUT # Explicitly pass timeout
-        )
-        # Perform a quick test embedding
-        _ = embeddings.embed_query("Test embedding query")
-        logger.info("Ollama Embeddings initialized successfully.")
-
-        # Use the new ChatOllama from langchain_ollama
-        logger.info(f"Initializing Ollama LLM: model={OLLAMA_MODEL}, base_url={OLLAMA_BASE_URL}, timeout={OLLAMA_REQUEST_TIMEOUT}s")
-        llm = ChatOllama(
-            model=OLLAMA_MODEL,
-            base_url=OLLAMA_BASE_URL,
-            #request_timeout=OLLAMA_REQUEST_TIMEOUT # Explicitly pass timeout
-        )
-        # Perform a quick test invocation
-        _ = llm.invoke("Respond briefly with 'AI Check OK'")
-        logger.info("Ollama LLM initialized successfully.")
 
+def check_ai_components():
+    """Probes the Ollama servers and both models with a test embedding and a test prompt.
+
+    Servers that are unreachable begin ejected and are re-admitted by the health probe, which is
+    started here once the models respond.
+
+    Raises:
+        Exception: Whatever the failing test call raised (server down, unknown model, ...).
+    """
+    create_ai_components()
+    backend_count = len(ollama_pool.pool.backends)
+    if backend_count > 1:
+        ollama_pool.pool.probe_all()
+        logger.info(f"{ollama_pool.pool.healthy_count()} of {backend_count} Ollama backends reachable.")
+    # Perform a quick test embedding
+    _ = embeddings.embed_query("Test embedding query")
+    logger.info("Ollama Embeddings initialized successfully.")
+    # Perform a quick test invocation
+    _ = llm.invoke("Respond briefly with 'AI Check OK'")
+    logger.info("Ollama LLM initialized successfully.")
+    ollama_pool.pool.start_health_checks()
+
+
+def initialize_ai_components() -> tuple[PooledOllamaEmbeddings | None, PooledChatOllama | None]:
+    """Initializes Ollama Embeddings and LLM instances globally and checks that both respond.
+
+    Returns:
+        tuple[PooledOllamaEmbeddings | None, PooledChatOllama | None]: The initialized embeddings and llm objects,
+                                                                      or (None, None) if initialization fails.
+    """
+    global embeddings, llm
+    try:
+        create_ai_components()
+        check_ai_components()
         return embeddings, llm  # Return the objects
     except ImportError as e:
         logger.critical(f"Import error during AI initialization: {e}. Ensure correct langchain packages are installed.", exc_info=True)
@@ -93,7 +176,7 @@ def load_vector_store() -> bool:
     Returns:
         bool: True if the index was loaded successfully, False otherwise (or if not found).
     """
-    global vector_store, embeddings
+    global vector_store, embeddings, bm25_index
     if vector_store:
         logger.info("Vector store already loaded.")
         return True
@@ -103,18 +186,45 @@ def load_vector_store() -> bool:
 
     faiss_index_path = os.path.join(FAISS_FOLDER, "index.faiss")
     faiss_pkl_path = os.path.join(FAISS_FOLDER, "index.pkl")
+    chunks_path = os.path.join(FAISS_FOLDER, chunk_store.CHUNKS_FILENAME)
+    _finish_interrupted_snapshot()
+    _tombstones.clear()
+    bm25_index = None
+    _bump_index_generation()
 
-    if os.path.exists(faiss_index_path) and os.path.exists(faiss_pkl_path):
+    if os.path.exists(faiss_index_path) and (os.path.exists(chunks_path) or os.path.exists(faiss_pkl_path)):
         try:
             logger.info(f"Loading FAISS index from folder: {FAISS_FOLDER}")
-            # Note: Loading requires the same embedding model used for saving.
-            # allow_dangerous_deserialization is required for FAISS/pickle
-            vector_store = FAISS.load_local(
-                folder_path=FAISS_FOLDER,
-                embeddings=embeddings, # Pass the initialized embeddings object
-                allow_dangerous_deserialization=True
-            )
+            started_at = time.perf_counter()
+            if os.path.exists(chunks_path):
+                # Current format: memory-mapped index + memory-mapped columnar chunk store
+                index = _read_index_file(faiss_index_path)
+                docstore = chunk_store.ChunkStore(chunks_path)
+                vector_store = FAISS(
+                    embedding_function=embeddings,
+                    index=index,
+                    docstore=docstore,
+                    index_to_docstore_id=docstore.index_map,
+                    distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT if index.metric_type == faiss.METRIC_INNER_PRODUCT else DistanceStrategy.EUCLIDEAN_DISTANCE,
+                )
+            else:
+                # Legacy pickle format; converted to the current format by the next snapshot
+                logger.info("Loading legacy pickled docstore (index.pkl). It will be converted on the next snapshot.")
+                # Note: Loading requires the same embedding model used for saving.
+                # allow_dangerous_deserialization is required for FAISS/pickle
+                vector_store = FAISS.load_local(
+                    folder_path=FAISS_FOLDER,
+                    embeddings=embeddings, # Pass the initialized embeddings object
+                    allow_dangerous_deserialization=True
+                )
+                _set_index(vector_store.index, mmapped=False)
+            with vector_store_write_lock:
+                _repair_snapshot_consistency()
+                _load_bm25_index()
+                _replay_write_ahead_log()
+                ann_index.apply_default_search_params(vector_store.index)
             index_size = getattr(getattr(vector_store, 'index', None), 'ntotal', 0)
+            logger.debug(f"FAISS store opened in {time.perf_counter() - started_at:.3f}s (memory-mapped: {_index_is_mmapped}).")
             if index_size > 0:
                 logger.info(f"FAISS index loaded successfully. Contains {index_size} vectors.")
                 return True
@@ -134,18 +244,305 @@ def load_vector_store() -> bool:
             vector_store = None # Ensure it's None if loading failed
             return False
     else:
-        logger.warning(f"FAISS index files (index.faiss, index.pkl) not found at {FAISS_FOLDER}. Will be created on first upload or if default.py ran.")
         vector_store = None
+        if vector_wal.wal_size() > 0:
+            # No snapshot yet, but logged adds exist: rebuild the index from the log alone
+            logger.warning(f"FAISS snapshot not found at {FAISS_FOLDER}, but a write-ahead log exists. Rebuilding index from the log.")
+            with vector_store_write_lock:
+                _replay_write_ahead_log()
+            if vector_store:
+                return True
+        logger.warning(f"FAISS index files (index.faiss, {chunk_store.CHUNKS_FILENAME}) not found at {FAISS_FOLDER}. Will be created on first upload or if default.py ran.")
         return False # Indicate index wasn't loaded
 
 
+def _finish_interrupted_snapshot():
+    """Completes or discards a snapshot that save_vector_store was writing when the process stopped.
+
+    A snapshot is committed (marker file written) only once index.faiss and chunks.bin are both
+    complete in the temporary folder; a committed snapshot is moved into place, anything else
+    is discarded (the previous snapshot plus the write-ahead log are still intact).
+    """
+    tmp_folder = os.path.join(FAISS_FOLDER, _SNAPSHOT_TMP_FOLDER)
+    if not os.path.isdir(tmp_folder):
+        return
+    if os.path.exists(os.path.join(tmp_folder, _SNAPSHOT_COMMIT_MARKER)):
+        logger.warning("Completing an interrupted FAISS snapshot swap.")
+        _install_snapshot_files(tmp_folder)
+    else:
+        logger.warning("Discarding an incomplete FAISS snapshot left by an interrupted save.")
+    shutil.rmtree(tmp_folder, ignore_errors=True)
+
+
+def _install_snapshot_files(tmp_folder: str):
+    """Moves committed snapshot files from `tmp_folder` into FAISS_FOLDER (index first, chunks second).
+
+    A sparse index missing from the snapshot (hybrid search disabled) is removed, so a stale one
+    is never paired with a newer index.
+    """
+    for filename in ("index.faiss", chunk_store.CHUNKS_FILENAME, sparse_index.SPARSE_FILENAME):
+        tmp_path = os.path.join(tmp_folder, filename)
+        if os.path.exists(tmp_path):
+            os.replace(tmp_path, os.path.join(FAISS_FOLDER, filename))
+        elif filename == sparse_index.SPARSE_FILENAME and os.path.exists(os.path.join(FAISS_FOLDER, filename)):
+            os.remove(os.path.join(FAISS_FOLDER, filename))
+    legacy_pkl_path = os.path.join(FAISS_FOLDER, "index.pkl")
+    if os.path.exists(legacy_pkl_path):
+        os.remove(legacy_pkl_path)
+        logger.info("Converted legacy pickled docstore (index.pkl) to the on-disk chunk store.")
+    _fsync_path(FAISS_FOLDER)
+
+
+def _snapshot_exists() -> bool:
+    return os.path.exists(os.path.join(FAISS_FOLDER, "index.faiss")) and (
+        os.path.exists(os.path.join(FAISS_FOLDER, chunk_store.CHUNKS_FILENAME))
+        or os.path.exists(os.path.join(FAISS_FOLDER, "index.pkl"))
+    )
+
+
+def snapshot_needs_compaction() -> bool:
+    """True if the write-ahead log has pending records, deleted vectors await removal, or the
+    snapshot is in the legacy pickle format."""
+    return vector_wal.wal_size() > 0 or bool(_tombstones) or (
+        _snapshot_exists() and not os.path.exists(os.path.join(FAISS_FOLDER, chunk_store.CHUNKS_FILENAME))
+    )
+
+
+def _read_index_file(path: str) -> faiss.Index:
+    """Reads index.faiss, memory-mapped read-only when FAISS_MMAP_ENABLED (shared page cache across workers)."""
+    if FAISS_MMAP_ENABLED:
+        try:
+            index = faiss.read_index(path, getattr(faiss, 'IO_FLAG_MMAP_IFC', faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY)
+            _set_index(index, mmapped=True)
+            return index
+        except RuntimeError as e:
+            logger.warning(f"Could not memory-map {path} ({e}). Reading it into memory instead.")
+    index = faiss.read_index(path)
+    _set_index(index, mmapped=False)
+    return index
+
+
+def _set_index(index: faiss.Index, mmapped: bool):
+    global _index_is_mmapped
+    _index_is_mmapped = mmapped
+    if vector_store is not None:
+        vector_store.index = index
+
+
+def _ensure_writable_index():
+    """Copies a memory-mapped (read-only) index into private memory before it is modified.
+
+    FAISS aborts the process when adding to or removing from a memory-mapped index.
+    """
+    if _index_is_mmapped and vector_store is not None:
+        logger.info(f"Promoting memory-mapped FAISS index ({vector_store.index.ntotal} vectors) to a writable in-memory copy.")
+        _set_index(faiss.deserialize_index(faiss.serialize_index(vector_store.index)), mmapped=False)
+        ann_index.apply_default_search_params(vector_store.index)
+
+
+def _lookup_documents(doc_ids: list[str]) -> dict[str, Document]:
+    """Fetches several documents from the loaded docstore by id."""
+    docstore = vector_store.docstore
+    if isinstance(docstore, chunk_store.ChunkStore):
+        return docstore.search_many(doc_ids)
+    found = {}
+    for doc_id in doc_ids:
+        doc = docstore.search(doc_id)
+        if isinstance(doc, Document):
+            found[doc_id] = doc
+    return found
+
+
+def _documents_at_positions(positions, docstore=None, mapping=None) -> dict[int, Document]:
+    """Fetches the documents at several index positions (read straight from the ChunkStore columns).
+
+    `docstore`/`mapping` default to the live store; searches pass the ones they captured.
+    """
+    docstore = docstore if docstore is not None else vector_store.docstore
+    mapping = mapping if mapping is not None else vector_store.index_to_docstore_id
+    if isinstance(docstore, chunk_store.ChunkStore):
+        return docstore.get_by_positions(positions)
+    doc_ids = {int(p): mapping.get(int(p)) for p in positions}
+    docs = _lookup_documents([doc_id for doc_id in doc_ids.values() if doc_id is not None])
+    return {position: docs[doc_id] for position, doc_id in doc_ids.items() if doc_id in docs}
+
+
+def _search_selector(sources: list[str] | None) -> tuple[faiss.IDSelector | None, int]:
+    """FAISS IDSelector restricting a search to the chunks of `sources` and skipping deleted chunks.
+
+    Returns:
+        tuple: (selector, number of searchable positions). The selector is None when every
+        position in the index is searchable (no filtering needed).
+    """
+    ntotal = vector_store.index.ntotal
+    if sources:
+        positions = chunk_store.positions_for_sources(vector_store.docstore, vector_store.index_to_docstore_id, sources)
+        if len(positions) == 0 or len(positions) >= ntotal:
+            return None, len(positions)
+        if positions[-1] - positions[0] + 1 == len(positions):
+            # A single file added in one go occupies one contiguous range
+            return faiss.IDSelectorRange(int(positions[0]), int(positions[-1]) + 1), len(positions)
+        return faiss.IDSelectorBatch(positions), len(positions)
+    if not _tombstones:
+        return None, ntotal
+    deleted = faiss.IDSelectorBatch(np.fromiter(_tombstones, dtype=np.int64, count=len(_tombstones)))
+    selector = faiss.IDSelectorNot(deleted)
+    selector.referenced_objects = [deleted] # IDSelectorNot does not own the wrapped selector
+    return selector, ntotal - len(_tombstones)
+
+
+def _known_doc_ids(ids: list[str]) -> set[str]:
+    """Subset of `ids` present in the loaded docstore."""
+    docstore = vector_store.docstore
+    if isinstance(docstore, chunk_store.ChunkStore):
+        return docstore.existing_ids(ids)
+    return {doc_id for doc_id in ids if doc_id in getattr(docstore, '_dict', {})}
+
+
+def _fsync_path(path: str):
+    """fsyncs a file or directory (directories are skipped where the OS does not support it)."""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _repair_snapshot_consistency():
+    """Trims the loaded index and docstore mapping to their common prefix.
+
+    Snapshots written without a commit marker (older versions renamed index.faiss and the
+    docstore separately) can pair an index with more or fewer vectors than the docstore maps
+    after a crash. The excess is dropped here and restored by the write-ahead log replay.
+    """
+    mapped = len(vector_store.index_to_docstore_id)
+    if vector_store.index.ntotal != mapped:
+        _ensure_writable_index()
+    index = vector_store.index
+    if index.ntotal > mapped:
+        logger.warning(f"FAISS index has {index.ntotal} vectors but docstore maps {mapped}. Dropping the unmapped tail (will be replayed from the write-ahead log).")
+        if ann_index.index_type_of(index) == 'HNSW':
+            # HNSW does not support removal; rebuild from the mapped prefix
+            _set_index(ann_index.train_and_fill('HNSW', ann_index.reconstruct_all(index, mapped), index.metric_type), mmapped=False)
+        else:
+            index.remove_ids(np.arange(mapped, index.ntotal, dtype=np.int64))
+    elif index.ntotal < mapped:
+        logger.warning(f"FAISS docstore maps {mapped} vectors but index has {index.ntotal}. Dropping the unbacked mappings (will be replayed from the write-ahead log).")
+        orphaned = [vector_store.index_to_docstore_id.pop(i) for i in range(index.ntotal, mapped)]
+        vector_store.docstore.delete(orphaned)
+
+
+def _load_bm25_index():
+    """Opens the sparse index of the loaded snapshot, or builds it from the docstore if it is
+    missing or does not match the index (first run with hybrid search, or after a repair)."""
+    global bm25_index
+    if not RAG_HYBRID_ENABLED:
+        return
+    ntotal = vector_store.index.ntotal
+    sparse_path = os.path.join(FAISS_FOLDER, sparse_index.SPARSE_FILENAME)
+    if os.path.exists(sparse_path):
+        try:
+            bm25_index = sparse_index.BM25Index(sparse_path)
+            if bm25_index.count == ntotal:
+                return
+            logger.warning(f"Sparse index covers {bm25_index.count} chunks but the FAISS index has {ntotal}. Rebuilding it.")
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not open the sparse index {sparse_path} ({e}). Rebuilding it.")
+    started_at = time.perf_counter()
+    bm25_index = sparse_index.BM25Index()
+    texts = (doc.page_content for _, _, doc in chunk_store._iter_store_documents(vector_store.docstore, vector_store.index_to_docstore_id, ntotal))
+    bm25_index.add(0, texts)
+    logger.info(f"Built the BM25 sparse index for {ntotal} chunks in {time.perf_counter() - started_at:.2f}s (saved with the next snapshot).")
+
+
+def _bump_index_generation():
+    """Marks the indexed chunks as changed, after the change (invalidates answer_cache)."""
+    global _index_generation
+    with _search_view_lock:
+        _index_generation += 1
+
+
+def _apply_embeddings(ids: list[str], vectors, documents: list[Document]):
+    """Adds precomputed embeddings to the global index, creating it if needed.
+
+    New vectors are mapped from index.ntotal on. (LangChain's add_embeddings numbers them from
+    len(index_to_docstore_id), which is smaller while deleted vectors await compaction.)
+    """
+    global vector_store, bm25_index
+    if vector_store:
+        _ensure_writable_index()
+        matrix = np.array(vectors, dtype=np.float32) # Copy: normalized in place below
+        if getattr(vector_store, '_normalize_L2', False):
+            faiss.normalize_L2(matrix)
+        start = vector_store.index.ntotal
+        vector_store.index.add(matrix)
+        vector_store.docstore.add({
+            doc_id: Document(id=doc_id, page_content=doc.page_content, metadata=doc.metadata)
+            for doc_id, doc in zip(ids, documents)
+        })
+        vector_store.index_to_docstore_id.update({start + j: doc_id for j, doc_id in enumerate(ids)})
+    else:
+        text_embeddings = list(zip((doc.page_content for doc in documents), vectors))
+        metadatas = [doc.metadata for doc in documents]
+        vector_store = FAISS.from_embeddings(text_embeddings, embeddings, metadatas=metadatas, ids=ids)
+        _set_index(vector_store.index, mmapped=False)
+        start = 0
+        bm25_index = sparse_index.BM25Index() if RAG_HYBRID_ENABLED else None
+    if bm25_index is not None:
+        bm25_index.add(start, (doc.page_content for doc in documents))
+    _bump_index_generation()
+
+
+def _replay_write_ahead_log() -> int:
+    """Re-applies logged adds and deletes on top of the loaded snapshot.
+
+    Replay is idempotent: adds whose docstore ids are already present and deletes of ids that
+    are already gone (e.g. the log was not yet truncated when a compaction finished) are skipped.
+
+    Returns:
+        int: Number of vectors replayed (added or deleted).
+    """
+    replayed = 0
+    records = 0
+    for record in vector_wal.iter_records():
+        records += 1
+        if record['op'] == vector_wal.OP_DELETE:
+            if vector_store:
+                positions = chunk_store.positions_for_ids(vector_store.docstore, vector_store.index_to_docstore_id, record['ids'])
+                replayed += len(_delete_positions(sorted(positions.values())))
+            continue
+        known_ids = _known_doc_ids(record['ids']) if vector_store else set()
+        missing = [i for i, doc_id in enumerate(record['ids']) if doc_id not in known_ids]
+        if not missing:
+            continue
+        ids = [record['ids'][i] for i in missing]
+        _apply_embeddings(ids, record['vectors'][missing], [record['documents'][i] for i in missing])
+        replayed += len(ids)
+    if records:
+        logger.info(f"Replayed {replayed} vectors from {records} FAISS write-ahead log record(s).")
+    return replayed
+
+
 def save_vector_store() -> bool:
-    """Saves the current global `vector_store` (FAISS index) to disk.
+    """Saves a full snapshot of the global `vector_store` (FAISS index) to disk.
+
+    The snapshot is index.faiss plus chunks.bin (chunk text/metadata by index position) and,
+    when RAG_HYBRID_ENABLED, sparse.bin (BM25 index over the same positions).
+    Deleted chunks (tombstones) are left out, so positions are renumbered in that case.
+    Files are written to a temporary folder and atomically renamed into place, after which
+    the write-ahead log is emptied since the snapshot now contains its records. The live
+    store then switches to the new files: a lazily read docstore and, when
+    FAISS_MMAP_ENABLED, a memory-mapped index.
 
     Returns:
         bool: True if saving was successful, False otherwise (or if store is None).
     """
-    global vector_store
+    global vector_store, bm25_index
     if not vector_store:
         logger.warning("Attempted to save vector store, but it's not loaded or initialized.")
         return False
@@ -157,108 +554,276 @@ def save_vector_store() -> bool:
             logger.error(f"Failed to create FAISS store directory {FAISS_FOLDER}: {e}", exc_info=True)
             return False
 
-    try:
-        index_size = getattr(getattr(vector_store, 'index', None), 'ntotal', 0)
-        logger.info(f"Saving FAISS index ({index_size} vectors) to {FAISS_FOLDER}...")
-        vector_store.save_local(FAISS_FOLDER)
-        logger.info(f"FAISS index saved successfully.")
-        return True
-    except Exception as e:
-        logger.error(f"Error saving FAISS index to {FAISS_FOLDER}: {e}", exc_info=True)
-        return False
+    with vector_store_write_lock:
+        tmp_folder = os.path.join(FAISS_FOLDER, _SNAPSHOT_TMP_FOLDER)
+        index_path = os.path.join(FAISS_FOLDER, "index.faiss")
+        chunks_path = os.path.join(FAISS_FOLDER, chunk_store.CHUNKS_FILENAME)
+        try:
+            index = vector_store.index
+            live_positions = None
+            if _tombstones:
+                # Drop deleted chunks: the new snapshot holds only live vectors, renumbered in order
+                live_positions = np.setdiff1d(np.arange(index.ntotal, dtype=np.int64),
+                                              np.fromiter(_tombstones, dtype=np.int64, count=len(_tombstones)))
+                logger.info(f"Dropping {len(_tombstones)} deleted vectors from the FAISS index...")
+                live_vectors = _exact_store_vectors()[live_positions] # Promotes a memory-mapped IVF index first
+                index = ann_index.refill_index(vector_store.index, live_vectors)
+            index_size = index.ntotal
+            logger.info(f"Saving FAISS index ({index_size} vectors) to {FAISS_FOLDER}...")
+            shutil.rmtree(tmp_folder, ignore_errors=True)
+            os.makedirs(tmp_folder)
+            tmp_index_path = os.path.join(tmp_folder, "index.faiss")
+            tmp_chunks_path = os.path.join(tmp_folder, chunk_store.CHUNKS_FILENAME)
+            faiss.write_index(index, tmp_index_path)
+            _fsync_path(tmp_index_path)
+            chunk_store.write_snapshot(tmp_chunks_path, vector_store.docstore, vector_store.index_to_docstore_id, index_size, positions=live_positions)
+            if bm25_index is not None:
+                bm25_index.write_snapshot(os.path.join(tmp_folder, sparse_index.SPARSE_FILENAME), positions=live_positions)
+            # Both files are complete: commit, then swap (load_vector_store finishes an interrupted swap)
+            with open(os.path.join(tmp_folder, _SNAPSHOT_COMMIT_MARKER), 'wb') as marker:
+                os.fsync(marker.fileno())
+            _fsync_path(tmp_folder)
+            _install_snapshot_files(tmp_folder)
+            vector_wal.reset()
+
+            docstore = chunk_store.ChunkStore(chunks_path)
+            with _search_view_lock: # Positions may be renumbered: swap index, docstore and tombstones together
+                vector_store.docstore = docstore
+                vector_store.index_to_docstore_id = docstore.index_map
+                if index is not vector_store.index:
+                    _set_index(index, mmapped=False)
+                _tombstones.clear()
+                if bm25_index is not None:
+                    bm25_index = sparse_index.BM25Index(os.path.join(FAISS_FOLDER, sparse_index.SPARSE_FILENAME))
+                if FAISS_MMAP_ENABLED:
+                    _read_index_file(index_path)
+                ann_index.apply_default_search_params(vector_store.index)
+            logger.info(f"FAISS index saved successfully.")
+            return True
+        except Exception as e:
+            logger.error(f"Error saving FAISS index to {FAISS_FOLDER}: {e}", exc_info=True)
+            return False
+        finally:
+            shutil.rmtree(tmp_folder, ignore_errors=True)
+
+
+def compact_vector_store() -> bool:
+    """Folds the write-ahead log into a new on-disk snapshot, dropping deleted vectors."""
+    wal_bytes = vector_wal.wal_size()
+    tombstones = len(_tombstones)
+    started_at = time.perf_counter()
+    success = save_vector_store()
+    if success:
+        logger.info(f"Compacted FAISS write-ahead log ({wal_bytes / (1024 * 1024):.1f} MB, {tombstones} deleted vectors) into a new snapshot in {time.perf_counter() - started_at:.2f}s.")
+    return success
+
+
+def _maybe_schedule_compaction():
+    """Starts a background compaction once the write-ahead log exceeds FAISS_WAL_COMPACT_MB
+    or deleted vectors exceed FAISS_TOMBSTONE_COMPACT_RATIO of the index."""
+    global _compaction_thread
+    ntotal = getattr(getattr(vector_store, 'index', None), 'ntotal', 0)
+    wal_full = vector_wal.wal_size() >= FAISS_WAL_COMPACT_MB * 1024 * 1024
+    tombstones_full = bool(_tombstones) and len(_tombstones) >= FAISS_TOMBSTONE_COMPACT_RATIO * max(ntotal, 1)
+    if not (wal_full or tombstones_full):
+        return
+    if _compaction_thread and _compaction_thread.is_alive():
+        return
+    _compaction_thread = threading.Thread(target=compact_vector_store, name="faiss-compact", daemon=True)
+    _compaction_thread.start()
+
+
+def _exact_store_vectors() -> np.ndarray:
+    """Returns all stored vectors in index order, as exact as available.
+
+    Lossless indexes are reconstructed directly. For IVF-PQ the quantized reconstruction is
+    replaced by the original embeddings from the embedding cache wherever they are cached.
+    """
+    if ann_index.index_type_of(vector_store.index) in ('IVFFlat', 'IVFPQ'):
+        _ensure_writable_index() # Reconstruction adds a direct map to IVF indexes
+    index = vector_store.index
+    vectors = ann_index.reconstruct_all(index)
+    if ann_index.is_lossless(index):
+        return vectors
+    model = getattr(embeddings, 'model', None) or OLLAMA_EMBED_MODEL
+    doc_ids = [vector_store.index_to_docstore_id.get(position) for position in range(index.ntotal)]
+    docs = _lookup_documents([doc_id for doc_id in doc_ids if doc_id is not None])
+    hashes = [embedding_cache.text_hash(docs[doc_id].page_content) if doc_id in docs else None for doc_id in doc_ids]
+    cached = embedding_cache.get_store(model).get_many([h for h in hashes if h])
+    restored = 0
+    for position, h in enumerate(hashes):
+        if h in cached:
+            vectors[position] = cached[h]
+            restored += 1
+    if getattr(vector_store, '_normalize_L2', False):
+        faiss.normalize_L2(vectors)
+    if restored < index.ntotal:
+        logger.warning(f"Only {restored}/{index.ntotal} exact vectors found in the embedding cache; using quantized reconstructions for the rest.")
+    return vectors
+
+
+def rebuild_ann_index(index_type: str = FAISS_INDEX_TYPE, force: bool = False) -> bool:
+    """Converts the loaded index to `index_type` (training it if needed) and saves a snapshot.
+
+    Stores smaller than FAISS_ANN_MIN_VECTORS keep their current index unless `force` is set.
+    Vector positions are preserved, so the docstore mapping stays valid.
+
+    Returns:
+        bool: True if the index already matched, was too small to convert, or was rebuilt and saved.
+    """
+    global vector_store
+    with vector_store_write_lock:
+        if not vector_store:
+            logger.warning("No vector store loaded; nothing to rebuild.")
+            return False
+        try:
+            target = ann_index.normalize_index_type(index_type)
+        except ValueError as e:
+            logger.error(str(e))
+            return False
+        index = vector_store.index
+        current = ann_index.index_type_of(index)
+        if current == target and not force:
+            logger.info(f"FAISS index is already {target} ({index.ntotal} vectors).")
+            return True
+        if target != 'Flat' and index.ntotal < FAISS_ANN_MIN_VECTORS and not force:
+            logger.info(f"Keeping {current} index: {index.ntotal} vectors is below FAISS_ANN_MIN_VECTORS={FAISS_ANN_MIN_VECTORS}.")
+            return True
+        was_mmapped = _index_is_mmapped
+        try:
+            logger.info(f"Rebuilding FAISS index: {current} -> {target} ({index.ntotal} vectors)...")
+            _set_index(ann_index.train_and_fill(target, _exact_store_vectors(), index.metric_type), mmapped=False)
+        except Exception as e:
+            logger.error(f"Failed to rebuild FAISS index as {target}: {e}", exc_info=True)
+            _set_index(index, mmapped=was_mmapped)
+            return False
+        return save_vector_store()
+
+
+def ann_recall_report(num_queries: int = 200, k: int = 10) -> list[dict]:
+    """Recall@k and latency of the loaded index across nprobe/efSearch values vs. exact search."""
+    if not vector_store:
+        return []
+    return ann_index.recall_latency_report(vector_store.index, _exact_store_vectors(), num_queries=num_queries, k=k)
 
 
-def load_all_document_texts():
-    """Loads text from all PDFs found in default and upload folders into the global cache.
+def _find_document_path(filename: str) -> str | None:
+    """Returns the path of a PDF in the upload folder (preferred) or the default folder."""
+    potential_paths = [
+        os.path.join(UPLOAD_FOLDER, filename),
+        os.path.join(DEFAULT_PDFS_FOLDER, filename)
+    ]
+    return next((p for p in potential_paths if os.path.exists(p)), None)
+
+
+def _load_document_text_for_cache(filename: str) -> str | None:
+    """Cache loader: reads a document's text from the text store (extracting if new/changed)."""
+    load_path = _find_document_path(filename)
+    if not load_path:
+        return None
+    logger.debug(f"Lazily loading text for '{filename}' from {load_path}.")
+    return get_document_text(load_path)
 
-    Used by the analysis endpoint to avoid re-extraction.
+
+def get_cached_document_text(filename: str) -> str | None:
+    """Returns a document's text from the bounded in-memory cache, filling it lazily from disk.
+
+    Args:
+        filename (str): The PDF filename (as listed by /documents).
+
+    Returns:
+        str | None: The document text, or None if the file is missing or unreadable.
     """
-    global document_texts_cache
-    logger.info("Loading/refreshing document texts cache for analysis...")
-    document_texts_cache = {} # Reset cache before loading
-    loaded_count = 0
-    processed_files = set()
+    return document_texts_cache.get_or_load(filename, _load_document_text_for_cache)
 
-    def _load_from_folder(folder_path):
-        nonlocal loaded_count
-        count = 0
+
+def prime_document_text_store() -> int:
+    """Ensures every PDF in the default and upload folders has its text in the persistent store.
+
+    Texts are not held in memory; `document_texts_cache` fills lazily on demand.
+
+    Returns:
+        int: Number of documents whose text is available in the store.
+    """
+    logger.info("Priming document text store (extracting new/changed PDFs only)...")
+    stored_count = 0
+    for folder_path in (DEFAULT_PDFS_FOLDER, UPLOAD_FOLDER):
         if not os.path.exists(folder_path):
             logger.warning(f"Document text folder not found: {folder_path}. Skipping.")
-            return count
+            continue
         try:
             for filename in os.listdir(folder_path):
-                if filename.lower().endswith('.pdf') and not filename.startswith('~') and filename not in processed_files:
-                    file_path = os.path.join(folder_path, filename)
-                    # logger.debug(f"Extracting text from {filename} for cache...")
-                    text = extract_text_from_pdf(file_path)
-                    if text:
-                        document_texts_cache[filename] = text
-                        processed_files.add(filename)
-                        count += 1
+                if filename.lower().endswith('.pdf') and not filename.startswith('~'):
+                    if get_document_text(os.path.join(folder_path, filename)):
+                        stored_count += 1
                     else:
-                        logger.warning(f"Could not extract text from {filename} in {folder_path} for cache.")
-            logger.info(f"Cached text for {count} PDFs from {folder_path}.")
-            loaded_count += count
+                        logger.warning(f"Could not extract text from {filename} in {folder_path} for the text store.")
         except Exception as e:
-            logger.error(f"Error listing or processing files in {folder_path} for cache: {e}", exc_info=True)
-        return count
-
-    # Load defaults first, then uploads (uploads overwrite defaults if names collide in cache)
-    _load_from_folder(DEFAULT_PDFS_FOLDER)
-    _load_from_folder(UPLOAD_FOLDER)
+            logger.error(f"Error listing or processing files in {folder_path} for the text store: {e}", exc_info=True)
 
-    logger.info(f"Finished loading texts cache. Total unique documents cached: {len(document_texts_cache)}")
+    logger.info(f"Text store primed. {stored_count} documents available for analysis.")
+    return stored_count
 
 
 # --- PDF Processing Functions ---
 
-def extract_text_from_pdf(pdf_path: str) -> str | None:
-    """Extracts text from a single PDF file using PyMuPDF (fitz).
+def extract_text_with_offsets(pdf_path: str) -> tuple[str | None, list[int]]:
+    """Extracts text from a single PDF file along with the start offset of every page.
+
+    Large PDFs are split into page ranges and extracted in parallel (see pdf_extract.py).
 
     Args:
         pdf_path (str): The full path to the PDF file.
 
     Returns:
-        str | None: The extracted text content, or None if an error occurred.
+        tuple[str | None, list[int]]: (text, page_offsets). text is None if an error occurred or
+                                      nothing was extracted; page_offsets[i] is the character offset
+                                      where page i starts within text.
     """
-    text = ""
     if not os.path.exists(pdf_path):
         logger.error(f"PDF file not found for extraction: {pdf_path}")
-        return None
+        return None, []
     try:
-        doc = fitz.open(pdf_path)
-        num_pages = len(doc)
-        logger.debug(f"Starting text extraction from {os.path.basename(pdf_path)} ({num_pages} pages)...")
-        for page_num in range(num_pages):
-            try:
-                page = doc.load_page(page_num)
-                # Use "text" with sort=True for reading order. flags=0 is default.
-                page_text = page.get_text("text", sort=True, flags=0).strip()
-
-                # Basic cleaning: Replace multiple whitespace chars with single space, keep single newlines.
-                page_text = re.sub(r'[ \t\f\v]+', ' ', page_text) # Replace horizontal whitespace with single space
-                page_text = re.sub(r'\n+', '\n', page_text) # Keep single newlines, collapse multiples
-
-                if page_text:
-                    text += page_text + "\n\n" # Add double newline as separator between pages
-            except Exception as page_err:
-                logger.warning(f"Error processing page {page_num+1} of {os.path.basename(pdf_path)}: {page_err}")
-                continue # Skip problematic page
-
-        doc.close()
-        cleaned_text = text.strip()
+        page_texts = pdf_extract.extract_pdf_pages(pdf_path)
+        if page_texts is None:
+            return None, [] # Already logged (unreadable or password-protected)
+
+        cleaned_text, page_offsets = pdf_extract.join_pages(page_texts)
         if cleaned_text:
-            logger.info(f"Successfully extracted text from {os.path.basename(pdf_path)} (approx {len(cleaned_text)} chars).")
-            return cleaned_text
+            logger.info(f"Successfully extracted text from {os.path.basename(pdf_path)} (approx {len(cleaned_text)} chars, {len(page_texts)} pages).")
+            return cleaned_text, page_offsets
         else:
             logger.warning(f"Extracted text was empty for {os.path.basename(pdf_path)}.")
-            return None
-    except fitz.fitz.PasswordError:
-        logger.error(f"Error extracting text from PDF {os.path.basename(pdf_path)}: File is password-protected.")
-        return None
+            return None, []
     except Exception as e:
         logger.error(f"Error extracting text from PDF {os.path.basename(pdf_path)}: {e}", exc_info=True)
+        return None, []
+
+def extract_text_from_pdf(pdf_path: str) -> str | None:
+    """Extracts text from a single PDF file using PyMuPDF (fitz).
+
+    Args:
+        pdf_path (str): The full path to the PDF file.
+
+    Returns:
+        str | None: The extracted text content, or None if an error occurred.
+    """
+    text, _ = extract_text_with_offsets(pdf_path)
+    return text
+
+def get_document_text(pdf_path: str) -> str | None:
+    """Returns the text of a PDF via the persistent text store, extracting only new or changed files.
+
+    Args:
+        pdf_path (str): The full path to the PDF file.
+
+    Returns:
+        str | None: The document text, or None if it could not be extracted.
+    """
+    if not os.path.exists(pdf_path):
+        logger.error(f"PDF file not found: {pdf_path}")
         return None
+    return text_store.get_or_extract(pdf_path, extract_text_with_offsets)
 
 def create_chunks_from_text(text: str, filename: str) -> list[Document]:
     """Splits text into chunks using RecursiveCharacterTextSplitter and creates LangChain Documents.
@@ -296,12 +861,20 @@ def create_chunks_from_text(text: str, filename: str) -> list[Document]:
         logger.error(f"Error creating chunks for '{filename}': {e}", exc_info=True)
         return []
 
-def add_documents_to_vector_store(documents: list[Document]) -> bool:
+def add_documents_to_vector_store(documents: list[Document], progress_callback=None) -> bool:
     """Adds LangChain Documents to the global FAISS index.
     Creates the index if it doesn't exist. Saves the index afterwards.
 
+    Chunks are embedded through the batched, concurrent embedding pipeline and fed to
+    FAISS batch by batch as results arrive. Writers are serialized by `vector_store_write_lock`.
+
+    Once a snapshot exists on disk, each batch is appended to the write-ahead log instead of
+    rewriting the whole index; the log is compacted in the background when it grows large.
+
     Args:
         documents (list[Document]): The list of documents to add.
+        progress_callback (Callable[[int, int], None] | None): Optional; called with
+            (embedded_count, total) after each embedded batch.
 
     Returns:
         bool: True if documents were added and the index saved successfully, False otherwise.
@@ -314,31 +887,146 @@ def add_documents_to_vector_store(documents: list[Document]) -> bool:
         logger.error("Embeddings not initialized. Cannot add documents to vector store.")
         return False
 
-    try:
-        if vector_store:
-            logger.info(f"Adding {len(documents)} document chunks to existing FAISS index...")
-            vector_store.add_documents(documents)
-            index_size = getattr(getattr(vector_store, 'index', None), 'ntotal', 0)
-            logger.info(f"Addition complete. Index now contains {index_size} vectors.")
-        else:
-            logger.info(f"No FAISS index loaded. Creating new index from {len(documents)} document chunks...")
-            vector_store = FAISS.from_documents(documents, embeddings)
+    with vector_store_write_lock:
+        try:
+            if vector_store:
+                logger.info(f"Adding {len(documents)} document chunks to existing FAISS index...")
+            else:
+                logger.info(f"No FAISS index loaded. Creating new index from {len(documents)} document chunks...")
+
+            use_wal = FAISS_WAL_ENABLED and vector_store is not None and _snapshot_exists()
+            texts = [doc.page_content for doc in documents]
+            for start, vectors in embedding_pipeline.iter_embedded_batches(embeddings, texts, progress_callback=progress_callback):
+                batch_docs = documents[start:start + len(vectors)]
+                batch_ids = [str(uuid.uuid4()) for _ in batch_docs]
+                if use_wal:
+                    vector_wal.append_record(batch_ids, vectors, batch_docs) # Log first, then apply
+                _apply_embeddings(batch_ids, vectors, batch_docs)
+
             index_size = getattr(getattr(vector_store, 'index', None), 'ntotal', 0)
             if vector_store and index_size > 0:
-                logger.info(f"New FAISS index created with {index_size} vectors.")
+                logger.info(f"Addition complete. Index now contains {index_size} vectors.")
             else:
                 logger.error("Failed to create new FAISS index or index is empty after creation.")
                 vector_store = None # Ensure it's None if creation failed
                 return False
 
-        # IMPORTANT: Persist the updated index
-        return save_vector_store()
+            # IMPORTANT: Persist the updated index
+            if use_wal:
+                logger.info(f"Persisted {len(documents)} vectors to the FAISS write-ahead log ({vector_wal.wal_size() / (1024 * 1024):.1f} MB pending compaction).")
+                _maybe_schedule_compaction()
+                return True
+            return save_vector_store()
+
+        except Exception as e:
+            logger.error(f"Error adding documents to FAISS index or saving: {e}", exc_info=True)
+            # Consider state: if vector_store existed before, it might be partially updated in memory.
+            # Saving failed, so on next load, it should revert unless error was in 'from_documents'.
+            return False
 
-    except Exception as e:
-        logger.error(f"Error adding documents to FAISS index or saving: {e}", exc_info=True)
-        # Consider state: if vector_store existed before, it might be partially updated in memory.
-        # Saving failed, so on next load, it should revert unless error was in 'from_documents'.
-        return False
+
+def pending_deletion_count() -> int:
+    """Number of deleted vectors still in the index, awaiting compaction."""
+    return len(_tombstones)
+
+
+def _delete_positions(positions) -> list[str]:
+    """Unmaps the chunks at `positions` and removes them from the docstore.
+
+    Their vectors stay in the index as tombstones, excluded from searches, until the next
+    compaction rebuilds the index without them (this works for every index type, including
+    HNSW, which cannot remove vectors).
+
+    Returns:
+        list[str]: The deleted docstore ids.
+    """
+    global _index_generation
+    mapping = vector_store.index_to_docstore_id
+    doc_ids = []
+    with _search_view_lock:
+        for position in positions:
+            doc_id = mapping.pop(int(position), None)
+            if doc_id is not None:
+                doc_ids.append(doc_id)
+                _tombstones.add(int(position))
+        if doc_ids:
+            vector_store.docstore.delete(doc_ids)
+        _index_generation += 1
+    return doc_ids
+
+
+def _delete_chunks(positions) -> bool:
+    """Deletes the chunks at `positions` and persists the deletion (write-ahead log or snapshot)."""
+    mapping = vector_store.index_to_docstore_id
+    doc_ids = [mapping[int(position)] for position in positions]
+    use_wal = FAISS_WAL_ENABLED and _snapshot_exists()
+    if use_wal:
+        vector_wal.append_delete_record(doc_ids) # Log first, then apply
+    _delete_positions(positions)
+    if use_wal:
+        _maybe_schedule_compaction()
+        return True
+    return save_vector_store()
+
+
+def indexed_sources() -> set[str]:
+    """Filenames that have chunks in the loaded vector store."""
+    vs = vector_store
+    if vs is None:
+        return set()
+    if isinstance(vs.docstore, chunk_store.ChunkStore):
+        return vs.docstore.sources()
+    return {doc.metadata.get('source') for doc in getattr(vs.docstore, '_dict', {}).values()} - {None}
+
+
+def delete_source_documents(source: str) -> int | None:
+    """Removes all chunks of the document `source` from the vector store.
+
+    Returns:
+        int | None: Number of chunks deleted (0 if the document is not indexed), or None on failure.
+    """
+    with vector_store_write_lock:
+        if not vector_store:
+            return 0
+        try:
+            positions = chunk_store.positions_for_sources(vector_store.docstore, vector_store.index_to_docstore_id, [source])
+            if len(positions) == 0:
+                logger.info(f"No chunks of '{source}' in the FAISS index; nothing to delete.")
+                return 0
+            if not _delete_chunks(positions):
+                return None
+            logger.info(f"Deleted {len(positions)} chunks of '{source}' ({len(_tombstones)} deleted vectors pending compaction).")
+            return len(positions)
+        except Exception as e:
+            logger.error(f"Error deleting chunks of '{source}' from the FAISS index: {e}", exc_info=True)
+            return None
+
+
+def replace_source_documents(source: str, documents: list[Document], progress_callback=None) -> bool:
+    """Indexes `documents` for `source`, replacing chunks previously indexed for it.
+
+    The new chunks are added first and the old ones deleted afterwards, so the document stays
+    searchable throughout and is left unchanged if adding fails.
+
+    Returns:
+        bool: True if the new chunks were added and the old ones removed.
+    """
+    with vector_store_write_lock:
+        stale_positions = []
+        if vector_store:
+            stale_positions = chunk_store.positions_for_sources(vector_store.docstore, vector_store.index_to_docstore_id, [source])
+        if not add_documents_to_vector_store(documents, progress_callback=progress_callback):
+            return False
+        if len(stale_positions) == 0:
+            return True
+        try:
+            if not _delete_chunks(stale_positions):
+                return False
+            logger.info(f"Replaced {len(stale_positions)} previously indexed chunks of '{source}' with {len(documents)} new chunks.")
+            return True
+        except Exception as e:
+            logger.error(f"Error removing previously indexed chunks of '{source}': {e}", exc_info=True)
+            return False
 
 # --- RAG and LLM Interaction ---
 
@@ -365,7 +1053,8 @@ def generate_sub_queries(query: str) -> list[str]:
         prompt_to_log = SUB_QUERY_PROMPT_TEMPLATE.format(query=query, num_queries=MULTI_QUERY_COUNT)
         logger.debug(f"Sub-query Prompt (Start):\n{prompt_to_log[:150]}...") # DEBUG level might be better
 
-        response = chain.invoke({"query": query, "num_queries": MULTI_QUERY_COUNT})
+        with ollama_gateway.slot(ollama_gateway.CHAT):
+            response = chain.invoke({"query": query, "num_queries": MULTI_QUERY_COUNT})
         # Response structure might vary; often {'text': 'query1\nquery2'}
         raw_response_text = response.get('text', '') if isinstance(response, dict) else str(response)
 
@@ -392,9 +1081,286 @@ def generate_sub_queries(query: str) -> list[str]:
         return [query] # Fallback
 # --- END MODIFICATION ---
 
-def perform_rag_search(query: str) -> tuple[list[Document], str, dict[int, dict]]:
+def embed_queries(queries: list[str]) -> np.ndarray:
+    """Embeds search queries as one float32 matrix, using the query-embedding LRU.
+
+    All cache misses are embedded in a single batched request to the embedding server.
+
+    Args:
+        queries (list[str]): The search queries.
+
+    Returns:
+        np.ndarray: Matrix of shape (len(queries), dim), one row per query.
+    """
+    global embeddings
+    model_name = getattr(embeddings, 'model', None) or OLLAMA_EMBED_MODEL
+    keys = [(model_name, " ".join(q.split())) for q in queries]
+    vectors = {key: query_embedding_cache.get(key) for key in dict.fromkeys(keys)}
+    missing = [key for key, vec in vectors.items() if vec is None]
+
+    if missing:
+        logger.debug(f"Embedding {len(missing)} of {len(vectors)} unique queries in one batch ({len(vectors) - len(missing)} cached).")
+        with ollama_gateway.slot(ollama_gateway.CHAT):
+            new_vectors = np.asarray(embeddings.embed_documents([key[1] for key in missing]), dtype=np.float32)
+        for key, vec in zip(missing, new_vectors):
+            query_embedding_cache.put(key, vec)
+            vectors[key] = vec
+    else:
+        logger.debug(f"All {len(vectors)} query embeddings served from cache.")
+
+    return np.stack([vectors[key] for key in keys])
+
+
+def _record_hit_vectors(vectors: dict | None, index: faiss.Index, docs: dict[int, Document]):
+    """Adds the indexed vector of each hit to `vectors` (keyed by _chunk_key), for MMR reranking.
+
+    Vectors are read from the index snapshot that was searched, so positions match it and
+    nothing is sent back to the embedding model.
+    """
+    if vectors is None or not docs:
+        return
+    positions = sorted(docs)
+    if ann_index.needs_direct_map(index):
+        with vector_store_write_lock: # Building the IVF direct map must not race an add
+            matrix = ann_index.reconstruct_positions(index, positions)
+    else:
+        matrix = ann_index.reconstruct_positions(index, positions)
+    for position, row in zip(positions, matrix):
+        vectors.setdefault(_chunk_key(docs[position]), row)
+
+
+def batched_similarity_search(queries: list[str], k: int, nprobe: int | None = None, ef_search: int | None = None,
+                              sources: list[str] | None = None, vectors: dict | None = None) -> list[list[tuple[Document, float]]]:
+    """Runs a similarity search for several queries with one embed call and one index.search.
+
+    Equivalent to calling `vector_store.similarity_search_with_score(q, k)` per query, but the
+    query vectors are stacked into a matrix and searched in a single batched FAISS call.
+    `nprobe` (IVF) / `ef_search` (HNSW) override the index defaults for this call only.
+    `sources` restricts the search to chunks of those files; the filter is applied inside
+    FAISS (IDSelector), so k results come from the selected files rather than being post-filtered.
+    Deleted chunks awaiting compaction are excluded the same way.
+    If `vectors` is given, the stored vector of every hit is added to it (see _record_hit_vectors).
+
+    Returns:
+        list[list[tuple[Document, float]]]: Per query, (Document, distance) pairs, best first.
+    """
+    global vector_store
+    if not queries:
+        return []
+
+    with _search_view_lock:
+        index = vector_store.index
+        docstore, mapping = vector_store.docstore, vector_store.index_to_docstore_id
+        selector, selected_count = _search_selector(sources)
+    if selected_count == 0:
+        logger.info(f"No indexed chunks belong to the selected sources {sources}." if sources else "All indexed chunks are deleted.")
+        return [[] for _ in queries]
+    if sources:
+        logger.debug(f"Search restricted to {selected_count} chunks from {len(sources)} source(s).")
+
+    query_matrix = embed_queries(queries)
+    if getattr(vector_store, '_normalize_L2', False):
+        query_matrix = query_matrix.copy() # Don't normalize the cached vectors in place
+        faiss.normalize_L2(query_matrix)
+
+    params = ann_index.search_params(index, nprobe=nprobe, ef_search=ef_search, selector=selector)
+    if params is not None:
+        distances, indices = index.search(query_matrix, k, params=params)
+    else:
+        distances, indices = index.search(query_matrix, k)
+
+    # Resolve all hit positions in one docstore lookup
+    docs = _documents_at_positions((int(p) for p in np.unique(indices) if p != -1), docstore, mapping)
+    _record_hit_vectors(vectors, index, docs)
+
+    results = []
+    for row_distances, row_indices in zip(distances, indices):
+        hits = []
+        for distance, position in zip(row_distances, row_indices):
+            if position == -1: # Fewer than k (selected) vectors in the index
+                continue
+            doc = docs.get(int(position))
+            if isinstance(doc, Document):
+                hits.append((doc, float(distance)))
+            else:
+                logger.warning(f"Index position {position} has no matching document in the docstore.")
+        results.append(hits)
+    return results
+
+
+def sparse_similarity_search(queries: list[str], k: int, sources: list[str] | None = None,
+                             vectors: dict | None = None) -> list[list[tuple[Document, float]]]:
+    """BM25 search for several queries over the sparse index (exact terms, identifiers, symbols).
+
+    Deleted chunks are skipped, and `sources` and `vectors` work as in batched_similarity_search.
+
+    Returns:
+        list[list[tuple[Document, float]]]: Per query, (Document, BM25 score) pairs, best first.
+    """
+    with _search_view_lock:
+        sparse = bm25_index
+        if sparse is None or vector_store is None:
+            return [[] for _ in queries]
+        index, docstore, mapping = vector_store.index, vector_store.docstore, vector_store.index_to_docstore_id
+        excluded = np.fromiter(_tombstones, dtype=np.int64, count=len(_tombstones)) if _tombstones else None
+        allowed = chunk_store.positions_for_sources(docstore, mapping, sources) if sources else None
+
+    per_query_hits = [sparse.search(query, k, exclude=excluded, allowed=allowed) for query in queries]
+    docs = _documents_at_positions({position for hits in per_query_hits for position, _ in hits}, docstore, mapping)
+    _record_hit_vectors(vectors, index, docs)
+    return [[(docs[position], score) for position, score in hits if position in docs] for hits in per_query_hits]
+
+
+def _search_and_log(search_queries: list[str], k_per_query: int, sources: list[str] | None = None,
+                    vectors: dict | None = None) -> list[list[tuple[Document, float]]]:
+    """Batched search for several queries (`vectors` collects the hits' stored vectors if given).
+
+    Returns:
+        list[list[tuple[Document, float]]]: One ranking (best first) per query from the dense index
+        and, when RAG_HYBRID_ENABLED, one more per query from the BM25 index.
+    """
+    rankings = []
+    if not search_queries:
+        return rankings
+    try:
+        # One batched embed (with query-embedding cache) and one batched index search for all queries
+        per_query_results = batched_similarity_search(search_queries, k_per_query, sources=sources, vectors=vectors)
+        for q, retrieved in zip(search_queries, per_query_results):
+            # Format: [(Document(page_content=..., metadata=...), score), ...]
+            rankings.append(retrieved)
+            logger.debug(f"Query '{q[:50]}...' retrieved {len(retrieved)} chunks.")
+    except Exception as search_err:
+        logger.error(f"Error during batched similarity search for {len(search_queries)} queries: {search_err}", exc_info=False) # Less verbose log
+    if RAG_HYBRID_ENABLED:
+        try:
+            for q, retrieved in zip(search_queries, sparse_similarity_search(search_queries, RAG_SPARSE_K_PER_QUERY, sources=sources, vectors=vectors)):
+                rankings.append(retrieved)
+                logger.debug(f"Query '{q[:50]}...' matched {len(retrieved)} chunks by BM25.")
+        except Exception as search_err:
+            logger.error(f"Error during BM25 search for {len(search_queries)} queries: {search_err}", exc_info=True)
+    return rankings
+
+
+def _retrieve_candidates(query: str, k_per_query: int, sources: list[str] | None = None,
+                         vectors: dict | None = None) -> list[list[tuple[Document, float]]]:
+    """Retrieves candidate rankings for the query and its LLM-generated sub-queries
+    (`vectors` collects the hits' stored vectors if given, see _record_hit_vectors).
+
+    In pipelined mode (RAG_PIPELINED), sub-query generation runs in the background while the
+    original query is searched immediately. Sub-query results are merged in only if they arrive
+    within RAG_LATENCY_BUDGET_SECONDS; otherwise the context gathered so far is returned.
+    Keyword-style queries (identifiers, part numbers) skip sub-queries when hybrid search is on:
+    the BM25 match on the query itself is what finds them.
+    """
+    if RAG_HYBRID_ENABLED and sparse_index.is_keyword_query(query, RAG_KEYWORD_QUERY_MAX_TERMS):
+        logger.info("Keyword-style query: skipping sub-query generation (dense + BM25 search on the query only).")
+        return _search_and_log([query], k_per_query, sources, vectors)
+    if not RAG_PIPELINED or MULTI_QUERY_COUNT <= 0:
+        search_queries = generate_sub_queries(query)
+        logger.debug(f"Retrieving top {k_per_query} chunks for each of {len(search_queries)} queries.")
+        return _search_and_log(search_queries, k_per_query, sources, vectors)
+
+    started_at = time.perf_counter()
+    sub_query_future = _rag_executor.submit(generate_sub_queries, query)
+
+    # Original query is searched while the LLM is still generating sub-queries
+    retrieved = _search_and_log([query], k_per_query, sources, vectors)
+    logger.debug(f"Original query retrieval finished in {time.perf_counter() - started_at:.2f}s.")
+
+    remaining = RAG_LATENCY_BUDGET_SECONDS - (time.perf_counter() - started_at)
+    try:
+        search_queries = sub_query_future.result(timeout=max(remaining, 0))
+    except FutureTimeoutError:
+        logger.warning(f"Sub-query generation exceeded the RAG latency budget ({RAG_LATENCY_BUDGET_SECONDS}s). Using original-query context only.")
+        return retrieved
+    except Exception as e:
+        logger.error(f"Sub-query generation failed in pipelined retrieval: {e}. Using original-query context only.")
+        return retrieved
+
+    sub_queries = [q for q in search_queries if q != query]
+    retrieved.extend(_search_and_log(sub_queries, k_per_query, sources, vectors))
+    logger.info(f"Pipelined retrieval finished in {time.perf_counter() - started_at:.2f}s ({len(sub_queries)} sub-queries merged).")
+    return retrieved
+
+
+def _chunk_key(doc: Document) -> tuple:
+    """Identity of a chunk across result lists: (source filename, chunk index)."""
+    # Use chunk_index if available, otherwise maybe start_index or hash of content? Chunk_index preferred.
+    return doc.metadata.get('source', 'Unknown'), doc.metadata.get('chunk_index', doc.metadata.get('start_index', -1))
+
+
+def _fuse_rankings(rankings: list[list[tuple[Document, float]]]) -> list[tuple[Document, float]]:
+    """Reciprocal rank fusion: each ranking adds 1 / (RAG_RRF_K + rank) to a chunk's score.
+
+    Only ranks are used, so dense distances and BM25 scores need no common scale.
+
+    Returns:
+        list[tuple[Document, float]]: Unique chunks with their fused score, best first.
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, (doc, _) in enumerate(ranking, start=1):
+            entry = fused.setdefault(_chunk_key(doc), [doc, 0.0])
+            entry[1] += 1.0 / (RAG_RRF_K + rank)
+    return sorted(((doc, score) for doc, score in fused.values()), key=lambda item: item[1], reverse=True)
+
+
+def _rerank_candidates(query: str, candidates: list[tuple[Document, float]], k: int, mode: str,
+                       higher_is_better: bool, vectors: dict | None = None) -> list[tuple[Document, float]]:
+    """Second stage: orders `candidates` by relevance (cross-encoder, or the first-stage score)
+    with an MMR diversity pass (RAG_MMR_LAMBDA), and returns the top k.
+
+    Args:
+        higher_is_better (bool): Whether the first-stage scores are similarities (fused rank
+            scores) rather than distances.
+        vectors (dict | None): _chunk_key -> stored vector of the candidates, collected during
+            retrieval (see _record_hit_vectors). Without a vector for every candidate, MMR is skipped.
+    """
+    docs = [doc for doc, _ in candidates]
+    relevance = None
+    if mode == "cross-encoder":
+        relevance = reranker.cross_encoder_scores(query, [doc.page_content for doc in docs])
+    if relevance is None:
+        first_stage = np.array([score for _, score in candidates], dtype=np.float32)
+        relevance = first_stage if higher_is_better else -first_stage
+    candidate_vectors = [vectors.get(_chunk_key(doc)) for doc in docs] if vectors else []
+    if RAG_MMR_LAMBDA < 1.0 and candidate_vectors and all(vector is not None for vector in candidate_vectors):
+        order = reranker.mmr_order(relevance, np.stack(candidate_vectors), k, RAG_MMR_LAMBDA)
+    else:
+        if RAG_MMR_LAMBDA < 1.0:
+            logger.warning("Stored vectors are missing for some rerank candidates. Ranking by relevance only (no MMR).")
+        order = np.argsort(-relevance, kind='stable')[:k]
+    return [(docs[i], float(relevance[i])) for i in order]
+
+
+def _record_rag_timings(timings: dict):
+    """Logs and stores the per-stage timings of a RAG search."""
+    with _rag_timings_lock:
+        latest_rag_timings.clear()
+        latest_rag_timings.update({stage: round(seconds, 4) for stage, seconds in timings.items()})
+    logger.info("RAG stage timings: " + ", ".join(f"{stage} {seconds * 1000:.1f}ms" for stage, seconds in timings.items()))
+
+
+def get_latest_rag_timings() -> dict:
+    """Returns a copy of the stage timings of the most recent RAG search."""
+    with _rag_timings_lock:
+        return dict(latest_rag_timings)
+
+
+def get_latest_context_stats() -> dict:
+    """Returns a copy of the token usage of the most recent packed RAG context."""
+    with _rag_timings_lock:
+        return dict(latest_context_stats)
+
+
+def perform_rag_search(query: str, sources: list[str] | None = None) -> tuple[list[Document], str, dict[int, dict]]:
     """
     Performs RAG: generates sub-queries, searches vector store, deduplicates, formats context, creates citation map.
+    If `sources` is given, only chunks from those files are searched. With RAG_HYBRID_ENABLED, dense
+    and BM25 results are fused by reciprocal rank before the RAG_CHUNK_K cut. With RAG_RERANK_MODE,
+    a pool of RAG_RERANK_CANDIDATES is reranked (MMR / cross-encoder) before the cut.
+    The selected chunks are packed into at most RAG_CONTEXT_TOKEN_BUDGET tokens (see context_packer).
+    Per-stage timings and the context's token count are logged and kept for /status.
     """
     global vector_store
     context_docs = []
@@ -413,69 +1379,90 @@ def perform_rag_search(query: str) -> tuple[list[Document], str, dict[int, dict]
         logger.warning("RAG search attempted but the vector store index is empty.")
         return context_docs, formatted_context_text, context_docs_map
 
+    timings = {}
+    started_at = stage_started_at = time.perf_counter()
     try:
-        # 1. Generate Sub-Queries
-        search_queries = generate_sub_queries(query)
-
-        # 2. Perform Similarity Search for each query
-        all_retrieved_docs_with_scores = []
+        # 1 + 2. Generate sub-queries and retrieve chunks for all queries
         # Retrieve k docs per query before deduplication
         k_per_query = max(RAG_SEARCH_K_PER_QUERY, 1) # Ensure at least 1
-        logger.debug(f"Retrieving top {k_per_query} chunks for each of {len(search_queries)} queries.")
-
-        for q_idx, q in enumerate(search_queries):
-            try:
-                # Use similarity_search_with_score to get scores for potential ranking/filtering later
-                retrieved = vector_store.similarity_search_with_score(q, k=k_per_query)
-                # Format: [(Document(page_content=..., metadata=...), score), ...]
-                all_retrieved_docs_with_scores.extend(retrieved)
-                logger.debug(f"Query {q_idx+1}/{len(search_queries)} ('{q[:50]}...') retrieved {len(retrieved)} chunks.")
-            except Exception as search_err:
-                logger.error(f"Error during similarity search for query '{q[:50]}...': {search_err}", exc_info=False) # Less verbose log
+        rerank_mode = RAG_RERANK_MODE if RAG_RERANK_MODE in reranker.RERANK_MODES else "none"
+        if rerank_mode != "none":
+            # Size the per-query depth so the deduplicated pool can reach RAG_RERANK_CANDIDATES
+            k_per_query = max(k_per_query, math.ceil(RAG_RERANK_CANDIDATES / (1 + max(MULTI_QUERY_COUNT, 0))))
+        # MMR reads the candidates' vectors from the index while they are retrieved
+        candidate_vectors = {} if rerank_mode != "none" and RAG_MMR_LAMBDA < 1.0 else None
+        rankings = _retrieve_candidates(query, k_per_query, sources, candidate_vectors)
+        all_retrieved_docs_with_scores = [hit for ranking in rankings for hit in ranking]
+        timings["retrieval"] = time.perf_counter() - stage_started_at
+        stage_started_at = time.perf_counter()
 
         if not all_retrieved_docs_with_scores:
             logger.info("No relevant chunks found in vector store for the query/sub-queries.")
             return context_docs, formatted_context_text, context_docs_map
 
         # 3. Deduplicate and Select Top Documents
-        # Key: (source_filename, chunk_index) Value: (Document, score)
-        unique_docs_dict = {}
-        for doc, score in all_retrieved_docs_with_scores:
-            source = doc.metadata.get('source', 'Unknown')
-            # Use chunk_index if available, otherwise maybe start_index or hash of content? Chunk_index preferred.
-            chunk_idx = doc.metadata.get('chunk_index', doc.metadata.get('start_index', -1))
-            doc_key = (source, chunk_idx)
+        if RAG_HYBRID_ENABLED:
+            # Dense and BM25 scores are not comparable; fuse by rank instead
+            sorted_unique_docs = _fuse_rankings(rankings)
+        else:
+            # Key: (source_filename, chunk_index) Value: (Document, score)
+            unique_docs_dict = {}
+            for doc, score in all_retrieved_docs_with_scores:
+                doc_key = _chunk_key(doc)
+
+                # Consider content-based deduplication if metadata isn't reliable enough
+                # content_hash = hash(doc.page_content)
+                # doc_key = (source, content_hash)
 
-            # Consider content-based deduplication if metadata isn't reliable enough
-            # content_hash = hash(doc.page_content)
-            # doc_key = (source, content_hash)
+                if doc_key not in unique_docs_dict or score < unique_docs_dict[doc_key][1]: # Lower score (distance) is better
+                    unique_docs_dict[doc_key] = (doc, score)
 
-            if doc_key not in unique_docs_dict or score < unique_docs_dict[doc_key][1]: # Lower score (distance) is better
-                unique_docs_dict[doc_key] = (doc, score)
+            # Sort unique documents by score (ascending - best first)
+            sorted_unique_docs = sorted(unique_docs_dict.values(), key=lambda item: item[1])
 
-        # Sort unique documents by score (ascending - best first)
-        sorted_unique_docs = sorted(unique_docs_dict.values(), key=lambda item: item[1])
+        timings["fusion"] = time.perf_counter() - stage_started_at
+        stage_started_at = time.perf_counter()
 
-        # Select the final top RAG_CHUNK_K unique documents
+        # Select the final top RAG_CHUNK_K unique documents (reranking a larger pool first if enabled)
         final_context_docs_with_scores = sorted_unique_docs[:RAG_CHUNK_K]
-        context_docs = [doc for doc, score in final_context_docs_with_scores]
+        if rerank_mode != "none" and len(sorted_unique_docs) > RAG_CHUNK_K:
+            pool = sorted_unique_docs[:RAG_RERANK_CANDIDATES]
+            try:
+                final_context_docs_with_scores = _rerank_candidates(query, pool, RAG_CHUNK_K, rerank_mode, higher_is_better=RAG_HYBRID_ENABLED,
+                                                                    vectors=candidate_vectors)
+                logger.debug(f"Reranked {len(pool)} candidates ({rerank_mode}) down to {len(final_context_docs_with_scores)}.")
+            except Exception as e:
+                logger.error(f"Reranking failed ({e}). Using first-stage order.", exc_info=True)
+            timings["rerank"] = time.perf_counter() - stage_started_at
+            stage_started_at = time.perf_counter()
+        # Lower-ranked candidates back-fill the token budget if a selected chunk does not fit
+        selected_keys = {_chunk_key(doc) for doc, score in final_context_docs_with_scores}
+        packing_candidates = [doc for doc, score in final_context_docs_with_scores]
+        packing_candidates += [doc for doc, score in sorted_unique_docs if _chunk_key(doc) not in selected_keys]
+
+        # 4. Pack Context into the Token Budget, Format it for the LLM Prompt and Create Citation Map
+        packed_chunks, context_stats = context_packer.pack_context(packing_candidates, RAG_CONTEXT_TOKEN_BUDGET, RAG_CHUNK_K)
+        context_docs = [doc for doc, text in packed_chunks]
 
         logger.info(f"Retrieved {len(all_retrieved_docs_with_scores)} chunks total across sub-queries. "
-                    f"Selected {len(context_docs)} unique chunks (target k={RAG_CHUNK_K}) for context.")
+                    f"Selected {len(context_docs)} unique chunks (target k={RAG_CHUNK_K}) for context: "
+                    f"{context_stats['tokens']} tokens (budget {RAG_CONTEXT_TOKEN_BUDGET or 'none'}, {context_stats['tokenizer']}), "
+                    f"{context_stats['overlap_chars_trimmed']} overlapping chars trimmed.")
+        with _rag_timings_lock:
+            latest_context_stats.clear()
+            latest_context_stats.update(context_stats)
 
-        # 4. Format Context for LLM Prompt and Create Citation Map
         formatted_context_parts = []
         temp_map = {} # Use 1-based index for map keys, matching citations like [1], [2]
-        for i, doc in enumerate(context_docs):
+        for i, (doc, text) in enumerate(packed_chunks):
             citation_index = i + 1 # 1-based index for the prompt and map
             source = doc.metadata.get('source', 'Unknown Source')
             chunk_idx = doc.metadata.get('chunk_index', 'N/A')
             content = doc.page_content
 
-            # Format for the LLM prompt
+            # Format for the LLM prompt (overlap with neighbouring chunks already removed from `text`)
             # Use 'Source' and 'Chunk Index' for clarity in the context block
-            context_str = f"[{citation_index}] Source: {source} | Chunk Index: {chunk_idx}\n{content}"
-            formatted_context_parts.append(context_str)
+            formatted_context_parts.append(context_packer.format_chunk(citation_index, doc, text))
 
             # Store data needed for frontend reference display, keyed by the citation number
             temp_map[citation_index] = {
@@ -484,8 +1471,11 @@ def perform_rag_search(query: str) -> tuple[list[Document], str, dict[int, dict]
                 "content": content # Store full content for reference expansion/preview later
             }
 
-        formatted_context_text = "\n\n---\n\n".join(formatted_context_parts) if formatted_context_parts else "No context chunks selected after processing."
+        formatted_context_text = context_packer.CONTEXT_SEPARATOR.join(formatted_context_parts) if formatted_context_parts else "No context chunks selected after processing."
         context_docs_map = temp_map # Assign the populated map
+        timings["format"] = time.perf_counter() - stage_started_at
+        timings["total"] = time.perf_counter() - started_at
+        _record_rag_timings(timings)
 
     except Exception as e:
         logger.error(f"Error during RAG search process for query '{query[:50]}...': {e}", exc_info=True)
@@ -497,6 +1487,68 @@ def perform_rag_search(query: str) -> tuple[list[Document], str, dict[int, dict]
     # Return the list of Document objects, the formatted text for the LLM, and the citation map
     return context_docs, formatted_context_text, context_docs_map
 
+def finalize_chat_response(full_llm_response: str) -> tuple[str, str | None]:
+    """
+    Parses a complete synthesis response into (user_answer, thinking_content),
+    substituting placeholder answers when parsing leaves the answer empty.
+    Shared by the blocking and streaming chat paths.
+    """
+    # Log the raw response start
+    logger.info(f"LLM synthesis response received (length: {len(full_llm_response)}).")
+    logger.debug(f"Synthesis Raw Response (Start):\n{full_llm_response[:200]}...")
+
+    # Parse the response to separate thinking and answer using the utility function
+    user_answer, thinking_content = parse_llm_response(full_llm_response)
+
+    if thinking_content:
+        logger.info(f"Parsed thinking content (length: {len(thinking_content)}).")
+    else:
+        # This is expected if the LLM didn't include the tags or the prompt was adjusted
+        logger.debug("No <thinking> content found or parsed in the LLM response.")
+
+
+    if not user_answer and thinking_content:
+         logger.warning("Parsed user answer is empty after removing thinking block. The response might have only contained thinking.")
+         # Decide how to handle this - return thinking as answer, or a specific message?
+         # Let's return a message indicating this.
+         user_answer = "[AI response consisted only of reasoning. No final answer provided. See thinking process.]"
+    elif not user_answer and not thinking_content:
+         logger.error("LLM response parsing resulted in empty answer and no thinking content.")
+         user_answer = "[AI Response Processing Error: Empty result after parsing]"
+
+
+    # Basic check if the answer looks like an error message generated by the LLM itself
+    if user_answer.strip().startswith("Error:") or "sorry, I encountered an error" in user_answer.lower():
+        logger.warning(f"LLM synthesis seems to have resulted in an error message: '{user_answer[:100]}...'")
+
+    return user_answer.strip(), thinking_content # Return stripped answer and thinking
+
+
+def stream_chat_response(query: str, context_text: str) -> Iterator[str]:
+    """
+    Streams the raw synthesis output (thinking and answer interleaved) chunk by chunk
+    as ChatOllama produces it. Use `finalize_chat_response` on the joined output.
+
+    Raises:
+        RuntimeError: If the LLM is not initialized.
+        Exception: Errors from prompt formatting or the model stream.
+    """
+    global llm
+    if not llm:
+        raise RuntimeError("The AI model is currently unavailable.")
+
+    final_prompt = SYNTHESIS_PROMPT_TEMPLATE.format(query=query, context=context_text)
+    logger.info(f"Streaming synthesis prompt to LLM (model: {OLLAMA_MODEL})...")
+    logger.debug(f"Synthesis Prompt (Start):\n{final_prompt[:200]}...")
+
+    # The slot is held until the stream ends (or the client disconnects)
+    with ollama_gateway.slot(ollama_gateway.CHAT):
+        for chunk in llm.stream(final_prompt):
+            text = getattr(chunk, 'content', str(chunk))
+            if text:
+                yield text
+
+
 # --- MODIFIED: Added logging ---
 def synthesize_chat_response(query: str, context_text: str) -> tuple[str, str | None]:
     """
@@ -529,40 +1581,16 @@ def synthesize_chat_response(query: str, context_text: str) -> tuple[str, str |
     try:
         # logger.info(f"Invoking LLM for chat synthesis (model: {OLLAMA_MODEL})...") # Already logged above
         # Use .invoke() for ChatOllama which returns AIMessage, access content with .content
-        response_object = llm.invoke(final_prompt)
+        with ollama_gateway.slot(ollama_gateway.CHAT):
+            response_object = llm.invoke(final_prompt)
         # Ensure response_object has 'content' attribute
         full_llm_response = getattr(response_object, 'content', str(response_object))
 
-        # Log the raw response start
-        logger.info(f"LLM synthesis response received (length: {len(full_llm_response)}).")
-        logger.debug(f"Synthesis Raw Response (Start):\n{full_llm_response[:200]}...")
-
-        # Parse the response to separate thinking and answer using the utility function
-        user_answer, thinking_content = parse_llm_response(full_llm_response)
-
-        if thinking_content:
-            logger.info(f"Parsed thinking content (length: {len(thinking_content)}).")
-        else:
-            # This is expected if the LLM didn't include the tags or the prompt was adjusted
-            logger.debug("No <thinking> content found or parsed in the LLM response.")
-
-
-        if not user_answer and thinking_content:
-             logger.warning("Parsed user answer is empty after removing thinking block. The response might have only contained thinking.")
-             # Decide how to handle this - return thinking as answer, or a specific message?
-             # Let's return a message indicating this.
-             user_answer = "[AI response consisted only of reasoning. No final answer provided. See thinking process.]"
-        elif not user_answer and not thinking_content:
-             logger.error("LLM response parsing resulted in empty answer and no thinking content.")
-             user_answer = "[AI Response Processing Error: Empty result after parsing]"
-
-
-        # Basic check if the answer looks like an error message generated by the LLM itself
-        if user_answer.strip().startswith("Error:") or "sorry, I encountered an error" in user_answer.lower():
-            logger.warning(f"LLM synthesis seems to have resulted in an error message: '{user_answer[:100]}...'")
-
-        return user_answer.strip(), thinking_content # Return stripped answer and thinking
+        return finalize_chat_response(full_llm_response)
 
+    except ollama_gateway.QueueTimeout as e:
+        logger.error(f"LLM chat synthesis not started: {e}")
+        return "Sorry, I encountered an error: the AI model is busy right now. Please try again in a moment.", None
     except Exception as e:
         logger.error(f"LLM chat synthesis failed: {e}", exc_info=True)
         error_message = f"Sorry, I encountered an error while generating the response ({type(e).__name__}). The AI model might be unavailable, timed out, or failed internally."
@@ -570,18 +1598,109 @@ def synthesize_chat_response(query: str, context_text: str) -> tuple[str, str |
         return error_message, None
 # --- END MODIFICATION ---
 
+def lookup_cached_answer(query: str, sources: list[str] | None = None) -> tuple[dict | None, tuple | None]:
+    """Looks up a cached chat answer for `query` (ANSWER_CACHE_ENABLED).
+
+    Entries are keyed on the LLM and embedding models, `sources`, and the chunks the query's own
+    top-RAG_CHUNK_K dense search returns; the query embedding must also be within
+    ANSWER_CACHE_SIMILARITY of the cached question's. Any index change invalidates all entries.
+    This costs one (cached) query embedding and one FAISS search instead of sub-query generation,
+    retrieval and synthesis.
+
+    Returns:
+        tuple: (cached {'answer', 'thinking', 'references'} or None,
+                ticket for `store_cached_answer`, or None if the answer cannot be cached)
+    """
+    if not ANSWER_CACHE_ENABLED or not vector_store or not embeddings or RAG_CHUNK_K <= 0:
+        return None, None
+    try:
+        with _search_view_lock:
+            generation = _index_generation # Read first: a concurrent index change makes the ticket stale
+        vector = embed_queries([query])[0]
+        probe = batched_similarity_search([query], RAG_CHUNK_K, sources=sources)[0]
+        key = (
+            getattr(llm, 'model', None) or OLLAMA_MODEL,
+            getattr(embeddings, 'model', None) or OLLAMA_EMBED_MODEL,
+            tuple(sources or ()),
+            frozenset(_chunk_key(doc) for doc, _ in probe),
+        )
+        return answer_cache.get(key, vector, generation), (key, vector, generation)
+    except Exception as e:
+        logger.error(f"Answer cache lookup failed: {e}. Answering without the cache.", exc_info=True)
+        return None, None
+
+
+def store_cached_answer(ticket: tuple | None, answer: str, thinking: str | None, references: list):
+    """Caches a successful chat answer under the ticket returned by `lookup_cached_answer`."""
+    if ticket is None:
+        return
+    key, vector, generation = ticket
+    if answer_cache.put(key, vector, {"answer": answer, "thinking": thinking, "references": references}, generation):
+        logger.debug(f"Cached chat answer ({len(answer_cache)} entries).")
+
 # --- MODIFIED: Added logging ---
+def _analysis_cache_key(analysis_input: str, analysis_type: str, prompt_template: PromptTemplate,
+                        map_reduce: bool = False) -> tuple[str, str, str, str]:
+    """(document text hash, analysis type, prompt template hash, model): everything the LLM output depends on.
+
+    For map-reduce analyses the prompt hash also covers the map/merge prompts and section settings.
+    """
+    prompt_fingerprint = prompt_template.template
+    if map_reduce:
+        prompt_fingerprint += (ANALYSIS_SECTION_NOTES_PROMPT.template + ANALYSIS_NOTES_MERGE_PROMPT.template
+                               + f"{ANALYSIS_SECTION_CHARS}/{ANALYSIS_REDUCE_FANIN}/{_analysis_context_limit()}")
+    return (
+        hashlib.sha256(analysis_input.encode('utf-8')).hexdigest(),
+        analysis_type,
+        hashlib.sha256(prompt_fingerprint.encode('utf-8')).hexdigest(),
+        getattr(llm, 'model', None) or OLLAMA_MODEL,
+    )
+
+
+def _analysis_context_limit() -> str:
+    """The analysis context limit, e.g. '2000 tokens (tiktoken:cl100k_base)' or '8000 chars'."""
+    if ANALYSIS_MAX_CONTEXT_TOKENS > 0:
+        return f"{ANALYSIS_MAX_CONTEXT_TOKENS} tokens ({context_packer.tokenizer_name()})"
+    return f"{ANALYSIS_MAX_CONTEXT_LENGTH} chars"
+
+
+def _fits_analysis_context(text: str) -> bool:
+    """True if `text` fits ANALYSIS_MAX_CONTEXT_TOKENS (or ANALYSIS_MAX_CONTEXT_LENGTH chars if the token limit is 0)."""
+    if ANALYSIS_MAX_CONTEXT_TOKENS > 0:
+        # Cheap pre-check: no tokenizer produces fewer than one token per ~10 chars of prose
+        if len(text) > ANALYSIS_MAX_CONTEXT_TOKENS * 10:
+            return False
+        return context_packer.count_tokens(text) <= ANALYSIS_MAX_CONTEXT_TOKENS
+    return len(text) <= ANALYSIS_MAX_CONTEXT_LENGTH
+
+
+def _truncate_analysis_context(text: str) -> str:
+    """Keeps the beginning of `text` that fits the analysis context limit."""
+    if ANALYSIS_MAX_CONTEXT_TOKENS > 0:
+        return context_packer.truncate_to_tokens(text, ANALYSIS_MAX_CONTEXT_TOKENS)
+    return text[:ANALYSIS_MAX_CONTEXT_LENGTH]
+
+
+def _analysis_lock(cache_key: tuple) -> threading.Lock:
+    return _analysis_locks[hash(cache_key) % _ANALYSIS_LOCK_STRIPES]
+
+
 def generate_document_analysis(filename: str, analysis_type: str) -> tuple[str | None, str | None]:
     """
     Generates analysis (FAQ, Topics, Mindmap) for a specific document, optionally including thinking.
     Uses ANALYSIS_PROMPTS from config. Retrieves text from cache or disk.
+    Documents over the analysis context limit (ANALYSIS_MAX_CONTEXT_TOKENS tokens, or
+    ANALYSIS_MAX_CONTEXT_LENGTH chars if that is 0) are condensed section by section
+    (map-reduce, see _condense_document) when ANALYSIS_MAP_REDUCE_ENABLED, otherwise truncated.
+    With ANALYSIS_CACHE_ENABLED, results are stored in SQLite keyed by (document text hash,
+    analysis type, prompt template hash, model) and served from there on repeat requests.
 
     Returns:
         tuple[str | None, str | None]: (analysis_content, thinking_content)
                                     Returns (error_message, thinking_content) on failure.
                                     Returns (None, None) if document text cannot be found/loaded.
     """
-    global llm, document_texts_cache
+    global llm
     logger.info(f"Starting analysis: type='{analysis_type}', file='{filename}'")
 
     if not llm:
@@ -589,26 +1708,12 @@ def generate_document_analysis(filename: str, analysis_type: str) -> tuple[str |
         return "Error: AI model is not available for analysis.", None
 
     # --- Step 1: Get Document Text ---
-    doc_text = document_texts_cache.get(filename)
+    doc_text = get_cached_document_text(filename)
     if not doc_text:
-        logger.warning(f"Text for '{filename}' not in cache. Attempting load from disk...")
-        # Determine the potential path (check uploads first, then defaults)
-        potential_paths = [
-            os.path.join(UPLOAD_FOLDER, filename),
-            os.path.join(DEFAULT_PDFS_FOLDER, filename)
-        ]
-        load_path = next((p for p in potential_paths if os.path.exists(p)), None)
-
-        if load_path:
-            logger.debug(f"Found '{filename}' at: {load_path}")
-            doc_text = extract_text_from_pdf(load_path) # Extract fresh if not cached
-            if doc_text:
-                document_texts_cache[filename] = doc_text # Cache it now
-                logger.info(f"Loaded and cached text for '{filename}' from {load_path} for analysis.")
-            else:
-                logger.error(f"Failed to extract text from '{filename}' at {load_path} even though file exists.")
-                # Return specific error if extraction fails
-                return f"Error: Could not extract text content from '{filename}'. File might be corrupted or empty.", None
+        if _find_document_path(filename):
+            logger.error(f"Failed to extract text from '{filename}' even though file exists.")
+            # Return specific error if extraction fails
+            return f"Error: Could not extract text content from '{filename}'. File might be corrupted or empty.", None
         else:
             logger.error(f"Document file '{filename}' not found in default or upload folders for analysis.")
             # Return error indicating file not found
@@ -620,12 +1725,17 @@ def generate_document_analysis(filename: str, analysis_type: str) -> tuple[str |
         return f"Error: Failed to retrieve text content for '{filename}'.", None
 
 
-    # --- Step 2: Prepare Text for LLM (Truncation) ---
+    # --- Step 2: Prepare Text for LLM (Map-reduce or Truncation) ---
     original_length = len(doc_text)
-    if original_length > ANALYSIS_MAX_CONTEXT_LENGTH:
-        logger.warning(f"Document '{filename}' text too long ({original_length} chars), truncating to {ANALYSIS_MAX_CONTEXT_LENGTH} for '{analysis_type}' analysis.")
+    fits_context = _fits_analysis_context(doc_text)
+    map_reduce = ANALYSIS_MAP_REDUCE_ENABLED and not fits_context
+    if map_reduce:
+        logger.info(f"Document '{filename}' text is long ({original_length} chars, limit {_analysis_context_limit()}); analyzing it section by section for '{analysis_type}'.")
+        doc_text_for_llm = doc_text # Condensed later, on a cache miss
+    elif not fits_context:
+        logger.warning(f"Document '{filename}' text too long ({original_length} chars), truncating to {_analysis_context_limit()} for '{analysis_type}' analysis.")
         # Truncate from the end, keeping the beginning
-        doc_text_for_llm = doc_text[:ANALYSIS_MAX_CONTEXT_LENGTH]
+        doc_text_for_llm = _truncate_analysis_context(doc_text)
         # Add a clear truncation marker
         doc_text_for_llm += "\n\n... [CONTENT TRUNCATED DUE TO LENGTH LIMIT]"
     else:
@@ -638,12 +1748,101 @@ def generate_document_analysis(filename: str, analysis_type: str) -> tuple[str |
         logger.error(f"Invalid or missing analysis prompt template for type: {analysis_type} in config.py")
         return f"Error: Invalid analysis type '{analysis_type}' or misconfigured prompt.", None
 
+    if not ANALYSIS_CACHE_ENABLED:
+        return _run_document_analysis(filename, analysis_type, prompt_template, doc_text_for_llm, map_reduce)
+
+    # --- Step 4: Serve from the analysis cache, or call the LLM once per key and store the result ---
+    cache_key = _analysis_cache_key(doc_text_for_llm, analysis_type, prompt_template, map_reduce)
+    with _analysis_lock(cache_key):
+        cached = database.get_cached_analysis(*cache_key)
+        if cached:
+            logger.info(f"Analysis cache hit for '{filename}' ({analysis_type}).")
+            return cached
+        analysis_content, thinking_content = _run_document_analysis(filename, analysis_type, prompt_template, doc_text_for_llm, map_reduce)
+        if analysis_content and not analysis_content.startswith(("Error", "[Analysis generation resulted in empty content")):
+            database.save_cached_analysis(*cache_key, filename, analysis_content, thinking_content)
+        return analysis_content, thinking_content
+
+
+def _analysis_step(prompt_template: PromptTemplate, input_variable: str, text: str) -> str | None:
+    """Runs one map or reduce step (section notes / merged notes), cached in SQLite by input hash.
+
+    Returns:
+        str | None: The condensed notes, or None if the LLM call failed or returned nothing.
+    """
+    cache_key = (
+        hashlib.sha256(text.encode('utf-8')).hexdigest(),
+        hashlib.sha256(prompt_template.template.encode('utf-8')).hexdigest(),
+        getattr(llm, 'model', None) or OLLAMA_MODEL,
+    )
+    if ANALYSIS_CACHE_ENABLED:
+        cached = database.get_cached_analysis_step(*cache_key)
+        if cached is not None:
+            return cached
+    try:
+        with ollama_gateway.slot(ollama_gateway.ANALYSIS):
+            response_object = llm.invoke(prompt_template.format(**{input_variable: text}))
+        notes, _ = parse_llm_response(getattr(response_object, 'content', str(response_object)))
+    except Exception as e:
+        logger.error(f"Map-reduce analysis step failed ({len(text)} chars of input): {e}", exc_info=True)
+        return None
+    notes = (notes or "").strip()
+    if not notes:
+        return None
+    if ANALYSIS_CACHE_ENABLED:
+        database.save_cached_analysis_step(*cache_key, notes)
+    return notes
+
+
+def _condense_document(filename: str, doc_text: str) -> str | None:
+    """Condenses a long document into notes that fit the analysis context limit (map-reduce).
+
+    Map: the text is split into ANALYSIS_SECTION_CHARS sections, each condensed into notes
+    concurrently (ANALYSIS_MAP_WORKERS requests in flight). Reduce: groups of
+    ANALYSIS_REDUCE_FANIN consecutive notes are merged, level by level, until the notes fit.
+    Both steps are independent of the analysis type, so FAQ/Topics/Mindmap share their cached output.
+
+    Returns:
+        str | None: The condensed notes, or None if no section could be condensed.
+    """
+    started_at = time.perf_counter()
+    splitter = RecursiveCharacterTextSplitter(chunk_size=max(ANALYSIS_SECTION_CHARS, 1000), chunk_overlap=200, length_function=len)
+    sections = splitter.split_text(doc_text)
+    notes = list(_analysis_executor.map(lambda section: _analysis_step(ANALYSIS_SECTION_NOTES_PROMPT, "section_text", section), sections))
+    failed = sum(1 for section_notes in notes if section_notes is None)
+    notes = [section_notes for section_notes in notes if section_notes]
+    if failed:
+        logger.warning(f"{failed} of {len(sections)} sections of '{filename}' could not be condensed; the analysis covers the rest.")
+    if not notes:
+        return None
+
+    fan_in = max(ANALYSIS_REDUCE_FANIN, 2)
+    levels = 0
+    while len(notes) > 1 and not _fits_analysis_context("\n\n".join(notes)):
+        levels += 1
+        groups = ["\n\n".join(notes[i:i + fan_in]) for i in range(0, len(notes), fan_in)]
+        merged = list(_analysis_executor.map(lambda group: _analysis_step(ANALYSIS_NOTES_MERGE_PROMPT, "notes_text", group), groups))
+        notes = [merged_notes or group for merged_notes, group in zip(merged, groups)] # A failed merge keeps its input
+
+    condensed = "\n\n".join(notes)
+    if not _fits_analysis_context(condensed):
+        logger.warning(f"Condensed notes for '{filename}' still exceed {_analysis_context_limit()} ({len(condensed)} chars); truncating.")
+        condensed = _truncate_analysis_context(condensed) + "\n\n... [NOTES TRUNCATED DUE TO LENGTH LIMIT]"
+    logger.info(f"Condensed '{filename}' ({len(doc_text)} chars, {len(sections)} sections, {levels} reduce levels) "
+                f"to {len(condensed)} chars of notes in {time.perf_counter() - started_at:.1f}s.")
+    return condensed
+
+
+def _run_document_analysis(filename: str, analysis_type: str, prompt_template: PromptTemplate,
+                           doc_text_for_llm: str, map_reduce: bool) -> tuple[str, str | None]:
+    """Builds the analysis prompt (condensing the whole document first if `map_reduce`) and calls the LLM."""
+    if map_reduce:
+        doc_text_for_llm = _condense_document(filename, doc_text_for_llm)
+        if doc_text_for_llm is None:
+            return f"Error generating analysis: AI model failed to condense '{filename}' section by section. Check logs for details.", None
     try:
         # Ensure the template expects 'doc_text_for_llm'
         final_prompt = prompt_template.format(doc_text_for_llm=doc_text_for_llm)
-        # Log the prompt before sending
-        logger.info(f"Sending analysis prompt to LLM (type: {analysis_type}, file: {filename}, model: {OLLAMA_MODEL})...")
-        logger.debug(f"Analysis Prompt (Start):\n{final_prompt[:200]}...")
 
     except KeyError as e:
         logger.error(f"Error formatting ANALYSIS_PROMPTS[{analysis_type}]: Missing key {e}. Check config.py.")
@@ -652,12 +1851,24 @@ def generate_document_analysis(filename: str, analysis_type: str) -> tuple[str |
         logger.error(f"Error creating analysis prompt for {analysis_type}: {e}", exc_info=True)
         return f"Error: Could not prepare the request for the {analysis_type} analysis.", None
 
+    return _invoke_document_analysis(filename, analysis_type, final_prompt)
+
 
-    # --- Step 4: Call LLM and Parse Response ---
+def _invoke_document_analysis(filename: str, analysis_type: str, final_prompt: str) -> tuple[str, str | None]:
+    """Calls the LLM with a prepared analysis prompt and parses the response.
+
+    Returns:
+        tuple[str, str | None]: (analysis_content, thinking_content), or (error_message, None) on failure.
+    """
+    # Log the prompt before sending
+    logger.info(f"Sending analysis prompt to LLM (type: {analysis_type}, file: {filename}, model: {OLLAMA_MODEL})...")
+    logger.debug(f"Analysis Prompt (Start):\n{final_prompt[:200]}...")
+
+    # --- Call LLM and Parse Response ---
     try:
-        # logger.info(f"Invoking LLM for '{analysis_type}' analysis of '{filename}' (model: {OLLAMA_MODEL})...") # Already logged above
         # Use .invoke() for ChatOllama
-        response_object = llm.invoke(final_prompt)
+        with ollama_gateway.slot(ollama_gateway.ANALYSIS):
+            response_object = llm.invoke(final_prompt)
         full_analysis_response = getattr(response_object, 'content', str(response_object))
 
         # Log the raw response start
@@ -690,4 +1901,38 @@ def generate_document_analysis(filename: str, analysis_type: str) -> tuple[str |
         return f"Error generating analysis: AI model failed ({type(e).__name__}). Check logs for details.", None
 # --- END MODIFICATION ---
 
+def precompute_document_analyses(filenames: list[str] | None = None, analysis_types: list[str] | None = None) -> dict:
+    """Generates and caches analyses ahead of the first /analyze click (ANALYSIS_CACHE_ENABLED).
+
+    Analyses already in the cache are skipped by generate_document_analysis, so this is cheap
+    to re-run after the corpus changes.
+
+    Args:
+        filenames (list[str] | None): PDFs to analyze; defaults to every PDF in DEFAULT_PDFS_FOLDER.
+        analysis_types (list[str] | None): Analysis types; defaults to all of ANALYSIS_PROMPTS.
+
+    Returns:
+        dict: {'ok': int, 'failed': int} analysis counts.
+    """
+    if not ANALYSIS_CACHE_ENABLED:
+        logger.warning("ANALYSIS_CACHE_ENABLED is off; precomputed analyses would not be kept. Skipping.")
+        return {"ok": 0, "failed": 0}
+    if filenames is None:
+        filenames = sorted(f for f in os.listdir(DEFAULT_PDFS_FOLDER) if f.lower().endswith('.pdf')) if os.path.isdir(DEFAULT_PDFS_FOLDER) else []
+    analysis_types = analysis_types or list(ANALYSIS_PROMPTS)
+    counts = {"ok": 0, "failed": 0}
+    started_at = time.perf_counter()
+    logger.info(f"Precomputing {len(analysis_types)} analyses for {len(filenames)} documents...")
+    for filename in filenames:
+        for analysis_type in analysis_types:
+            try:
+                content, _ = generate_document_analysis(filename, analysis_type)
+                succeeded = bool(content) and not content.startswith("Error")
+            except Exception as e:
+                logger.error(f"Precomputing '{analysis_type}' for '{filename}' failed: {e}", exc_info=True)
+                succeeded = False
+            counts["ok" if succeeded else "failed"] += 1
+    logger.info(f"Analysis precompute finished in {time.perf_counter() - started_at:.1f}s: {counts['ok']} ready, {counts['failed']} failed.")
+    return counts
+
 # --- END OF FILE ai_core.py ---
\ No newline at end of file
@@ -0,0 +1,239 @@
+# --- START OF FILE ann_index.py ---
+
+# FAISS index factory for the vector store.
+# LangChain always builds an exact IndexFlat; past a few hundred thousand vectors every
+# query becomes a full scan. This module builds/trains the configured approximate index
+# (HNSW, IVF-Flat or IVF-PQ), applies per-query search parameters (nprobe / efSearch, ID filters),
+# and measures recall against the exact flat baseline.
+import math
+import time
+import logging
+import numpy as np
+import faiss
+from config import (
+    FAISS_HNSW_M, FAISS_HNSW_EF_CONSTRUCTION, FAISS_HNSW_EF_SEARCH,
+    FAISS_IVF_NLIST, FAISS_IVF_NPROBE, FAISS_PQ_M, FAISS_PQ_NBITS, FAISS_TRAIN_SAMPLE
+)
+
+logger = logging.getLogger(__name__)
+
+INDEX_TYPES = ('Flat', 'HNSW', 'IVFFlat', 'IVFPQ')
+_ADD_BLOCK = 65536 # Vectors added to the index per call
+
+# Search parameter sweeps used by the recall/latency report
+NPROBE_SWEEP = (1, 2, 4, 8, 16, 32, 64, 128)
+EF_SEARCH_SWEEP = (16, 32, 64, 128, 256, 512)
+
+
+def normalize_index_type(name: str) -> str:
+    """Maps a case-insensitive index type name to its canonical form."""
+    for index_type in INDEX_TYPES:
+        if index_type.lower() == (name or "").strip().lower().replace('-', '').replace('_', ''):
+            return index_type
+    raise ValueError(f"Unknown FAISS index type '{name}'. Expected one of: {', '.join(INDEX_TYPES)}.")
+
+
+def index_type_of(index: faiss.Index) -> str:
+    """Canonical type name of an existing index (class name if not one of INDEX_TYPES)."""
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexFlat):
+        return 'Flat'
+    if isinstance(index, faiss.IndexHNSW):
+        return 'HNSW'
+    if isinstance(index, faiss.IndexIVFPQ):
+        return 'IVFPQ'
+    if isinstance(index, faiss.IndexIVFFlat):
+        return 'IVFFlat'
+    return type(index).__name__
+
+
+def is_lossless(index: faiss.Index) -> bool:
+    """True if stored vectors can be reconstructed exactly (no quantization)."""
+    return index_type_of(index) in ('Flat', 'HNSW', 'IVFFlat')
+
+
+def auto_nlist(n_vectors: int) -> int:
+    """IVF list count: ~4*sqrt(N), capped so each centroid gets >= 39 training points."""
+    if FAISS_IVF_NLIST > 0:
+        return FAISS_IVF_NLIST
+    return max(1, min(int(4 * math.sqrt(n_vectors)), n_vectors // 39))
+
+
+def build_index(index_type: str, dim: int, metric: int, n_vectors: int) -> faiss.Index:
+    """Creates an empty (untrained) index of the given type."""
+    index_type = normalize_index_type(index_type)
+    if index_type == 'Flat':
+        return faiss.IndexFlat(dim, metric)
+    if index_type == 'HNSW':
+        index = faiss.IndexHNSWFlat(dim, FAISS_HNSW_M, metric)
+        index.hnsw.efConstruction = FAISS_HNSW_EF_CONSTRUCTION
+        return index
+    nlist = auto_nlist(n_vectors)
+    quantizer = faiss.IndexFlat(dim, metric)
+    if index_type == 'IVFFlat':
+        return faiss.IndexIVFFlat(quantizer, dim, nlist, metric)
+    if dim % FAISS_PQ_M:
+        raise ValueError(f"FAISS_PQ_M={FAISS_PQ_M} must divide the embedding dimension {dim}.")
+    return faiss.IndexIVFPQ(quantizer, dim, nlist, FAISS_PQ_M, FAISS_PQ_NBITS, metric)
+
+
+def apply_default_search_params(index: faiss.Index):
+    """Sets the configured nprobe / efSearch as the index defaults."""
+    index_type = index_type_of(index)
+    if index_type in ('IVFFlat', 'IVFPQ'):
+        faiss.extract_index_ivf(index).nprobe = FAISS_IVF_NPROBE
+    elif index_type == 'HNSW':
+        faiss.downcast_index(index).hnsw.efSearch = FAISS_HNSW_EF_SEARCH
+
+
+def search_params(index: faiss.Index, nprobe: int | None = None, ef_search: int | None = None,
+                  selector: faiss.IDSelector | None = None) -> faiss.SearchParameters | None:
+    """Per-query search parameters for `index.search(..., params=...)` (None if not applicable).
+
+    `selector` restricts the search to a subset of positions (e.g. the chunks of selected files).
+    Parameters not overridden keep the index defaults. The caller must keep `selector` alive
+    for the duration of the search.
+    """
+    index_type = index_type_of(index)
+    if index_type in ('IVFFlat', 'IVFPQ') and (nprobe or selector is not None):
+        nprobe = nprobe or faiss.extract_index_ivf(index).nprobe
+        return faiss.SearchParametersIVF(sel=selector, nprobe=int(nprobe))
+    if index_type == 'HNSW' and (ef_search or selector is not None):
+        ef_search = ef_search or faiss.downcast_index(index).hnsw.efSearch
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=int(ef_search))
+    if selector is not None:
+        return faiss.SearchParameters(sel=selector)
+    return None
+
+
+def reconstruct_all(index: faiss.Index, count: int | None = None) -> np.ndarray:
+    """Returns the first `count` (default: all) stored vectors. Approximate for IVF-PQ."""
+    count = index.ntotal if count is None else count
+    if count == 0:
+        return np.zeros((0, index.d), dtype=np.float32)
+    if index_type_of(index) in ('IVFFlat', 'IVFPQ'):
+        faiss.extract_index_ivf(index).make_direct_map()
+    return index.reconstruct_n(0, count)
+
+
+def needs_direct_map(index: faiss.Index) -> bool:
+    """True for an IVF index that cannot reconstruct by position yet (see reconstruct_positions)."""
+    return index_type_of(index) in ('IVFFlat', 'IVFPQ') and faiss.extract_index_ivf(index).direct_map.no()
+
+
+def reconstruct_positions(index: faiss.Index, positions) -> np.ndarray:
+    """Returns the stored vectors at `positions`, one row each. Approximate for IVF-PQ.
+
+    IVF indexes get a direct map on first use; callers serialize that with index writes.
+    """
+    positions = np.asarray(positions, dtype=np.int64)
+    if len(positions) == 0:
+        return np.zeros((0, index.d), dtype=np.float32)
+    if needs_direct_map(index):
+        faiss.extract_index_ivf(index).make_direct_map()
+    return index.reconstruct_batch(positions)
+
+
+def train_and_fill(index_type: str, vectors: np.ndarray, metric: int) -> faiss.Index:
+    """Builds an index of `index_type`, trains it on a sample of `vectors` and adds them all.
+
+    Vectors are added in their original order, so positions (and the docstore mapping)
+    stay the same as in the source index.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    n_vectors, dim = vectors.shape
+    index = build_index(index_type, dim, metric, n_vectors)
+    started_at = time.perf_counter()
+    if not index.is_trained:
+        sample = vectors
+        if n_vectors > FAISS_TRAIN_SAMPLE:
+            rng = np.random.default_rng(0)
+            sample = vectors[np.sort(rng.choice(n_vectors, FAISS_TRAIN_SAMPLE, replace=False))]
+        logger.info(f"Training {index_type} index on {len(sample)} vectors (nlist={faiss.extract_index_ivf(index).nlist})...")
+        index.train(sample)
+    for start in range(0, n_vectors, _ADD_BLOCK):
+        index.add(vectors[start:start + _ADD_BLOCK])
+    apply_default_search_params(index)
+    logger.info(f"Built {index_type} index with {index.ntotal} vectors in {time.perf_counter() - started_at:.2f}s.")
+    return index
+
+
+def refill_index(index: faiss.Index, vectors: np.ndarray) -> faiss.Index:
+    """New index of the same type and parameters holding only `vectors` (e.g. without deleted ones).
+
+    IVF indexes reuse their trained quantizer; Flat and HNSW (which cannot remove vectors)
+    are rebuilt. `index` must not be memory-mapped.
+    """
+    index_type = index_type_of(index)
+    if index_type not in ('IVFFlat', 'IVFPQ'):
+        return train_and_fill(index_type, vectors, index.metric_type)
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    refilled = faiss.clone_index(index)
+    refilled.reset()
+    for start in range(0, len(vectors), _ADD_BLOCK):
+        refilled.add(vectors[start:start + _ADD_BLOCK])
+    apply_default_search_params(refilled)
+    return refilled
+
+
+def describe(index: faiss.Index | None) -> dict:
+    """Summary of an index for logs and /status."""
+    if index is None:
+        return {"type": None, "ntotal": 0}
+    index_type = index_type_of(index)
+    info = {"type": index_type, "ntotal": index.ntotal, "dim": index.d, "is_trained": bool(index.is_trained)}
+    if index_type in ('IVFFlat', 'IVFPQ'):
+        ivf = faiss.extract_index_ivf(index)
+        info.update(nlist=ivf.nlist, nprobe=ivf.nprobe)
+    elif index_type == 'HNSW':
+        hnsw = faiss.downcast_index(index).hnsw
+        info.update(M=FAISS_HNSW_M, ef_search=hnsw.efSearch)
+    return info
+
+
+def recall_latency_report(index: faiss.Index, exact_vectors: np.ndarray, num_queries: int = 200, k: int = 10) -> list[dict]:
+    """Measures recall@k and per-query latency of `index` against an exact flat baseline.
+
+    Queries are a random sample of the stored vectors. One row is produced for the flat
+    baseline and one per nprobe / efSearch value of the relevant sweep.
+
+    Returns:
+        list[dict]: Rows of {'setting', 'recall_at_k', 'ms_per_query'}.
+    """
+    exact_vectors = np.ascontiguousarray(exact_vectors, dtype=np.float32)
+    if len(exact_vectors) == 0:
+        return []
+    rng = np.random.default_rng(0)
+    query_rows = rng.choice(len(exact_vectors), min(num_queries, len(exact_vectors)), replace=False)
+    queries = exact_vectors[query_rows]
+    k = min(k, len(exact_vectors))
+
+    flat = faiss.IndexFlat(exact_vectors.shape[1], index.metric_type)
+    flat.add(exact_vectors)
+    started_at = time.perf_counter()
+    _, ground_truth = flat.search(queries, k)
+    rows = [{"setting": "Flat (exact)", "recall_at_k": 1.0, "ms_per_query": round((time.perf_counter() - started_at) * 1000 / len(queries), 4)}]
+
+    index_type = index_type_of(index)
+    if index_type in ('IVFFlat', 'IVFPQ'):
+        nlist = faiss.extract_index_ivf(index).nlist
+        sweep = [("nprobe", p) for p in NPROBE_SWEEP if p <= nlist]
+    elif index_type == 'HNSW':
+        sweep = [("efSearch", ef) for ef in EF_SEARCH_SWEEP]
+    else:
+        sweep = [(None, None)]
+
+    for name, value in sweep:
+        params = search_params(index, nprobe=value if name == "nprobe" else None, ef_search=value if name == "efSearch" else None)
+        started_at = time.perf_counter()
+        _, found = index.search(queries, k, params=params) if params else index.search(queries, k)
+        elapsed = time.perf_counter() - started_at
+        hits = sum(len(set(f[f >= 0]) & set(g)) for f, g in zip(found, ground_truth))
+        rows.append({
+            "setting": f"{index_type} {name}={value}" if name else index_type,
+            "recall_at_k": round(hits / (len(queries) * k), 4),
+            "ms_per_query": round(elapsed * 1000 / len(queries), 4),
+        })
+    return rows
+
+# --- END OF FILE ann_index.py ---
@@ -4,7 +4,9 @@ import os
 import logging
 import json
 import uuid
-from flask import Flask, request, jsonify, render_template, send_from_directory, Response
+import threading
+import multiprocessing
+from flask import Flask, request, jsonify, render_template, send_from_directory, Response, stream_with_context
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
 from waitress import serve
@@ -19,6 +21,9 @@ logger = logging.getLogger(__name__) # Get logger for this module
 import database
 import ai_core
 import utils
+import jobs
+import corpus_sync
+import warmup
 
 # --- Global Flask App Setup ---
 backend_dir = os.path.dirname(__file__)
@@ -51,90 +56,89 @@ except OSError as e:
     # Decide if critical? App can run without uploads. Log and continue for now.
 
 # --- Application Initialization ---
-# Flags to track initialization status
-app_db_ready = False
-app_ai_ready = False
-app_vector_store_ready = False
-app_doc_cache_loaded = False # Flag for document text cache
+# Components are warmed up concurrently in the background (see warmup.py); requests only wait
+# for the components they need, so /status and /documents answer right away.
+DATABASE = "database" # Chat history, analysis cache
+MODELS = "models" # Ollama probe: test embedding + test prompt
+INDEX = "index" # FAISS vector store (+ BM25, write-ahead log replay)
+DOCUMENTS = "documents" # Persistent text store of every PDF (for /analyze)
+_init_lock = threading.Lock()
 
-def initialize_app():
-    """Initializes database, AI components, loads index and document texts."""
-    global app_db_ready, app_ai_ready, app_vector_store_ready, app_doc_cache_loaded
-    # Prevent re-initialization if called multiple times
-    if hasattr(app, 'initialized') and app.initialized:
-        # logger.debug("Application already initialized.")
-        return
 
-    logger.info("--- Starting Application Initialization ---")
-    initialization_successful = True
+def _warm_up_database() -> None:
+    database.init_db() # Logs errors/success; only a failed connection raises
 
-    # 1. Initialize Database
-    try:
-        database.init_db() # This now returns nothing, just logs errors/success
-        # Check connection after init attempt (optional, assumes init_db raises on critical failure)
-        # conn = database.get_db_connection()
-        # conn.close()
-        app_db_ready = True
-        logger.info("Database initialization successful.")
-    except Exception as e:
-        logger.critical(f"Database initialization failed: {e}. Chat history will be unavailable.", exc_info=True)
-        app_db_ready = False
-        initialization_successful = False # DB is critical
-
-    # 2. Initialize AI Components (Embeddings + LLM)
-    logger.info("Initializing AI components...")
-    embed_instance, llm_instance = ai_core.initialize_ai_components()
-    if not embed_instance or not llm_instance:
-         logger.warning("AI components (LLM/Embeddings) failed to initialize. Check Ollama connection and model names. Chat/Analysis/Upload features relying on AI will be unavailable.")
-         app_ai_ready = False
-         # Let initialization proceed, but AI features won't work
-         # initialization_successful = False # Only fail if AI is absolutely essential for startup
-    else:
-         app_ai_ready = True
-         # Set globals in ai_core if initialize_ai_components doesn't do it anymore
-         # ai_core.embeddings = embed_instance # Assuming initialize sets globals
-         # ai_core.llm = llm_instance
-         logger.info("AI components initialized successfully.")
-
-    # 3. Load FAISS Vector Store (requires embeddings)
-    if app_ai_ready:
-        logger.info("Loading FAISS vector store...")
-        if ai_core.load_vector_store():
-            app_vector_store_ready = True
-            index_size = getattr(getattr(ai_core.vector_store, 'index', None), 'ntotal', 0)
-            logger.info(f"FAISS vector store loaded successfully (or is empty). Index size: {index_size}")
-        else:
-            app_vector_store_ready = False
-            logger.warning("Failed to load existing FAISS vector store or it wasn't found. RAG will start with an empty index until uploads or default.py runs.")
-            # Not necessarily a failure for the app to start
-    else:
-         app_vector_store_ready = False
-         logger.warning("Skipping vector store loading because AI components failed to initialize.")
 
-    # 4. Load Document Texts into Cache (for analysis) - Best effort
-    logger.info("Loading document texts into cache...")
-    try:
-         ai_core.load_all_document_texts()
-         app_doc_cache_loaded = True
-         logger.info(f"Document text cache loading complete. Cached {len(ai_core.document_texts_cache)} documents.")
-    except Exception as e:
-         logger.error(f"Error loading document texts into cache: {e}. Analysis of uncached docs may require on-the-fly extraction.", exc_info=True)
-         app_doc_cache_loaded = False
-         # Not a critical failure
+def _warm_up_models() -> None:
+    ai_core.check_ai_components() # Raises if Ollama or a model does not respond
+
+
+def _warm_up_index() -> str:
+    ai_core.create_ai_components() # The index only needs the embeddings object, not a working Ollama
+    if not ai_core.load_vector_store():
+        logger.warning("Failed to load existing FAISS vector store or it wasn't found. RAG will start with an empty index until uploads or default.py runs.")
+        return "no index yet"
+    index_size = getattr(getattr(ai_core.vector_store, 'index', None), 'ntotal', 0)
+    return f"{index_size} vectors"
+
 
-    app.initialized = True # Set flag after first run
-    logger.info("--- Application Initialization Complete ---")
-    if not initialization_successful:
-         logger.critical("Initialization failed (Database Error). Application may not function correctly.")
-    elif not app_ai_ready:
-         logger.warning("Initialization complete, but AI components failed. Some features unavailable.")
+def _warm_up_documents() -> str:
+    # Texts are loaded lazily into the bounded document cache when /analyze needs them.
+    stored_count = ai_core.prime_document_text_store()
+    return f"{stored_count} documents"
+
+
+def _start_folder_watcher() -> str | None:
+    if not os.path.isdir(config.DEFAULT_PDFS_FOLDER):
+        raise FileNotFoundError(f"Default PDFs folder not found: {config.DEFAULT_PDFS_FOLDER}")
+    corpus_sync.start_watcher(config.DEFAULT_PDFS_FOLDER, config.DEFAULT_PDFS_WATCH_INTERVAL)
+
+
+def _start_analysis_precompute() -> str:
+    threading.Thread(target=ai_core.precompute_document_analyses, name="analysis-precompute", daemon=True).start()
+    return "running in background"
+
+
+def initialize_app():
+    """Starts the background warm-up of the database, AI models, index and document texts.
+
+    Called from the __main__ block, or by the first request under a WSGI server; never at import,
+    so importing the app (e.g. in a child process) has no side effects.
+    Returns immediately; safe to call more than once.
+    """
+    with _init_lock:
+        if hasattr(app, 'initialized') and app.initialized:
+            return
+        if multiprocessing.parent_process() is not None:
+            logger.warning("Not warming up the app inside a child process.")
+            return
+        logger.info("--- Starting Application Warm-up (background) ---")
+        warmup.start(DATABASE, _warm_up_database)
+        warmup.start(MODELS, _warm_up_models)
+        warmup.start(INDEX, _warm_up_index)
+        warmup.start(DOCUMENTS, _warm_up_documents)
+        # Watch the default PDFs folder (optional; the app is then the only writer of the index)
+        if config.DEFAULT_PDFS_WATCH_ENABLED:
+            warmup.start("folder_watcher", _start_folder_watcher, requires=(MODELS, INDEX))
+        # Precompute analyses of the default PDFs in the background (optional; results go to the analysis cache)
+        if config.ANALYSIS_PRECOMPUTE_ENABLED:
+            warmup.start("analysis_precompute", _start_analysis_precompute, requires=(MODELS, DATABASE))
+        app.initialized = True
+
+
+def _wait_ready(*components: str) -> bool:
+    """Waits (up to STARTUP_WAIT_TIMEOUT) for the components a request needs; True if all are ready."""
+    return all(warmup.wait(component, config.STARTUP_WAIT_TIMEOUT) for component in components)
+
+
+def _rag_available() -> bool:
+    """True if there is an index to search (loaded at startup or created by a later upload)."""
+    return _wait_ready(INDEX) and ai_core.vector_store is not None
 
 
-# Run initialization before the first request using Flask's mechanism
 @app.before_request
 def ensure_initialized():
-    # This ensures initialization runs once before the first request handles.
-    # The flag prevents it from running on every request.
+    # Under a WSGI server (no __main__ block) the first request starts the warm-up.
     if not hasattr(app, 'initialized') or not app.initialized:
         initialize_app()
 
@@ -168,9 +172,10 @@ def favicon():
 def get_status():
      """Endpoint to check backend status and component readiness."""
      # logger.debug("Status endpoint requested.") # Can be noisy
+     # Never waits for the warm-up; the 'startup' entry shows which components are still loading
      vector_store_count = -1 # Indicate not checked or error initially
-     if app_ai_ready and app_vector_store_ready: # Only check count if store should be ready
-        if ai_core.vector_store and hasattr(ai_core.vector_store, 'index') and ai_core.vector_store.index:
+     if warmup.is_ready(INDEX) and ai_core.vector_store is not None: # Only check count once the store is loaded or created
+        if hasattr(ai_core.vector_store, 'index') and ai_core.vector_store.index:
             try:
                 vector_store_count = ai_core.vector_store.index.ntotal
             except Exception as e:
@@ -180,13 +185,25 @@ def get_status():
              vector_store_count = 0 # Store loaded but might be empty
 
      status_data = {
-         "status": "ok" if app_db_ready else "error", # Base status depends on DB
-         "database_initialized": app_db_ready,
-         "ai_components_loaded": app_ai_ready,
-         "vector_store_loaded": app_vector_store_ready,
+         "status": "ok" if warmup.is_ready(DATABASE) else ("starting" if not warmup.finished() else "error"), # Base status depends on DB
+         "database_initialized": warmup.is_ready(DATABASE),
+         "ai_components_loaded": warmup.is_ready(MODELS),
+         "vector_store_loaded": warmup.is_ready(INDEX) and ai_core.vector_store is not None,
          "vector_store_entries": vector_store_count, # -1:NotChecked/AI down, -2:Error, 0+:Count
-         "doc_cache_loaded": app_doc_cache_loaded,
-         "cached_docs_count": len(ai_core.document_texts_cache) if app_doc_cache_loaded else 0,
+         "doc_cache_loaded": warmup.is_ready(DOCUMENTS),
+         "startup": warmup.stats(), # Per-component warm-up state (pending/running/ready/failed) and load seconds
+         "cached_docs_count": len(ai_core.document_texts_cache),
+         "doc_cache": ai_core.document_texts_cache.stats(), # hit_rate, resident_bytes, evictions, ...
+         "query_embedding_cache": ai_core.query_embedding_cache.stats(),
+         "answer_cache": ai_core.answer_cache.stats(), # Reused /chat answers (invalidated on index changes)
+         "last_embedding_run": ai_core.embedding_pipeline.get_latest_stats(), # chunks/s of the latest indexing
+         "last_rag_timings": ai_core.get_latest_rag_timings(), # Per-stage seconds of the latest RAG search
+         "last_context_packing": ai_core.get_latest_context_stats(), # Tokens used vs budget by the latest synthesis context
+         "ollama_gateway": ai_core.ollama_gateway.stats(), # Per-class in-flight/queued requests, queue wait vs service time
+         "ollama_backends": ai_core.ollama_pool.pool.stats(), # Health, outstanding requests and ejections per server
+         "upload_jobs": jobs.get_job_counts(),
+         "vector_index": ai_core.ann_index.describe(getattr(ai_core.vector_store, 'index', None)), # type, nlist/nprobe or efSearch
+         "vector_deletions_pending": ai_core.pending_deletion_count(), # Deleted vectors still in the index until compaction
          "ollama_model": config.OLLAMA_MODEL,
          "embedding_model": config.OLLAMA_EMBED_MODEL,
          "timestamp": datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z') # Standard ISO UTC
@@ -236,13 +253,68 @@ def get_documents():
     return jsonify(response_data)
 
 
+@app.route('/documents/<path:filename>', methods=['DELETE'])
+def delete_document(filename):
+    """Removes an uploaded document's chunks from the knowledge base and deletes the file.
+
+    `filename` is the name listed by /documents (spaces and non-ASCII characters are fine) and
+    must be an uploaded file or an indexed source. Documents of the default PDF folder are
+    refused: the folder sync would index them again, so they are removed from the folder instead.
+    """
+    if not filename or '/' in filename or '\\' in filename or '\0' in filename or filename in ('.', '..'):
+        logger.warning(f"Delete request with invalid filename: '{filename}'")
+        return jsonify({"error": "Invalid filename."}), 400
+
+    if not _wait_ready(INDEX):
+        logger.error("Delete request failed: vector store not loaded.")
+        return jsonify({"error": "Cannot delete documents: the knowledge base index is not ready. Check server status."}), 503
+
+    if os.path.isfile(os.path.join(config.DEFAULT_PDFS_FOLDER, filename)) or filename in corpus_sync.load_manifest()['files']:
+        logger.warning(f"Delete of default-folder document '{filename}' rejected.")
+        return jsonify({"error": f"'{filename}' is in the default PDF folder. Remove it from that folder; "
+                                 f"the next folder sync removes it from the knowledge base."}), 409
+
+    upload_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+    if not os.path.isfile(upload_path) and filename not in ai_core.indexed_sources():
+        return jsonify({"error": f"Document '{filename}' not found."}), 404
+
+    active_job = jobs.find_active_job(filename)
+    if active_job:
+        logger.warning(f"Delete of '{filename}' rejected: upload job {active_job['job_id']} is still processing it.")
+        return jsonify({"error": f"'{filename}' is still being processed.", "job_id": active_job['job_id']}), 409
+
+    chunks_deleted = ai_core.delete_source_documents(filename)
+    if chunks_deleted is None:
+        return jsonify({"error": f"Failed to remove '{filename}' from the knowledge base index. Consult server logs."}), 500
+
+    file_removed = False
+    if os.path.isfile(upload_path):
+        try:
+            os.remove(upload_path)
+            file_removed = True
+            logger.info(f"Removed uploaded file {upload_path}.")
+        except OSError as e:
+            logger.error(f"Error removing uploaded file {upload_path}: {e}", exc_info=True)
+            return jsonify({"error": f"Removed '{filename}' from the index, but could not delete the file: {type(e).__name__}."}), 500
+    ai_core.document_texts_cache.pop(filename)
+
+    if not chunks_deleted and not file_removed:
+        return jsonify({"error": f"Document '{filename}' not found."}), 404
+    return jsonify({
+        "message": f"Document '{filename}' removed from the knowledge base.",
+        "filename": filename,
+        "chunks_deleted": chunks_deleted,
+        "file_removed": file_removed,
+    })
+
+
 @app.route('/upload', methods=['POST'])
 def upload_file():
-    """Handles PDF uploads, processing, caching, and adding to FAISS."""
+    """Saves an uploaded PDF and queues a background job to extract, chunk, embed and index it."""
     logger.info("File upload request received.")
 
-    # --- Check AI readiness (needed for embedding) ---
-    if not app_ai_ready or not ai_core.embeddings:
+    # --- Check AI readiness (needed for embedding) and the index (jobs add to it) ---
+    if not _wait_ready(MODELS, INDEX) or not ai_core.embeddings:
          logger.error("Upload failed: AI Embeddings component not initialized.")
          # 503 Service Unavailable is appropriate
          return jsonify({"error": "Cannot process upload: AI processing components are not ready. Check server status."}), 503
@@ -273,76 +345,48 @@ def upload_file():
     filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
     logger.debug(f"Attempting to save uploaded file to: {filepath}")
 
-    # --- Save and Process ---
+    # Reserve the name before saving: a queued/running job for the same file must not be overwritten
+    job, reserved = jobs.reserve_upload_job(filename)
+    if not reserved:
+        logger.warning(f"Upload of '{filename}' rejected: job {job['job_id']} is still processing it.")
+        return jsonify({"error": f"'{filename}' is already being processed.", "job_id": job['job_id']}), 409
+
+    # --- Save and Queue for Processing ---
     try:
         # Ensure upload dir exists (double check)
         os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
         file.save(filepath)
         logger.info(f"File '{filename}' saved successfully to {filepath}")
-
-        # 1. Extract text
-        logger.info(f"Processing uploaded file: {filename}...")
-        text = ai_core.extract_text_from_pdf(filepath)
-        if not text:
-            # Extraction failed, remove the saved file
-            try:
-                os.remove(filepath)
-                logger.info(f"Removed file {filepath} because text extraction failed.")
-            except OSError as rm_err:
-                logger.error(f"Error removing problematic file {filepath} after failed text extraction: {rm_err}")
-            logger.error(f"Could not extract text from uploaded file: {filename}. It might be empty, corrupted, or password-protected.")
-            # Return 400 Bad Request as the file is unusable
-            return jsonify({"error": f"Could not read text from '{filename}'. Please check if the PDF is valid and not password-protected."}), 400
-
-        # 2. Add extracted text to cache (overwrite if filename exists)
-        ai_core.document_texts_cache[filename] = text
-        logger.info(f"Text extracted ({len(text)} chars) and cached for {filename}.")
-
-        # 3. Create chunks/documents
-        logger.debug(f"Creating document chunks for {filename}...")
-        documents = ai_core.create_chunks_from_text(text, filename)
-        if not documents:
-             # Text extracted but chunking failed. Keep file & cache, but RAG won't work.
-             logger.error(f"Could not create document chunks for {filename}, although text was extracted. File kept and cached, but cannot add to knowledge base for chat.")
-             # Return 500 Internal Server Error as processing failed partially
-             return jsonify({"error": f"Could not process the structure of '{filename}' into searchable chunks. Analysis might work, but chat context cannot be added for this file."}), 500
-
-        # 4. Add to vector store (this handles index creation/saving internally)
-        logger.debug(f"Adding {len(documents)} chunks for {filename} to vector store...")
-        if not ai_core.add_documents_to_vector_store(documents):
-            logger.error(f"Failed to add document chunks for '{filename}' to the vector store or save the index. Check logs.")
-            # Keep file/cache, but report index failure.
-            return jsonify({"error": f"File '{filename}' processed, but failed to update the knowledge base index. Consult server logs."}), 500
-
-        # --- Success ---
-        vector_count = -1
-        if ai_core.vector_store and hasattr(ai_core.vector_store, 'index'):
-             vector_count = getattr(ai_core.vector_store.index, 'ntotal', 0)
-        logger.info(f"Successfully processed, cached, and indexed '{filename}'. New vector count: {vector_count}")
-        # Return success message, filename, and maybe new count
-        return jsonify({
-            "message": f"File '{filename}' uploaded and added to knowledge base successfully.",
-            "filename": filename,
-            "vector_count": vector_count
-        }), 200 # 200 OK for successful upload and processing
-
     except Exception as e:
-        logger.error(f"Unexpected error processing upload for filename '{filename}': {e}", exc_info=True)
-        # Clean up potentially saved file if an error occurred mid-process
-        if 'filepath' in locals() and os.path.exists(filepath):
-             try:
-                 os.remove(filepath)
-                 logger.info(f"Cleaned up file {filepath} after upload processing error.")
-             except OSError as rm_err:
-                 logger.error(f"Error attempting to clean up file {filepath} after error: {rm_err}")
-        return jsonify({"error": f"An unexpected server error occurred while processing the file: {type(e).__name__}. Please check server logs."}), 500
+        jobs.release_upload_job(job['job_id'])
+        logger.error(f"Error saving uploaded file '{filename}': {e}", exc_info=True)
+        return jsonify({"error": f"An unexpected server error occurred while saving the file: {type(e).__name__}. Please check server logs."}), 500
+
+    # Extraction, chunking, embedding and indexing run on the upload job pool
+    jobs.start_upload_job(job['job_id'], filepath, filename)
+    return jsonify({
+        "message": f"File '{filename}' uploaded. Processing in background.",
+        "filename": filename,
+        "job_id": job['job_id'],
+        "status_url": f"/jobs/{job['job_id']}",
+        "job": job
+    }), 202 # 202 Accepted: processing continues after the response
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job_status(job_id):
+    """Reports stage, percent and chunk counts of a background upload job."""
+    job = jobs.get_job(job_id)
+    if job is None:
+        return jsonify({"error": f"Job '{job_id}' not found (unknown or expired)."}), 404
+    return jsonify(job)
 
 
 @app.route('/analyze', methods=['POST'])
 def analyze_document():
     """Generates analysis (FAQ, Topics, Mindmap) for a selected document."""
     # --- Check AI readiness ---
-    if not app_ai_ready or not ai_core.llm:
+    if not _wait_ready(MODELS) or not ai_core.llm:
          logger.error("Analysis request failed: LLM component not initialized.")
          return jsonify({"error": "Analysis unavailable: AI model is not ready.", "thinking": None}), 503
 
@@ -412,29 +456,33 @@ def analyze_document():
         return jsonify({"error": f"Unexpected server error during analysis: {type(e).__name__}. Check logs.", "thinking": None}), 500
 
 
-@app.route('/chat', methods=['POST'])
-def chat():
-    """Handles chat interactions: RAG search, LLM synthesis, history saving."""
-    # logger.debug("Chat request received.") # Can be noisy
+def _validate_chat_request():
+    """Checks prerequisites and parses a chat request body.
+
+    The optional 'sources' field (list of filenames) restricts retrieval to those documents.
 
+    Returns:
+        tuple: (query, session_id, is_new_session, sources, None) on success, or
+               (None, None, None, None, (json_response, status_code)) on failure.
+    """
     # --- Check prerequisites ---
-    if not app_db_ready:
+    if not _wait_ready(DATABASE):
         logger.error("Chat request failed: Database not initialized.")
-        return jsonify({
+        return None, None, None, None, (jsonify({
             "error": "Chat unavailable: Database connection failed.",
             "answer": "Cannot process chat, the database is currently unavailable. Please try again later or contact support.",
             "thinking": None, "references": [], "session_id": None
-        }), 503 # Service Unavailable
+        }), 503) # Service Unavailable
 
-    if not app_ai_ready or not ai_core.llm or not ai_core.embeddings:
+    if not _wait_ready(MODELS) or not ai_core.llm or not ai_core.embeddings:
         logger.error("Chat request failed: AI components not initialized.")
-        return jsonify({
+        return None, None, None, None, (jsonify({
             "error": "Chat unavailable: AI components not ready.",
             "answer": "Cannot process chat, the AI components are not ready. Please ensure Ollama is running and models are available.",
             "thinking": None, "references": [], "session_id": None
-        }), 503 # Service Unavailable
+        }), 503) # Service Unavailable
 
-    if not app_vector_store_ready and config.RAG_CHUNK_K > 0: # Only warn if RAG is expected/configured
+    if config.RAG_CHUNK_K > 0 and not _rag_available(): # Only warn if RAG is expected/configured
         logger.warning("Chat request proceeding, but vector store is not loaded/ready. RAG context will be empty or unavailable.")
         # Allow chat to proceed using only LLM's general knowledge if RAG fails/is skipped
 
@@ -442,16 +490,23 @@ def chat():
     data = request.get_json()
     if not data:
         logger.warning("Chat request received without JSON body.")
-        return jsonify({"error": "Invalid request: JSON body required."}), 400
+        return None, None, None, None, (jsonify({"error": "Invalid request: JSON body required."}), 400)
 
     query = data.get('query')
     session_id = data.get('session_id') # Get session ID from request
 
     if not query or not isinstance(query, str) or not query.strip():
         logger.warning("Chat request received with empty or invalid query.")
-        return jsonify({"error": "Query cannot be empty"}), 400
+        return None, None, None, None, (jsonify({"error": "Query cannot be empty"}), 400)
     query = query.strip()
 
+    sources = data.get('sources') or None
+    if sources is not None:
+        if not isinstance(sources, list) or not all(isinstance(src, str) and src.strip() for src in sources):
+            logger.warning("Chat request received with invalid 'sources' (expected a list of filenames).")
+            return None, None, None, None, (jsonify({"error": "Invalid request: 'sources' must be a list of filenames."}), 400)
+        sources = sorted({src.strip() for src in sources})
+
     # --- Session Management ---
     is_new_session = False
     if session_id:
@@ -468,11 +523,11 @@ def chat():
         is_new_session = True
         logger.info(f"New chat session started. ID: {session_id}")
 
-    # Log entry with session info
-    logger.info(f"Processing chat query (Session: {session_id}, New: {is_new_session}): '{query[:150]}...'")
+    return query, session_id, is_new_session, sources, None
 
-    # --- Log User Message ---
-    user_message_id = None
+
+def _save_user_message(session_id: str, query: str):
+    """Logs the user's message to history; failures are logged but do not stop the chat."""
     try:
         # Pass None for references and thinking for user messages
         user_message_id = database.save_message(session_id, 'user', query, None, None)
@@ -483,35 +538,116 @@ def chat():
          # If saving user message fails critically, maybe return error? Or proceed?
          # Proceeding might lead to incomplete history. Let's log and proceed.
          logger.error(f"Database error occurred while saving user message for session {session_id}: {db_err}", exc_info=True)
-         # Optionally return 500 here if saving user message is critical
-         # return jsonify({"error": "Database error saving your message.", "answer": "Failed to record your message due to a database issue.", "thinking": None, "references": [], "session_id": session_id}), 500
 
 
+def _retrieve_chat_context(query: str, session_id: str, sources: list[str] | None = None) -> tuple[str, dict]:
+    """Runs RAG search for a chat query (if enabled and ready), optionally limited to `sources`.
+
+    Returns:
+        tuple[str, dict]: (context_text for the prompt, context_docs_map for citations)
+    """
+    context_text = "No specific document context was retrieved or used for this response." # Default if RAG skipped/failed
+    context_docs_map = {} # Map for citation details {1: {'source':.., 'chunk_index':.., 'content':...}}
+    rag_available = config.RAG_CHUNK_K > 0 and _rag_available()
+    if rag_available:
+        logger.debug(f"Performing RAG search (session: {session_id}, sources: {sources or 'all'})...")
+        # ai_core.perform_rag_search returns: context_docs, formatted_context_text, context_docs_map
+        context_docs, context_text, context_docs_map = ai_core.perform_rag_search(query, sources=sources)
+        if context_docs:
+             logger.info(f"RAG search completed. Found {len(context_docs)} unique context chunks for session {session_id}.")
+        else:
+             logger.info(f"RAG search completed but found no relevant chunks for session {session_id}.")
+             context_text = "No relevant document sections found for your query." # More specific message
+    elif config.RAG_CHUNK_K > 0:
+         logger.warning(f"Skipping RAG search for session {session_id}: Vector store not ready.")
+         context_text = "Knowledge base access is currently unavailable; providing general answer."
+    else: # RAG_CHUNK_K <= 0
+         logger.debug(f"Skipping RAG search for session {session_id}: RAG is disabled (RAG_CHUNK_K <= 0).")
+         context_text = "Document search is disabled; providing general answer."
+    return context_text, context_docs_map
+
+
+def _lookup_cached_answer(query: str, session_id: str, sources: list[str] | None = None) -> tuple[dict | None, tuple | None]:
+    """Checks the answer cache for a near-identical earlier question over the same chunks.
+
+    Returns:
+        tuple: (cached answer dict or None, ticket for caching a fresh answer or None)
+    """
+    if not _rag_available():
+        return None, None
+    cached, ticket = ai_core.lookup_cached_answer(query, sources)
+    if cached:
+        logger.info(f"Answer cache hit for session {session_id}. Skipping retrieval and synthesis.")
+    return cached, ticket
+
+
+def _is_error_answer(bot_answer: str) -> bool:
+    """True if the synthesized answer is an error message rather than a real answer."""
+    return bot_answer.startswith("Error:") or "[AI Response Processing Error:" in bot_answer or "encountered an error" in bot_answer.lower()
+
+
+def _extract_chat_references(bot_answer: str, context_docs_map: dict, session_id: str) -> list:
+    """Extracts cited references unless RAG gave no context or the answer is an error message."""
+    references = []
+    # Check if context_docs_map has items and bot_answer doesn't indicate a primary error
+    if context_docs_map and not _is_error_answer(bot_answer):
+        logger.debug(f"Extracting references from bot answer (session: {session_id})...")
+        references = utils.extract_references(bot_answer, context_docs_map)
+        if references:
+            logger.info(f"Extracted {len(references)} unique references for session {session_id}.")
+        # else: logger.debug("No citation markers found in the bot answer.")
+    else:
+         logger.debug(f"Skipping reference extraction for session {session_id}: No context map provided or bot answer indicates an error.")
+    return references
+
+
+def _save_bot_message(session_id: str, bot_answer: str, references: list, thinking_content: str | None):
+    """Logs the bot response (including thinking and references); failures are only logged."""
+    try:
+        # Save the final answer, parsed references (JSON), and thinking content
+        bot_message_id = database.save_message(
+            session_id, 'bot', bot_answer, references, thinking_content # Pass thinking here
+        )
+        if not bot_message_id:
+             logger.error(f"Failed to save bot response to database for session {session_id}.")
+    except Exception as db_err:
+         # Log error but don't fail the user request if only DB saving fails
+         logger.error(f"Database error occurred while saving bot response for session {session_id}: {db_err}", exc_info=True)
+
+
+@app.route('/chat', methods=['POST'])
+def chat():
+    """Handles chat interactions: RAG search, LLM synthesis, history saving."""
+    # logger.debug("Chat request received.") # Can be noisy
+    query, session_id, is_new_session, sources, error_response = _validate_chat_request()
+    if error_response:
+        return error_response
+
+    # Log entry with session info
+    logger.info(f"Processing chat query (Session: {session_id}, New: {is_new_session}): '{query[:150]}...'")
+
+    # --- Log User Message ---
+    _save_user_message(session_id, query)
+
     # --- RAG + Synthesis Pipeline ---
     bot_answer = "Sorry, I encountered an issue processing your request." # Default error response
     references = []
     thinking_content = None # Initialize thinking content
 
     try:
-        # 1. Perform RAG Search (if vector store ready and RAG enabled)
-        context_text = "No specific document context was retrieved or used for this response." # Default if RAG skipped/failed
-        context_docs_map = {} # Map for citation details {1: {'source':.., 'chunk_index':.., 'content':...}}
-        if app_vector_store_ready and config.RAG_CHUNK_K > 0:
-            logger.debug(f"Performing RAG search (session: {session_id})...")
-            # ai_core.perform_rag_search returns: context_docs, formatted_context_text, context_docs_map
-            context_docs, context_text, context_docs_map = ai_core.perform_rag_search(query)
-            if context_docs:
-                 logger.info(f"RAG search completed. Found {len(context_docs)} unique context chunks for session {session_id}.")
-            else:
-                 logger.info(f"RAG search completed but found no relevant chunks for session {session_id}.")
-                 context_text = "No relevant document sections found for your query." # More specific message
-        elif not app_vector_store_ready and config.RAG_CHUNK_K > 0:
-             logger.warning(f"Skipping RAG search for session {session_id}: Vector store not ready.")
-             context_text = "Knowledge base access is currently unavailable; providing general answer."
-        else: # RAG_CHUNK_K <= 0
-             logger.debug(f"Skipping RAG search for session {session_id}: RAG is disabled (RAG_CHUNK_K <= 0).")
-             context_text = "Document search is disabled; providing general answer."
+        # 0. Reuse the answer to a near-identical earlier question (same chunks, unchanged index)
+        cached, cache_ticket = _lookup_cached_answer(query, session_id, sources)
+        if cached:
+            _save_bot_message(session_id, cached["answer"], cached["references"], cached["thinking"])
+            return jsonify({
+                "answer": cached["answer"],
+                "session_id": session_id,
+                "references": cached["references"],
+                "thinking": cached["thinking"]
+            }), 200
 
+        # 1. Perform RAG Search (if vector store ready and RAG enabled)
+        context_text, context_docs_map = _retrieve_chat_context(query, session_id, sources)
 
         # 2. Synthesize Response using LLM (ai_core function now returns answer, thinking)
         logger.debug(f"Synthesizing chat response (session: {session_id})...")
@@ -520,32 +656,13 @@ def chat():
         if bot_answer.startswith("Error:") or "encountered an error" in bot_answer:
              logger.error(f"LLM Synthesis failed for session {session_id}. Response: {bot_answer}")
 
-
         # 3. Extract References (only if RAG provided context and answer is not an error message)
-        # Check if context_docs_map has items and bot_answer doesn't indicate a primary error
-        if context_docs_map and not (bot_answer.startswith("Error:") or "[AI Response Processing Error:" in bot_answer or "encountered an error" in bot_answer.lower()):
-            logger.debug(f"Extracting references from bot answer (session: {session_id})...")
-            references = utils.extract_references(bot_answer, context_docs_map)
-            if references:
-                logger.info(f"Extracted {len(references)} unique references for session {session_id}.")
-            # else: logger.debug("No citation markers found in the bot answer.")
-        else:
-             logger.debug(f"Skipping reference extraction for session {session_id}: No context map provided or bot answer indicates an error.")
-
+        references = _extract_chat_references(bot_answer, context_docs_map, session_id)
+        if not _is_error_answer(bot_answer):
+            ai_core.store_cached_answer(cache_ticket, bot_answer, thinking_content, references)
 
         # --- Log Bot Response (including thinking and references) ---
-        bot_message_id = None
-        try:
-            # Save the final answer, parsed references (JSON), and thinking content
-            bot_message_id = database.save_message(
-                session_id, 'bot', bot_answer, references, thinking_content # Pass thinking here
-            )
-            if not bot_message_id:
-                 logger.error(f"Failed to save bot response to database for session {session_id}.")
-        except Exception as db_err:
-             # Log error but don't fail the user request if only DB saving fails
-             logger.error(f"Database error occurred while saving bot response for session {session_id}: {db_err}", exc_info=True)
-
+        _save_bot_message(session_id, bot_answer, references, thinking_content)
 
         # --- Return Response Payload ---
         response_payload = {
@@ -580,6 +697,85 @@ def chat():
         }), 500
 
 
+def _sse_event(event: str, data: dict) -> str:
+    """Formats one Server-Sent Event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    """Streaming variant of /chat using Server-Sent Events.
+
+    Events: 'session' (session_id), 'status' (retrieval/generation stage),
+    'thinking' and 'answer' (incremental text), 'done' (final parsed answer, thinking,
+    references) or 'error'. The completed message is saved to history at stream end.
+    """
+    query, session_id, is_new_session, sources, error_response = _validate_chat_request()
+    if error_response:
+        return error_response
+
+    logger.info(f"Processing streaming chat query (Session: {session_id}, New: {is_new_session}): '{query[:150]}...'")
+    _save_user_message(session_id, query)
+
+    def generate():
+        full_response_parts = []
+        try:
+            yield _sse_event("session", {"session_id": session_id})
+            cached, cache_ticket = _lookup_cached_answer(query, session_id, sources)
+            if cached:
+                _save_bot_message(session_id, cached["answer"], cached["references"], cached["thinking"])
+                yield _sse_event("answer", {"text": cached["answer"]})
+                yield _sse_event("done", {
+                    "answer": cached["answer"],
+                    "thinking": cached["thinking"],
+                    "references": cached["references"],
+                    "session_id": session_id
+                })
+                return
+            yield _sse_event("status", {"stage": "retrieving"})
+            context_text, context_docs_map = _retrieve_chat_context(query, session_id, sources)
+
+            yield _sse_event("status", {"stage": "generating"})
+            splitter = utils.ThinkingStreamSplitter()
+            for chunk in ai_core.stream_chat_response(query, context_text):
+                full_response_parts.append(chunk)
+                for kind, text in splitter.feed(chunk):
+                    yield _sse_event(kind, {"text": text})
+            for kind, text in splitter.flush():
+                yield _sse_event(kind, {"text": text})
+
+            # Final parse is authoritative (same rules as the blocking /chat route)
+            bot_answer, thinking_content = ai_core.finalize_chat_response("".join(full_response_parts))
+            references = _extract_chat_references(bot_answer, context_docs_map, session_id)
+            _save_bot_message(session_id, bot_answer, references, thinking_content)
+            if not _is_error_answer(bot_answer):
+                ai_core.store_cached_answer(cache_ticket, bot_answer, thinking_content, references)
+            yield _sse_event("done", {
+                "answer": bot_answer,
+                "thinking": thinking_content,
+                "references": references,
+                "session_id": session_id
+            })
+        except GeneratorExit:
+            # Client disconnected; keep whatever was generated so history stays consistent
+            logger.warning(f"Client disconnected from chat stream (session {session_id}).")
+            if full_response_parts:
+                bot_answer, thinking_content = ai_core.finalize_chat_response("".join(full_response_parts))
+                _save_bot_message(session_id, bot_answer, [], thinking_content)
+            raise
+        except Exception as e:
+            logger.error(f"Unexpected error during streaming chat for session {session_id}: {e}", exc_info=True)
+            error_message = f"Sorry, an unexpected server error occurred ({type(e).__name__}). Please try again or contact support if the issue persists."
+            _save_bot_message(session_id, error_message, None, f"Unexpected error in /chat/stream route: {type(e).__name__}: {str(e)}")
+            yield _sse_event("error", {"error": "Unexpected server error.", "answer": error_message, "session_id": session_id})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'} # Disable proxy buffering
+    )
+
+
 @app.route('/history', methods=['GET'])
 def get_history():
     """Retrieves chat history for a given session ID."""
@@ -587,7 +783,7 @@ def get_history():
     # logger.debug(f"History request for session: {session_id}")
 
     # --- Prerequisite Checks ---
-    if not app_db_ready:
+    if not _wait_ready(DATABASE):
          logger.error("History request failed: Database not initialized.")
          return jsonify({"error": "History unavailable: Database connection failed."}), 503
 
@@ -625,10 +821,8 @@ def get_history():
 
 # --- Main Execution ---
 if __name__ == '__main__':
-    # Ensure initialization runs when script is executed directly
-    # (e.g., `python app.py`), not just before first request via WSGI
-    if not hasattr(app, 'initialized') or not app.initialized:
-        initialize_app()
+    # Start warming up before the server starts listening
+    initialize_app()
 
     try:
         # Read port from environment variable or default to 5000
@@ -648,19 +842,16 @@ if __name__ == '__main__':
     logger.info(f"Configuration:")
     logger.info(f"  - Host: {host}")
     logger.info(f"  - Port: {port}")
-    logger.info(f"  - Ollama URL: {config.OLLAMA_BASE_URL}")
+    logger.info(f"  - Ollama URLs: {', '.join(config.OLLAMA_BASE_URLS)}")
     logger.info(f"  - LLM Model: {config.OLLAMA_MODEL}")
     logger.info(f"  - Embedding Model: {config.OLLAMA_EMBED_MODEL}")
     logger.info(f"Access URLs:")
     logger.info(f"  - Local: http://127.0.0.1:{port} or http://localhost:{port}")
     logger.info(f"  - Network: http://<YOUR_MACHINE_IP>:{port} (Find your IP using 'ip addr' or 'ifconfig')")
 
-    # Log the final status after initialization attempt
-    db_status = 'Ready' if app_db_ready else 'Failed/Unavailable'
-    ai_status = 'Ready' if app_ai_ready else 'Failed/Unavailable'
-    index_status = 'Loaded/Ready' if app_vector_store_ready else ('Not Found/Empty' if app_ai_ready else 'Not Loaded (AI Failed)')
-    cache_status = f"{len(ai_core.document_texts_cache)} docs" if app_doc_cache_loaded else "Failed/Empty"
-    logger.info(f"Component Status: DB={db_status} | AI={ai_status} | Index={index_status} | DocCache={cache_status}")
+    # Components keep warming up while the server starts; their progress is logged and shown by /status
+    component_status = ", ".join(f"{name}={snapshot['state']}" for name, snapshot in warmup.stats().items())
+    logger.info(f"Component Status (warm-up continues in background): {component_status}")
     logger.info("Press Ctrl+C to stop the server.")
 
     # Use Waitress for a production-grade WSGI server
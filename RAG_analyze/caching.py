@@ -0,0 +1,245 @@
+# --- START OF FILE caching.py ---
+
+# Thread-safe in-memory caches shared by the backend modules.
+import sys
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def default_sizeof(value: Any) -> int:
+    """Approximate resident size of a cached value in bytes."""
+    return sys.getsizeof(value)
+
+
+class LRUCache:
+    """A byte-budgeted LRU cache with optional lazy loading and hit/miss/eviction statistics.
+
+    Entries are evicted least-recently-used first whenever the summed size of resident
+    values exceeds `max_bytes`. A single value larger than the budget is never cached.
+    """
+
+    def __init__(self, name: str, max_bytes: int, size_fn: Callable[[Any], int] = default_sizeof):
+        self.name = name
+        self.max_bytes = max(int(max_bytes), 0)
+        self._size_fn = size_fn
+        self._entries: OrderedDict[Hashable, tuple[Any, int]] = OrderedDict() # key -> (value, size)
+        self._lock = threading.RLock()
+        self._resident_bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Returns the cached value (marking it most recently used) or `default`."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any) -> bool:
+        """Inserts or replaces a value, evicting older entries to stay within budget.
+
+        Returns:
+            bool: True if the value is now cached, False if it alone exceeds the budget.
+        """
+        size = self._size_fn(value)
+        with self._lock:
+            self._remove(key)
+            if size > self.max_bytes:
+                logger.debug(f"[{self.name}] Not caching '{key}': {size} bytes exceeds budget of {self.max_bytes}.")
+                return False
+            self._entries[key] = (value, size)
+            self._resident_bytes += size
+            while self._resident_bytes > self.max_bytes and self._entries:
+                old_key, (_, old_size) = self._entries.popitem(last=False)
+                self._resident_bytes -= old_size
+                self._evictions += 1
+                logger.debug(f"[{self.name}] Evicted '{old_key}' ({old_size} bytes).")
+            return True
+
+    def get_or_load(self, key: Hashable, loader: Callable[[Hashable], Any]) -> Any:
+        """Returns the cached value, calling `loader(key)` and caching its result on a miss.
+
+        The loader runs outside the lock; a None result is returned but not cached.
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+        value = loader(key)
+        if value is not None:
+            self.put(key, value)
+        return value
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """Removes an entry and returns its value (or `default`)."""
+        with self._lock:
+            entry = self._remove(key)
+            return entry[0] if entry else default
+
+    def clear(self):
+        """Drops all entries (statistics are kept)."""
+        with self._lock:
+            self._entries.clear()
+            self._resident_bytes = 0
+
+    def _remove(self, key: Hashable) -> tuple[Any, int] | None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._resident_bytes -= entry[1]
+        return entry
+
+    def stats(self) -> dict:
+        """Returns a snapshot of cache statistics suitable for the /status endpoint."""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "resident_bytes": self._resident_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else None,
+                "evictions": self._evictions,
+            }
+
+
+class SemanticCache:
+    """An entry-bounded LRU cache with a TTL, looked up by an exact key plus a query embedding.
+
+    Among the entries stored under the same key, a lookup returns the one whose vector is most
+    similar (cosine) to the query vector, if that similarity reaches `threshold`. Entries belong
+    to a `generation` supplied by the caller (e.g. a counter bumped on every index change): a
+    newer generation drops all entries, and lookups or inserts for an older one are ignored.
+    """
+
+    def __init__(self, name: str, max_entries: int, ttl_seconds: float, threshold: float):
+        self.name = name
+        self.max_entries = max(int(max_entries), 0)
+        self.ttl_seconds = ttl_seconds
+        self.threshold = threshold
+        self._entries: OrderedDict[int, tuple[Hashable, np.ndarray, Any, float]] = OrderedDict() # id -> (key, unit vector, value, expires_at)
+        self._buckets: dict[Hashable, set[int]] = {} # key -> entry ids
+        self._lock = threading.Lock()
+        self._next_id = 0
+        self._generation = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._invalidations = 0
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def get(self, key: Hashable, vector: np.ndarray, generation: int) -> Any:
+        """Returns the value of the closest entry under `key` (marking it most recently used), or None."""
+        unit = self._unit(vector)
+        with self._lock:
+            if not self._sync_generation(generation):
+                self._misses += 1
+                return None
+            now = time.monotonic()
+            entry_ids = []
+            for entry_id in list(self._buckets.get(key, ())):
+                if self._entries[entry_id][3] <= now:
+                    self._remove(entry_id)
+                    self._expirations += 1
+                else:
+                    entry_ids.append(entry_id)
+            if entry_ids:
+                similarities = np.stack([self._entries[entry_id][1] for entry_id in entry_ids]) @ unit
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    self._entries.move_to_end(entry_ids[best])
+                    self._hits += 1
+                    return self._entries[entry_ids[best]][2]
+            self._misses += 1
+            return None
+
+    def put(self, key: Hashable, vector: np.ndarray, value: Any, generation: int) -> bool:
+        """Stores a value, evicting least-recently-used entries beyond `max_entries`.
+
+        Returns:
+            bool: True if stored, False if the cache is disabled or `generation` is outdated.
+        """
+        if self.max_entries <= 0:
+            return False
+        unit = self._unit(vector)
+        expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds > 0 else float('inf')
+        with self._lock:
+            if not self._sync_generation(generation):
+                return False
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (key, unit, value, expires_at)
+            self._buckets.setdefault(key, set()).add(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self._evictions += 1
+            return True
+
+    def clear(self):
+        """Drops all entries (statistics are kept)."""
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+
+    @staticmethod
+    def _unit(vector: np.ndarray) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32).ravel()
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    def _sync_generation(self, generation: int) -> bool:
+        """Drops all entries if `generation` is newer. Returns False if it is older (stale caller)."""
+        if generation > self._generation:
+            if self._entries:
+                logger.debug(f"[{self.name}] Generation {self._generation} -> {generation}: dropping {len(self._entries)} entries.")
+                self._invalidations += 1
+            self._entries.clear()
+            self._buckets.clear()
+            self._generation = generation
+        return generation == self._generation
+
+    def _remove(self, entry_id: int):
+        key = self._entries.pop(entry_id)[0]
+        bucket = self._buckets[key]
+        bucket.discard(entry_id)
+        if not bucket:
+            del self._buckets[key]
+
+    def stats(self) -> dict:
+        """Returns a snapshot of cache statistics suitable for the /status endpoint."""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "generation": self._generation,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else None,
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+                "invalidations": self._invalidations,
+            }
+
+# --- END OF FILE caching.py ---
@@ -0,0 +1,415 @@
+# --- START OF FILE chunk_store.py ---
+
+# Columnar on-disk docstore for the FAISS vector store.
+# A snapshot is a single file, FAISS_FOLDER/chunks.bin, holding for index positions 0..n-1:
+#   - doc ids as a fixed-width byte array, plus a sorted copy and its permutation, so an
+#     id -> position lookup is a binary search instead of a dict built at startup,
+#   - a source -> [start, end) position-range index (chunks of one PDF are added contiguously),
+#     used to restrict searches to selected files,
+#   - chunk text + metadata in compressed blocks of CHUNK_STORE_BLOCK_SIZE chunks (zstd if the
+#     optional `zstandard` package is installed, zlib otherwise).
+# The file is memory-mapped read-only, so worker processes share the page cache, and blocks are
+# decompressed lazily per search hit (kept in a small LRU). Chunks added after the snapshot are
+# held in memory (they are also in the FAISS write-ahead log) until the next snapshot.
+#
+# Layout: magic (8) | header length (uint64) | header JSON | ids | sorted ids | sort order (int64)
+#         | block offsets (int64, n_blocks + 1) | compressed blocks. Sections are 8-byte aligned.
+import os
+import json
+import mmap
+import zlib
+import struct
+import logging
+import tempfile
+from collections.abc import MutableMapping
+from typing import Iterable, Iterator
+import numpy as np
+from langchain.docstore.document import Document
+from langchain_community.docstore.base import AddableMixin, Docstore
+from config import CHUNK_STORE_BLOCK_SIZE, CHUNK_BLOCK_CACHE_MB
+from caching import LRUCache
+
+try:
+    import zstandard
+except ImportError: # Optional; zlib is used instead
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+CHUNKS_FILENAME = "chunks.bin"
+_MAGIC = b"CHUNKS01"
+_LENGTH = struct.Struct("<Q")
+_ARRAY_SECTIONS = ("ids_offset", "sorted_ids_offset", "order_offset", "block_offsets_offset")
+
+
+def _compress(data: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    return zlib.compress(data, 6)
+
+
+def _decompress(data: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("The chunk store is zstd-compressed but the 'zstandard' package is not installed.")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+def _pad8(length: int) -> int:
+    return -length % 8
+
+
+def _merge_ranges(positions: list[int]) -> list[list[int]]:
+    """Collapses ascending positions into [start, end) ranges."""
+    ranges: list[list[int]] = []
+    for position in positions:
+        if ranges and ranges[-1][1] == position:
+            ranges[-1][1] = position + 1
+        else:
+            ranges.append([position, position + 1])
+    return ranges
+
+
+class ChunkStore(Docstore, AddableMixin):
+    """LangChain docstore over a memory-mapped chunks.bin snapshot plus an in-memory overlay.
+
+    Also provides `index_map`, a mapping of index position -> docstore id over the same
+    data, to be used as the vector store's `index_to_docstore_id`.
+    """
+
+    def __init__(self, path: str | None):
+        self.path = path
+        self._base_count = 0
+        self._sources: dict[str, list[list[int]]] = {} # source -> snapshot position ranges
+        self._added: dict[str, Document] = {} # doc_id -> Document added since the snapshot
+        self._added_positions: dict[int, str] = {} # position -> doc_id added since the snapshot
+        self._added_sources: dict[str, set[int]] = {} # source -> positions added since the snapshot
+        self._deleted: set[str] = set() # Snapshot doc_ids deleted since the snapshot
+        self._removed_positions: set[int] = set() # Snapshot positions unmapped since the snapshot
+        self._blocks = LRUCache("chunk_blocks", CHUNK_BLOCK_CACHE_MB * 1024 * 1024, size_fn=lambda entry: entry[1])
+        if path:
+            self._open(path)
+        self.index_map = PositionMap(self)
+
+    def _open(self, path: str):
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(_MAGIC)] != _MAGIC:
+            raise ValueError(f"{path} is not a chunk store file.")
+        (header_length,) = _LENGTH.unpack_from(self._mmap, len(_MAGIC))
+        header_start = len(_MAGIC) + _LENGTH.size
+        header = json.loads(self._mmap[header_start:header_start + header_length])
+        count = self._base_count = header['count']
+        self._block_size = header['block_size']
+        self._codec = header['codec']
+        self._sources = header['sources']
+        id_dtype = np.dtype(f"S{header['id_width']}")
+        self._ids = np.frombuffer(self._mmap, dtype=id_dtype, count=count, offset=header['ids_offset'])
+        self._sorted_ids = np.frombuffer(self._mmap, dtype=id_dtype, count=count, offset=header['sorted_ids_offset'])
+        self._order = np.frombuffer(self._mmap, dtype=np.int64, count=count, offset=header['order_offset'])
+        self._block_offsets = np.frombuffer(self._mmap, dtype=np.int64, count=header['n_blocks'] + 1, offset=header['block_offsets_offset'])
+        self._blocks_start = header['blocks_offset']
+
+    # --- Snapshot access ---
+
+    def _block(self, block_no: int) -> list:
+        """Decompressed [[page_content, metadata], ...] of one block (LRU cached)."""
+        entry = self._blocks.get(block_no)
+        if entry is None:
+            start = self._blocks_start + int(self._block_offsets[block_no])
+            end = self._blocks_start + int(self._block_offsets[block_no + 1])
+            raw = _decompress(self._mmap[start:end], self._codec)
+            entry = (json.loads(raw), len(raw))
+            self._blocks.put(block_no, entry)
+        return entry[0]
+
+    def _snapshot_document(self, position: int) -> Document:
+        page_content, metadata = self._block(position // self._block_size)[position % self._block_size]
+        return Document(page_content=page_content, metadata=metadata)
+
+    def _snapshot_id(self, position: int) -> str:
+        return self._ids[position].decode('utf-8')
+
+    def _snapshot_positions(self, doc_ids: list[str]) -> dict[str, int]:
+        """Snapshot positions of stored documents by id (binary search over the sorted id column)."""
+        if not self._base_count or not doc_ids:
+            return {}
+        width = self._sorted_ids.dtype.itemsize
+        encoded = [doc_id.encode('utf-8') for doc_id in doc_ids]
+        keys = np.array([key if len(key) <= width else b"" for key in encoded], dtype=self._sorted_ids.dtype)
+        slots = np.minimum(np.searchsorted(self._sorted_ids, keys), self._base_count - 1)
+        found = {}
+        for doc_id, key, slot in zip(doc_ids, encoded, slots):
+            if self._sorted_ids[slot] == key and doc_id not in self._deleted:
+                found[doc_id] = int(self._order[slot])
+        return found
+
+    # --- Docstore interface ---
+
+    def __len__(self) -> int:
+        return self._base_count - len(self._deleted) + len(self._added)
+
+    def search(self, search: str) -> Document | str:
+        """Returns the Document stored under `search`, or an error string (LangChain convention)."""
+        found = self.search_many([search])
+        return found.get(search, f"ID {search} not found.")
+
+    def search_many(self, ids: list[str]) -> dict[str, Document]:
+        """Looks up several documents. Missing ids are absent from the result."""
+        found = {doc_id: self._added[doc_id] for doc_id in ids if doc_id in self._added}
+        pending = [doc_id for doc_id in dict.fromkeys(ids) if doc_id not in found]
+        for doc_id, position in self._snapshot_positions(pending).items():
+            found[doc_id] = self._snapshot_document(position)
+        return found
+
+    def positions_of_ids(self, ids: list[str]) -> dict[str, int]:
+        """Current index positions of the given doc ids (ids without a mapped position are absent)."""
+        wanted = set(ids)
+        found = {doc_id: position for position, doc_id in self._added_positions.items() if doc_id in wanted}
+        for doc_id, position in self._snapshot_positions([doc_id for doc_id in wanted if doc_id not in found]).items():
+            if position not in self._removed_positions:
+                found[doc_id] = position
+        return found
+
+    def get_by_positions(self, positions: Iterable[int]) -> dict[int, Document]:
+        """Documents at the given index positions (unmapped positions are absent), no id lookup."""
+        found = {}
+        for position in positions:
+            position = int(position)
+            if position in self._added_positions:
+                found[position] = self._added[self._added_positions[position]]
+            elif 0 <= position < self._base_count and position not in self._removed_positions \
+                    and self._snapshot_id(position) not in self._deleted:
+                found[position] = self._snapshot_document(position)
+        return found
+
+    def existing_ids(self, ids: list[str]) -> set[str]:
+        """Subset of `ids` that are stored."""
+        existing = {doc_id for doc_id in ids if doc_id in self._added}
+        existing.update(self._snapshot_positions([doc_id for doc_id in ids if doc_id not in existing]))
+        return existing
+
+    def add(self, texts: dict[str, Document]) -> None:
+        """Adds documents to the in-memory overlay."""
+        overlapping = self.existing_ids(list(texts))
+        if overlapping:
+            raise ValueError(f"Tried to add ids that already exist: {overlapping}")
+        self._added.update(texts)
+
+    def delete(self, ids: list) -> None:
+        """Deletes documents by id."""
+        missing = set(ids) - self.existing_ids(list(ids))
+        if missing:
+            raise ValueError(f"Tried to delete ids that do not exist: {missing}")
+        for doc_id in ids:
+            if self._added.pop(doc_id, None) is None:
+                self._deleted.add(doc_id)
+
+    # --- Metadata filtering ---
+
+    def sources(self) -> set[str]:
+        """Distinct 'source' metadata values of all stored chunks."""
+        sources = {source for source, positions in self._added_sources.items() if positions}
+        removed = np.fromiter(self._removed_positions, dtype=np.int64, count=len(self._removed_positions))
+        removed.sort()
+        for source, ranges in self._sources.items():
+            # A source is gone once every position in its ranges has been unmapped
+            size = sum(end - start for start, end in ranges)
+            unmapped = sum(int(np.searchsorted(removed, end) - np.searchsorted(removed, start)) for start, end in ranges)
+            if unmapped < size:
+                sources.add(source)
+        return sources
+
+    def positions_for_sources(self, sources: Iterable[str]) -> np.ndarray:
+        """Sorted index positions (int64) of the chunks of the given source files."""
+        parts = []
+        for source in set(sources):
+            parts.extend(np.arange(start, end, dtype=np.int64) for start, end in self._sources.get(source, ()))
+            if self._added_sources.get(source):
+                parts.append(np.fromiter(self._added_sources[source], dtype=np.int64))
+        if not parts:
+            return np.zeros(0, dtype=np.int64)
+        positions = np.unique(np.concatenate(parts))
+        stale = [p for p in self._removed_positions if p not in self._added_positions]
+        if stale:
+            positions = positions[~np.isin(positions, stale)]
+        return positions
+
+    def iter_documents(self, count: int) -> Iterator[tuple[int, str, Document]]:
+        """Yields (position, doc_id, Document) for positions 0..count-1 in order."""
+        for position in range(min(count, self._base_count)):
+            if position in self._removed_positions or position in self._added_positions:
+                continue # Unmapped or re-assigned since the snapshot
+            doc_id = self._snapshot_id(position)
+            if doc_id not in self._deleted:
+                yield position, doc_id, self._snapshot_document(position)
+        for position in sorted(p for p in self._added_positions if p < count):
+            doc_id = self._added_positions[position]
+            yield position, doc_id, self._added[doc_id]
+
+    def _source_of_added(self, doc_id: str) -> str | None:
+        doc = self._added.get(doc_id)
+        return doc.metadata.get('source') if doc is not None else None
+
+
+class PositionMap(MutableMapping):
+    """index position -> docstore id, backed by a ChunkStore (used as `index_to_docstore_id`)."""
+
+    def __init__(self, store: ChunkStore):
+        self._store = store
+
+    def __getitem__(self, position: int) -> str:
+        store = self._store
+        if position in store._added_positions:
+            return store._added_positions[position]
+        if position in store._removed_positions or not (0 <= position < store._base_count):
+            raise KeyError(position)
+        return store._snapshot_id(position)
+
+    def __setitem__(self, position: int, doc_id: str):
+        # A re-assigned snapshot position stays in _removed_positions; the overlay takes precedence
+        store = self._store
+        position = int(position)
+        store._added_positions[position] = doc_id
+        source = store._source_of_added(doc_id)
+        if source is not None:
+            store._added_sources.setdefault(source, set()).add(position)
+
+    def __delitem__(self, position: int):
+        store = self._store
+        if position in store._added_positions:
+            doc_id = store._added_positions.pop(position)
+            store._added_sources.get(store._source_of_added(doc_id), set()).discard(position)
+        elif 0 <= position < store._base_count and position not in store._removed_positions:
+            store._removed_positions.add(position)
+        else:
+            raise KeyError(position)
+
+    def __len__(self) -> int:
+        store = self._store
+        return store._base_count - len(store._removed_positions) + len(store._added_positions)
+
+    def __iter__(self) -> Iterator[int]:
+        store = self._store
+        for position in range(store._base_count):
+            if position not in store._removed_positions:
+                yield position
+        yield from sorted(store._added_positions)
+
+
+def positions_for_sources(docstore, index_to_docstore_id, sources: Iterable[str]) -> np.ndarray:
+    """Sorted index positions of the chunks of `sources`, for any docstore.
+
+    Uses the source -> range index of a ChunkStore; other docstores (legacy pickled
+    snapshots) fall back to scanning the mapping.
+    """
+    if isinstance(docstore, ChunkStore):
+        return docstore.positions_for_sources(sources)
+    wanted = set(sources)
+    documents = getattr(docstore, '_dict', {})
+    positions = [position for position, doc_id in index_to_docstore_id.items()
+                 if doc_id in documents and documents[doc_id].metadata.get('source') in wanted]
+    return np.asarray(sorted(positions), dtype=np.int64)
+
+
+def positions_for_ids(docstore, index_to_docstore_id, ids: list[str]) -> dict[str, int]:
+    """doc id -> current index position for any docstore (binary search for a ChunkStore)."""
+    if isinstance(docstore, ChunkStore):
+        return docstore.positions_of_ids(ids)
+    wanted = set(ids)
+    return {doc_id: position for position, doc_id in index_to_docstore_id.items() if doc_id in wanted}
+
+
+def _iter_store_documents(docstore, index_to_docstore_id, count: int, positions=None) -> Iterator[tuple[int, str, Document]]:
+    """Yields (new position, doc_id, Document); `positions` selects and renumbers old positions."""
+    if positions is None and isinstance(docstore, ChunkStore):
+        yield from docstore.iter_documents(count)
+        return
+    for new_position, position in enumerate(range(count) if positions is None else positions):
+        position = int(position)
+        doc_id = index_to_docstore_id[position]
+        if isinstance(docstore, ChunkStore):
+            doc = docstore.get_by_positions((position,)).get(position)
+        else:
+            doc = docstore.search(doc_id)
+        yield new_position, doc_id, doc
+
+
+def write_snapshot(path: str, docstore, index_to_docstore_id, count: int, positions=None):
+    """Writes documents for index positions 0..count-1 to a new chunk store file at `path`.
+
+    Works from a ChunkStore or any LangChain docstore (e.g. InMemoryDocstore). If `positions`
+    (ascending) is given, only those positions are written, renumbered from 0 (`count` must be
+    their number); this drops deleted chunks. The file is written next to `path`, fsynced and
+    atomically renamed over it.
+    """
+    codec = "zstd" if zstandard is not None else "zlib"
+    ids: list[bytes] = []
+    source_positions: dict[str, list[int]] = {}
+    block_offsets = [0]
+    block: list = []
+
+    # Blocks are streamed to a scratch file; the header needs the final section sizes first
+    with tempfile.TemporaryFile(dir=os.path.dirname(path) or ".") as blocks_file:
+        def _flush_block():
+            compressed = _compress(json.dumps(block, ensure_ascii=False, default=str).encode('utf-8'), codec)
+            blocks_file.write(compressed)
+            block_offsets.append(block_offsets[-1] + len(compressed))
+            block.clear()
+
+        for position, doc_id, doc in _iter_store_documents(docstore, index_to_docstore_id, count, positions):
+            if not isinstance(doc, Document):
+                raise ValueError(f"Index position {position} (id {doc_id}) has no document in the docstore.")
+            if position != len(ids):
+                raise ValueError(f"Docstore snapshot has no document for index position {len(ids)}.")
+            ids.append(doc_id.encode('utf-8'))
+            source = doc.metadata.get('source')
+            if source is not None:
+                source_positions.setdefault(str(source), []).append(position)
+            block.append([doc.page_content, doc.metadata])
+            if len(block) >= CHUNK_STORE_BLOCK_SIZE:
+                _flush_block()
+        if block:
+            _flush_block()
+        if len(ids) != count:
+            raise ValueError(f"Docstore snapshot has {len(ids)} chunks for {count} index positions.")
+
+        id_width = max((len(doc_id) for doc_id in ids), default=1)
+        id_column = np.array(ids, dtype=f"S{id_width}")
+        order = np.argsort(id_column, kind='stable').astype(np.int64)
+        arrays = (id_column, id_column[order], order, np.asarray(block_offsets, dtype=np.int64))
+
+        header = {
+            "count": count, "id_width": id_width, "block_size": CHUNK_STORE_BLOCK_SIZE, "codec": codec,
+            "n_blocks": len(block_offsets) - 1,
+            "sources": {source: _merge_ranges(source_list) for source, source_list in source_positions.items()},
+        }
+        # Section offsets are stored in the header, so lay out until the header length is stable
+        header_bytes = b""
+        while True:
+            cursor = len(_MAGIC) + _LENGTH.size + len(header_bytes) + _pad8(len(header_bytes))
+            for key, array in zip(_ARRAY_SECTIONS, arrays):
+                header[key] = cursor
+                cursor += array.nbytes + _pad8(array.nbytes)
+            header["blocks_offset"] = cursor
+            encoded = json.dumps(header).encode('utf-8')
+            if len(encoded) == len(header_bytes):
+                header_bytes = encoded
+                break
+            header_bytes = encoded
+
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'wb') as out:
+            out.write(_MAGIC + _LENGTH.pack(len(header_bytes)) + header_bytes + b"\0" * _pad8(len(header_bytes)))
+            for array in arrays:
+                out.write(array.tobytes() + b"\0" * _pad8(array.nbytes))
+            blocks_file.seek(0)
+            while data := blocks_file.read(1 << 20):
+                out.write(data)
+            out.flush()
+            os.fsync(out.fileno())
+    os.replace(tmp_path, path)
+    logger.debug(f"Wrote chunk store {path}: {count} chunks in {len(block_offsets) - 1} {codec} blocks, {len(source_positions)} sources.")
+
+# --- END OF FILE chunk_store.py ---
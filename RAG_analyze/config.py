@@ -11,11 +11,27 @@ load_dotenv(dotenv_path=dotenv_path)
 
 # Ollama Configuration
 OLLAMA_BASE_URL = os.getenv('OLLAMA_BASE_URL', 'http://localhost:11434')
+# Comma-separated Ollama servers sharing the load (see ollama_pool.py); defaults to OLLAMA_BASE_URL alone
+OLLAMA_BASE_URLS = [url.strip() for url in os.getenv('OLLAMA_BASE_URLS', OLLAMA_BASE_URL).split(',') if url.strip()] or [OLLAMA_BASE_URL]
+OLLAMA_HEALTH_CHECK_INTERVAL = float(os.getenv('OLLAMA_HEALTH_CHECK_INTERVAL', 15)) # Seconds between backend health probes (multiple backends only)
+OLLAMA_HEALTH_CHECK_TIMEOUT = float(os.getenv('OLLAMA_HEALTH_CHECK_TIMEOUT', 5)) # Probe timeout in seconds
+OLLAMA_EJECT_AFTER_FAILURES = int(os.getenv('OLLAMA_EJECT_AFTER_FAILURES', 2)) # Consecutive connection failures before a backend is ejected
 OLLAMA_MODEL = os.getenv('OLLAMA_MODEL', 'deepseek-r1') # Default model for generation/analysis
 OLLAMA_EMBED_MODEL = os.getenv('OLLAMA_EMBED_MODEL', 'mxbai-embed-large') # Default model for embeddings
 # Optional: Increase Ollama request timeout (in seconds) if needed for long operations
 OLLAMA_REQUEST_TIMEOUT = int(os.getenv('OLLAMA_REQUEST_TIMEOUT', 180)) # Default 3 minutes
 
+# Ollama Gateway Configuration (shared scheduler for all LLM / embedding requests, see ollama_gateway.py)
+# Limits are per healthy backend, so capacity grows with the number of Ollama servers
+OLLAMA_MAX_CONCURRENCY = int(os.getenv('OLLAMA_MAX_CONCURRENCY', 4)) # Requests in flight per Ollama server (match the server's OLLAMA_NUM_PARALLEL)
+OLLAMA_CHAT_CONCURRENCY = int(os.getenv('OLLAMA_CHAT_CONCURRENCY', 4)) # Limit for interactive chat (synthesis, sub-queries, query embeddings)
+OLLAMA_ANALYSIS_CONCURRENCY = int(os.getenv('OLLAMA_ANALYSIS_CONCURRENCY', 2)) # Limit for document analysis
+OLLAMA_BULK_CONCURRENCY = int(os.getenv('OLLAMA_BULK_CONCURRENCY', 2)) # Limit for bulk embedding (uploads, corpus sync)
+OLLAMA_CHAT_QUEUE_TIMEOUT = float(os.getenv('OLLAMA_CHAT_QUEUE_TIMEOUT', 30)) # Max seconds a chat request waits for a slot (0 = no deadline)
+OLLAMA_ANALYSIS_QUEUE_TIMEOUT = float(os.getenv('OLLAMA_ANALYSIS_QUEUE_TIMEOUT', 600)) # Same, for analysis requests
+OLLAMA_BULK_QUEUE_TIMEOUT = float(os.getenv('OLLAMA_BULK_QUEUE_TIMEOUT', 0)) # Same, for bulk embedding (0 = wait as long as needed)
+OLLAMA_HTTP_KEEPALIVE_SECONDS = float(os.getenv('OLLAMA_HTTP_KEEPALIVE_SECONDS', 300)) # Idle time before a pooled HTTP connection is closed
+
 # Application Configuration Paths (relative to backend directory)
 backend_dir = os.path.dirname(__file__)
 FAISS_FOLDER = os.path.join(backend_dir, os.getenv('FAISS_FOLDER', 'faiss_store'))
@@ -23,17 +39,97 @@ UPLOAD_FOLDER = os.path.join(backend_dir, os.getenv('UPLOAD_FOLDER', 'uploads'))
 DATABASE_NAME = os.getenv('DATABASE_NAME', 'chat_history.db')
 DATABASE_PATH = os.path.join(backend_dir, DATABASE_NAME)
 DEFAULT_PDFS_FOLDER = os.path.join(backend_dir, os.getenv('DEFAULT_PDFS_FOLDER', 'default_pdfs'))
+TEXT_STORE_FOLDER = os.path.join(backend_dir, os.getenv('TEXT_STORE_FOLDER', 'text_store')) # Persisted extracted text, keyed by PDF content hash
+EMBED_CACHE_FOLDER = os.path.join(backend_dir, os.getenv('EMBED_CACHE_FOLDER', 'embedding_cache')) # Persisted chunk embeddings, keyed by model + text hash
 
 # File Handling
 ALLOWED_EXTENSIONS = {'pdf'}
 
+# Default PDF Folder Sync Configuration
+DEFAULT_PDFS_WATCH_ENABLED = os.getenv('DEFAULT_PDFS_WATCH_ENABLED', 'false').lower() in ('true', '1', 'yes') # Web app re-syncs DEFAULT_PDFS_FOLDER on changes (use instead of `default.py --watch`, not alongside)
+DEFAULT_PDFS_WATCH_INTERVAL = float(os.getenv('DEFAULT_PDFS_WATCH_INTERVAL', 10)) # Seconds between folder polls
+CORPUS_BUILD_WORKERS = int(os.getenv('CORPUS_BUILD_WORKERS', max((os.cpu_count() or 2) - 1, 1))) # Processes extracting/chunking PDFs during a folder sync (1 = inline)
+CORPUS_BUILD_QUEUE_DEPTH = int(os.getenv('CORPUS_BUILD_QUEUE_DEPTH', 0)) # Max files extracted ahead of the embedding stage (0 = 2 * workers)
+CORPUS_BUILD_CHECKPOINT_CHUNKS = int(os.getenv('CORPUS_BUILD_CHECKPOINT_CHUNKS', 5000)) # Chunks embedded and persisted per checkpoint
+
+# PDF Extraction Configuration
+PDF_EXTRACT_WORKERS = int(os.getenv('PDF_EXTRACT_WORKERS', max((os.cpu_count() or 2) - 1, 1))) # Process pool size for page-sharded extraction
+PDF_EXTRACT_PAGES_PER_SHARD = int(os.getenv('PDF_EXTRACT_PAGES_PER_SHARD', 50)) # Pages handed to one worker at a time
+PDF_EXTRACT_PARALLEL_MIN_PAGES = int(os.getenv('PDF_EXTRACT_PARALLEL_MIN_PAGES', 100)) # Smaller PDFs are extracted inline
+
+# Embedding Pipeline Configuration
+EMBED_BATCH_SIZE = int(os.getenv('EMBED_BATCH_SIZE', 64)) # Chunks per embed request to Ollama
+EMBED_MAX_IN_FLIGHT = int(os.getenv('EMBED_MAX_IN_FLIGHT', 4)) # Concurrent embed requests
+EMBED_MAX_RETRIES = int(os.getenv('EMBED_MAX_RETRIES', 3)) # Retries per failed batch
+EMBED_RETRY_BACKOFF_SECONDS = float(os.getenv('EMBED_RETRY_BACKOFF_SECONDS', 1.0)) # Initial backoff, doubled per retry
+EMBED_CACHE_ENABLED = os.getenv('EMBED_CACHE_ENABLED', 'true').lower() in ('true', '1', 'yes') # Reuse embeddings of identical chunks
+
+# FAISS Persistence Configuration
+FAISS_WAL_ENABLED = os.getenv('FAISS_WAL_ENABLED', 'true').lower() in ('true', '1', 'yes') # Append new vectors to a write-ahead log instead of rewriting the index
+FAISS_WAL_FSYNC = os.getenv('FAISS_WAL_FSYNC', 'true').lower() in ('true', '1', 'yes') # fsync every log append
+FAISS_MMAP_ENABLED = os.getenv('FAISS_MMAP_ENABLED', 'true').lower() in ('true', '1', 'yes') # Memory-map index.faiss read-only (shared page cache across worker processes)
+FAISS_WAL_COMPACT_MB = int(os.getenv('FAISS_WAL_COMPACT_MB', 256)) # Fold the log into a new snapshot once it grows past this size
+FAISS_TOMBSTONE_COMPACT_RATIO = float(os.getenv('FAISS_TOMBSTONE_COMPACT_RATIO', 0.2)) # Compact once deleted-but-indexed vectors exceed this fraction of the index
+CHUNK_STORE_BLOCK_SIZE = int(os.getenv('CHUNK_STORE_BLOCK_SIZE', 64)) # Chunks per compressed text block in chunks.bin
+CHUNK_BLOCK_CACHE_MB = int(os.getenv('CHUNK_BLOCK_CACHE_MB', 32)) # Memory budget for decompressed chunk blocks (LRU)
+
+# FAISS Index Type Configuration (applied/trained by default.py)
+FAISS_INDEX_TYPE = os.getenv('FAISS_INDEX_TYPE', 'Flat') # Flat (exact) | HNSW | IVFFlat | IVFPQ
+FAISS_ANN_MIN_VECTORS = int(os.getenv('FAISS_ANN_MIN_VECTORS', 10000)) # Below this size the exact Flat index is kept
+FAISS_TRAIN_SAMPLE = int(os.getenv('FAISS_TRAIN_SAMPLE', 100000)) # Max vectors used to train IVF quantizers
+FAISS_HNSW_M = int(os.getenv('FAISS_HNSW_M', 32)) # HNSW graph degree
+FAISS_HNSW_EF_CONSTRUCTION = int(os.getenv('FAISS_HNSW_EF_CONSTRUCTION', 200)) # HNSW build-time candidate list size
+FAISS_HNSW_EF_SEARCH = int(os.getenv('FAISS_HNSW_EF_SEARCH', 64)) # HNSW default query-time candidate list size
+FAISS_IVF_NLIST = int(os.getenv('FAISS_IVF_NLIST', 0)) # IVF inverted lists (0 = auto, ~4*sqrt(N))
+FAISS_IVF_NPROBE = int(os.getenv('FAISS_IVF_NPROBE', 16)) # IVF default lists probed per query
+FAISS_PQ_M = int(os.getenv('FAISS_PQ_M', 64)) # IVF-PQ sub-quantizers (must divide the embedding dimension)
+FAISS_PQ_NBITS = int(os.getenv('FAISS_PQ_NBITS', 8)) # Bits per IVF-PQ sub-quantizer code
+
+# Upload Job Configuration
+UPLOAD_JOB_WORKERS = int(os.getenv('UPLOAD_JOB_WORKERS', 2)) # Background workers processing uploads (extract -> chunk -> embed -> index)
+UPLOAD_JOB_RETENTION_SECONDS = int(os.getenv('UPLOAD_JOB_RETENTION_SECONDS', 3600)) # How long finished jobs stay queryable via /jobs/<id>
+
 # RAG Configuration
 RAG_CHUNK_K = int(os.getenv('RAG_CHUNK_K', 5)) # Number of unique chunks to finally send to LLM
 RAG_SEARCH_K_PER_QUERY = int(os.getenv('RAG_SEARCH_K_PER_QUERY', 3)) # Number of chunks to retrieve per sub-query before deduplication
 MULTI_QUERY_COUNT = int(os.getenv('MULTI_QUERY_COUNT', 3)) # Number of sub-questions (0 to disable)
+RAG_PIPELINED = os.getenv('RAG_PIPELINED', 'true').lower() in ('true', '1', 'yes') # Search the original query while sub-queries generate
+RAG_LATENCY_BUDGET_SECONDS = float(os.getenv('RAG_LATENCY_BUDGET_SECONDS', 10.0)) # Deadline for merging sub-query results
+RAG_HYBRID_ENABLED = os.getenv('RAG_HYBRID_ENABLED', 'true').lower() in ('true', '1', 'yes') # Fuse BM25 (exact-term) results with dense results
+RAG_SPARSE_K_PER_QUERY = int(os.getenv('RAG_SPARSE_K_PER_QUERY', 5)) # Number of BM25 chunks to retrieve per (sub-)query
+RAG_RRF_K = int(os.getenv('RAG_RRF_K', 60)) # Reciprocal rank fusion constant: score = sum(1 / (RAG_RRF_K + rank))
+RAG_KEYWORD_QUERY_MAX_TERMS = int(os.getenv('RAG_KEYWORD_QUERY_MAX_TERMS', 6)) # Short identifier-style queries skip sub-query generation (0 to disable)
+BM25_K1 = float(os.getenv('BM25_K1', 1.2)) # BM25 term-frequency saturation
+BM25_B = float(os.getenv('BM25_B', 0.75)) # BM25 chunk-length normalization
+RAG_RERANK_MODE = os.getenv('RAG_RERANK_MODE', 'none').lower() # none | mmr | cross-encoder (second stage before the RAG_CHUNK_K cut)
+RAG_RERANK_CANDIDATES = int(os.getenv('RAG_RERANK_CANDIDATES', 25)) # Candidate pool reranked when RAG_RERANK_MODE is set
+RAG_MMR_LAMBDA = float(os.getenv('RAG_MMR_LAMBDA', 0.7)) # MMR relevance/diversity trade-off (1.0 = relevance only)
+RAG_CROSS_ENCODER_MODEL = os.getenv('RAG_CROSS_ENCODER_MODEL', 'cross-encoder/ms-marco-MiniLM-L-6-v2') # Needs sentence-transformers
+RAG_RERANK_BATCH_SIZE = int(os.getenv('RAG_RERANK_BATCH_SIZE', 32)) # (query, chunk) pairs per cross-encoder batch
+RAG_CONTEXT_TOKEN_BUDGET = int(os.getenv('RAG_CONTEXT_TOKEN_BUDGET', 2000)) # Max tokens of retrieved context in the synthesis prompt (0 = only RAG_CHUNK_K applies)
+CONTEXT_TOKENIZER_ENCODING = os.getenv('CONTEXT_TOKENIZER_ENCODING', 'cl100k_base') # tiktoken encoding used to count prompt tokens ('' = estimate only)
+CONTEXT_CHARS_PER_TOKEN = float(os.getenv('CONTEXT_CHARS_PER_TOKEN', 4.0)) # Token estimate when tiktoken is unavailable
+QUERY_EMBED_CACHE_MAX_MB = int(os.getenv('QUERY_EMBED_CACHE_MAX_MB', 16)) # Memory budget for cached query embeddings (LRU)
+
+# Chat Answer Cache Configuration (repeated questions over unchanged documents)
+ANSWER_CACHE_ENABLED = os.getenv('ANSWER_CACHE_ENABLED', 'true').lower() in ('true', '1', 'yes') # Reuse answers to near-identical /chat questions
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv('ANSWER_CACHE_MAX_ENTRIES', 512)) # Cached answers kept (LRU)
+ANSWER_CACHE_TTL_SECONDS = int(os.getenv('ANSWER_CACHE_TTL_SECONDS', 86400)) # Max age of a cached answer (0 = no expiry)
+ANSWER_CACHE_SIMILARITY = float(os.getenv('ANSWER_CACHE_SIMILARITY', 0.95)) # Min cosine similarity between query embeddings for a hit
 
 # Analysis Configuration
-ANALYSIS_MAX_CONTEXT_LENGTH = int(os.getenv('ANALYSIS_MAX_CONTEXT_LENGTH', 8000)) # Max chars for analysis context
+DOC_TEXT_CACHE_MAX_MB = int(os.getenv('DOC_TEXT_CACHE_MAX_MB', 256)) # Memory budget for document texts held for analysis (LRU)
+ANALYSIS_MAX_CONTEXT_LENGTH = int(os.getenv('ANALYSIS_MAX_CONTEXT_LENGTH', 8000)) # Max chars for analysis context (used when ANALYSIS_MAX_CONTEXT_TOKENS is 0)
+ANALYSIS_MAX_CONTEXT_TOKENS = int(os.getenv('ANALYSIS_MAX_CONTEXT_TOKENS', 2000)) # Max tokens for analysis context (0 = use the character limit)
+ANALYSIS_CACHE_ENABLED = os.getenv('ANALYSIS_CACHE_ENABLED', 'true').lower() in ('true', '1', 'yes') # Store /analyze results in SQLite (keyed by text, type, prompt, model)
+ANALYSIS_MAP_REDUCE_ENABLED = os.getenv('ANALYSIS_MAP_REDUCE_ENABLED', 'true').lower() in ('true', '1', 'yes') # Analyze long documents section by section instead of truncating
+ANALYSIS_SECTION_CHARS = int(os.getenv('ANALYSIS_SECTION_CHARS', ANALYSIS_MAX_CONTEXT_LENGTH)) # Section size for the map step
+ANALYSIS_MAP_WORKERS = int(os.getenv('ANALYSIS_MAP_WORKERS', 4)) # Concurrent section requests to Ollama (match OLLAMA_NUM_PARALLEL)
+ANALYSIS_REDUCE_FANIN = int(os.getenv('ANALYSIS_REDUCE_FANIN', 6)) # Section notes merged per reduce call
+ANALYSIS_PRECOMPUTE_ENABLED = os.getenv('ANALYSIS_PRECOMPUTE_ENABLED', 'false').lower() in ('true', '1', 'yes') # Analyze every default PDF in the background at startup
+
+# Startup Configuration
+STARTUP_WAIT_TIMEOUT = float(os.getenv('STARTUP_WAIT_TIMEOUT', 120)) # Max seconds a request waits for a component that is still warming up
 
 # Logging Configuration
 LOGGING_LEVEL_NAME = os.getenv('LOGGING_LEVEL', 'INFO').upper()
@@ -153,6 +249,49 @@ ANALYSIS_PROMPTS = {
     )
 }
 
+# Map-reduce analysis of long documents: each section is condensed into notes shared by every
+# analysis type (map), notes are merged until they fit ANALYSIS_MAX_CONTEXT_TOKENS (reduce), and the
+# ANALYSIS_PROMPTS template above then runs over the merged notes.
+ANALYSIS_SECTION_NOTES_PROMPT = PromptTemplate(
+    input_variables=["section_text"],
+    template="""You are condensing one section of a longer engineering document so it can be analyzed as a whole later.
+
+**TASK:** Write compact notes covering everything important in the section below:
+*   Main topics and concepts, with a one-line explanation each.
+*   Key facts, definitions, formulas, parameters and procedures.
+*   Questions the section answers, with their answers.
+*   How the concepts relate to each other (hierarchy, dependencies).
+
+**OUTPUT FORMAT (Strict):**
+*   Markdown bullet points only. No preamble, no commentary about the task.
+*   Use ONLY information present in the section. Do not invent anything.
+
+--- START SECTION ---
+{section_text}
+--- END SECTION ---
+
+**BEGIN NOTES:**
+"""
+)
+
+ANALYSIS_NOTES_MERGE_PROMPT = PromptTemplate(
+    input_variables=["notes_text"],
+    template="""You are merging notes taken from consecutive sections of one engineering document.
+
+**TASK:** Combine the notes below into a single, shorter set of notes that keeps every important topic, fact, question/answer and relationship. Remove duplicates and merge overlapping points. Keep the document's order where possible.
+
+**OUTPUT FORMAT (Strict):**
+*   Markdown bullet points only (nested where it shows hierarchy). No preamble.
+*   Use ONLY information present in the notes. Do not invent anything.
+
+--- START NOTES ---
+{notes_text}
+--- END NOTES ---
+
+**BEGIN MERGED NOTES:**
+"""
+)
+
 
 # --- Logging Setup ---
 def setup_logging():
@@ -167,10 +306,31 @@ def setup_logging():
     logger = logging.getLogger(__name__)
     logger.info(f"Logging configured with level {LOGGING_LEVEL_NAME}")
     logger.debug(f"OLLAMA_BASE_URL={OLLAMA_BASE_URL}")
+    logger.debug(f"OLLAMA_BASE_URLS={OLLAMA_BASE_URLS}, OLLAMA_HEALTH_CHECK_INTERVAL={OLLAMA_HEALTH_CHECK_INTERVAL}, OLLAMA_HEALTH_CHECK_TIMEOUT={OLLAMA_HEALTH_CHECK_TIMEOUT}, OLLAMA_EJECT_AFTER_FAILURES={OLLAMA_EJECT_AFTER_FAILURES}")
     logger.debug(f"OLLAMA_MODEL={OLLAMA_MODEL}")
     logger.debug(f"OLLAMA_EMBED_MODEL={OLLAMA_EMBED_MODEL}")
+    logger.debug(f"OLLAMA_MAX_CONCURRENCY={OLLAMA_MAX_CONCURRENCY}, OLLAMA_CHAT_CONCURRENCY={OLLAMA_CHAT_CONCURRENCY}, OLLAMA_ANALYSIS_CONCURRENCY={OLLAMA_ANALYSIS_CONCURRENCY}, OLLAMA_BULK_CONCURRENCY={OLLAMA_BULK_CONCURRENCY}")
+    logger.debug(f"OLLAMA_CHAT_QUEUE_TIMEOUT={OLLAMA_CHAT_QUEUE_TIMEOUT}, OLLAMA_ANALYSIS_QUEUE_TIMEOUT={OLLAMA_ANALYSIS_QUEUE_TIMEOUT}, OLLAMA_BULK_QUEUE_TIMEOUT={OLLAMA_BULK_QUEUE_TIMEOUT}, OLLAMA_HTTP_KEEPALIVE_SECONDS={OLLAMA_HTTP_KEEPALIVE_SECONDS}")
     logger.debug(f"FAISS_FOLDER={FAISS_FOLDER}")
+    logger.debug(f"FAISS_INDEX_TYPE={FAISS_INDEX_TYPE}, FAISS_ANN_MIN_VECTORS={FAISS_ANN_MIN_VECTORS}, FAISS_IVF_NLIST={FAISS_IVF_NLIST}, FAISS_IVF_NPROBE={FAISS_IVF_NPROBE}, FAISS_HNSW_M={FAISS_HNSW_M}, FAISS_HNSW_EF_SEARCH={FAISS_HNSW_EF_SEARCH}, FAISS_PQ_M={FAISS_PQ_M}")
+    logger.debug(f"FAISS_MMAP_ENABLED={FAISS_MMAP_ENABLED}, FAISS_WAL_ENABLED={FAISS_WAL_ENABLED}, FAISS_WAL_FSYNC={FAISS_WAL_FSYNC}, FAISS_WAL_COMPACT_MB={FAISS_WAL_COMPACT_MB}, FAISS_TOMBSTONE_COMPACT_RATIO={FAISS_TOMBSTONE_COMPACT_RATIO}")
+    logger.debug(f"CHUNK_STORE_BLOCK_SIZE={CHUNK_STORE_BLOCK_SIZE}, CHUNK_BLOCK_CACHE_MB={CHUNK_BLOCK_CACHE_MB}")
     logger.debug(f"UPLOAD_FOLDER={UPLOAD_FOLDER}")
     logger.debug(f"DATABASE_PATH={DATABASE_PATH}")
-    logger.debug(f"RAG_CHUNK_K={RAG_CHUNK_K}, RAG_SEARCH_K_PER_QUERY={RAG_SEARCH_K_PER_QUERY}, MULTI_QUERY_COUNT={MULTI_QUERY_COUNT}")
-    logger.debug(f"ANALYSIS_MAX_CONTEXT_LENGTH={ANALYSIS_MAX_CONTEXT_LENGTH}")
+    logger.debug(f"TEXT_STORE_FOLDER={TEXT_STORE_FOLDER}")
+    logger.debug(f"DEFAULT_PDFS_FOLDER={DEFAULT_PDFS_FOLDER}, DEFAULT_PDFS_WATCH_ENABLED={DEFAULT_PDFS_WATCH_ENABLED}, DEFAULT_PDFS_WATCH_INTERVAL={DEFAULT_PDFS_WATCH_INTERVAL}")
+    logger.debug(f"CORPUS_BUILD_WORKERS={CORPUS_BUILD_WORKERS}, CORPUS_BUILD_QUEUE_DEPTH={CORPUS_BUILD_QUEUE_DEPTH}, CORPUS_BUILD_CHECKPOINT_CHUNKS={CORPUS_BUILD_CHECKPOINT_CHUNKS}")
+    logger.debug(f"RAG_CHUNK_K={RAG_CHUNK_K}, RAG_SEARCH_K_PER_QUERY={RAG_SEARCH_K_PER_QUERY}, MULTI_QUERY_COUNT={MULTI_QUERY_COUNT}, QUERY_EMBED_CACHE_MAX_MB={QUERY_EMBED_CACHE_MAX_MB}")
+    logger.debug(f"RAG_PIPELINED={RAG_PIPELINED}, RAG_LATENCY_BUDGET_SECONDS={RAG_LATENCY_BUDGET_SECONDS}")
+    logger.debug(f"RAG_HYBRID_ENABLED={RAG_HYBRID_ENABLED}, RAG_SPARSE_K_PER_QUERY={RAG_SPARSE_K_PER_QUERY}, RAG_RRF_K={RAG_RRF_K}, RAG_KEYWORD_QUERY_MAX_TERMS={RAG_KEYWORD_QUERY_MAX_TERMS}, BM25_K1={BM25_K1}, BM25_B={BM25_B}")
+    logger.debug(f"ANSWER_CACHE_ENABLED={ANSWER_CACHE_ENABLED}, ANSWER_CACHE_MAX_ENTRIES={ANSWER_CACHE_MAX_ENTRIES}, ANSWER_CACHE_TTL_SECONDS={ANSWER_CACHE_TTL_SECONDS}, ANSWER_CACHE_SIMILARITY={ANSWER_CACHE_SIMILARITY}")
+    logger.debug(f"RAG_RERANK_MODE={RAG_RERANK_MODE}, RAG_RERANK_CANDIDATES={RAG_RERANK_CANDIDATES}, RAG_MMR_LAMBDA={RAG_MMR_LAMBDA}, RAG_CROSS_ENCODER_MODEL={RAG_CROSS_ENCODER_MODEL}")
+    logger.debug(f"RAG_CONTEXT_TOKEN_BUDGET={RAG_CONTEXT_TOKEN_BUDGET}, CONTEXT_TOKENIZER_ENCODING={CONTEXT_TOKENIZER_ENCODING}, CONTEXT_CHARS_PER_TOKEN={CONTEXT_CHARS_PER_TOKEN}")
+    logger.debug(f"ANALYSIS_MAX_CONTEXT_LENGTH={ANALYSIS_MAX_CONTEXT_LENGTH}, ANALYSIS_MAX_CONTEXT_TOKENS={ANALYSIS_MAX_CONTEXT_TOKENS}, DOC_TEXT_CACHE_MAX_MB={DOC_TEXT_CACHE_MAX_MB}")
+    logger.debug(f"ANALYSIS_CACHE_ENABLED={ANALYSIS_CACHE_ENABLED}, ANALYSIS_PRECOMPUTE_ENABLED={ANALYSIS_PRECOMPUTE_ENABLED}")
+    logger.debug(f"ANALYSIS_MAP_REDUCE_ENABLED={ANALYSIS_MAP_REDUCE_ENABLED}, ANALYSIS_SECTION_CHARS={ANALYSIS_SECTION_CHARS}, ANALYSIS_MAP_WORKERS={ANALYSIS_MAP_WORKERS}, ANALYSIS_REDUCE_FANIN={ANALYSIS_REDUCE_FANIN}")
+    logger.debug(f"EMBED_BATCH_SIZE={EMBED_BATCH_SIZE}, EMBED_MAX_IN_FLIGHT={EMBED_MAX_IN_FLIGHT}, EMBED_MAX_RETRIES={EMBED_MAX_RETRIES}")
+    logger.debug(f"EMBED_CACHE_ENABLED={EMBED_CACHE_ENABLED}, EMBED_CACHE_FOLDER={EMBED_CACHE_FOLDER}")
+    logger.debug(f"STARTUP_WAIT_TIMEOUT={STARTUP_WAIT_TIMEOUT}")
+    logger.debug(f"UPLOAD_JOB_WORKERS={UPLOAD_JOB_WORKERS}, UPLOAD_JOB_RETENTION_SECONDS={UPLOAD_JOB_RETENTION_SECONDS}")
+    logger.debug(f"PDF_EXTRACT_WORKERS={PDF_EXTRACT_WORKERS}, PDF_EXTRACT_PAGES_PER_SHARD={PDF_EXTRACT_PAGES_PER_SHARD}, PDF_EXTRACT_PARALLEL_MIN_PAGES={PDF_EXTRACT_PARALLEL_MIN_PAGES}")
@@ -0,0 +1,169 @@
+# --- START OF FILE context_packer.py ---
+
+# Token-aware packing of retrieved chunks into the synthesis prompt (see ai_core.perform_rag_search).
+# Chunks are taken greedily in score order while they fit RAG_CONTEXT_TOKEN_BUDGET (and at most
+# RAG_CHUNK_K of them); a chunk that does not fit is skipped in favour of smaller, lower-ranked ones.
+# Neighbouring chunks of the same source share up to chunk_overlap characters (see
+# ai_core.create_chunks_from_text); that shared text is sent only once.
+# Tokens are counted with tiktoken (CONTEXT_TOKENIZER_ENCODING). Ollama does not expose its models'
+# tokenizers, so this is an approximation of the model's count. If tiktoken or its encoding file
+# is unavailable (it is downloaded on first use; set TIKTOKEN_CACHE_DIR for offline machines),
+# tokens are estimated as characters / CONTEXT_CHARS_PER_TOKEN.
+import math
+import logging
+import threading
+from langchain.docstore.document import Document
+from config import CONTEXT_TOKENIZER_ENCODING, CONTEXT_CHARS_PER_TOKEN
+
+try:
+    import tiktoken
+except ImportError: # Optional; token counts fall back to the character estimate
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+CONTEXT_SEPARATOR = "\n\n---\n\n"
+_MIN_OVERLAP_CHARS = 20 # Shorter common prefixes/suffixes are coincidence, not splitter overlap
+_MAX_OVERLAP_CHARS = 1000
+
+_encoding = None
+_encoding_failed = False
+_encoding_lock = threading.Lock()
+
+
+def _get_encoding():
+    """Loads the tiktoken encoding once. Returns None if unavailable."""
+    global _encoding, _encoding_failed
+    with _encoding_lock:
+        if _encoding is None and not _encoding_failed:
+            if tiktoken is None or not CONTEXT_TOKENIZER_ENCODING:
+                _encoding_failed = True
+            else:
+                try:
+                    _encoding = tiktoken.get_encoding(CONTEXT_TOKENIZER_ENCODING)
+                except Exception as e:
+                    logger.warning(f"Could not load tiktoken encoding '{CONTEXT_TOKENIZER_ENCODING}' ({type(e).__name__}: {e}). "
+                                   f"Estimating tokens as characters / {CONTEXT_CHARS_PER_TOKEN}.")
+                    _encoding_failed = True
+        return _encoding
+
+
+def tokenizer_name() -> str:
+    encoding = _get_encoding()
+    return f"tiktoken:{encoding.name}" if encoding else f"approx:{CONTEXT_CHARS_PER_TOKEN}chars"
+
+
+def count_tokens(text: str) -> int:
+    """Number of tokens in `text` (tiktoken, or the character estimate)."""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding:
+        return len(encoding.encode(text, disallowed_special=()))
+    return math.ceil(len(text) / CONTEXT_CHARS_PER_TOKEN)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """The longest prefix of `text` with at most `max_tokens` tokens."""
+    if max_tokens <= 0:
+        return ""
+    encoding = _get_encoding()
+    if encoding:
+        tokens = encoding.encode(text, disallowed_special=())
+        return text if len(tokens) <= max_tokens else encoding.decode(tokens[:max_tokens])
+    return text[:int(max_tokens * CONTEXT_CHARS_PER_TOKEN)]
+
+
+def overlap_length(left: str, right: str) -> int:
+    """Length of the longest suffix of `left` that is also a prefix of `right` (0 if shorter than _MIN_OVERLAP_CHARS)."""
+    limit = min(len(left), len(right), _MAX_OVERLAP_CHARS)
+    seed = right[:_MIN_OVERLAP_CHARS]
+    if limit < _MIN_OVERLAP_CHARS:
+        return 0
+    # Candidate overlaps start where the seed occurs within the tail of `left`
+    tail_start = len(left) - limit
+    position = left.find(seed, tail_start)
+    while position != -1:
+        length = len(left) - position
+        if right.startswith(left[position:]):
+            return length
+        position = left.find(seed, position + 1)
+    return 0
+
+
+def format_chunk(citation_index: int, doc: Document, text: str) -> str:
+    """One context entry as it appears in the synthesis prompt."""
+    source = doc.metadata.get('source', 'Unknown Source')
+    chunk_idx = doc.metadata.get('chunk_index', 'N/A')
+    return f"[{citation_index}] Source: {source} | Chunk Index: {chunk_idx}\n{text}"
+
+
+def _trim_neighbour_overlap(doc: Document, packed: dict[tuple, Document]) -> tuple[str, int]:
+    """Removes the text `doc` shares with already packed neighbours (same source, adjacent chunk_index)."""
+    text = doc.page_content
+    source, chunk_idx = doc.metadata.get('source'), doc.metadata.get('chunk_index')
+    if source is None or not isinstance(chunk_idx, int):
+        return text, 0
+    previous = packed.get((source, chunk_idx - 1))
+    if previous is not None:
+        text = text[overlap_length(previous.page_content, text):]
+    following = packed.get((source, chunk_idx + 1))
+    if following is not None:
+        text = text[:len(text) - overlap_length(text, following.page_content)]
+    return text, len(doc.page_content) - len(text)
+
+
+def pack_context(candidates: list[Document], token_budget: int, max_chunks: int) -> tuple[list[tuple[Document, str]], dict]:
+    """Greedily selects chunks in score order until the token budget or `max_chunks` is reached.
+
+    Args:
+        candidates (list[Document]): Chunks ordered best first.
+        token_budget (int): Max tokens of the packed context (0 = no budget, only `max_chunks` applies).
+        max_chunks (int): Max number of chunks to pack.
+
+    Returns:
+        tuple[list[tuple[Document, str]], dict]: The packed (chunk, prompt text) pairs in score order,
+            and stats: tokens used, budget, chunks packed/skipped, overlap characters trimmed, tokenizer.
+    """
+    packed: list[tuple[Document, str]] = []
+    packed_by_key: dict[tuple, Document] = {}
+    tokens_used = 0
+    skipped = 0
+    trimmed_chars = 0
+    separator_tokens = count_tokens(CONTEXT_SEPARATOR)
+    for doc in candidates:
+        if len(packed) >= max_chunks:
+            break
+        text, trimmed = _trim_neighbour_overlap(doc, packed_by_key)
+        if not text.strip():
+            trimmed_chars += trimmed # Entirely contained in its packed neighbours
+            continue
+        cost = count_tokens(format_chunk(len(packed) + 1, doc, text)) + (separator_tokens if packed else 0)
+        if token_budget > 0 and tokens_used + cost > token_budget:
+            if packed:
+                skipped += 1
+                continue
+            # Even the best chunk alone is over budget: send as much of it as fits rather than nothing
+            header_tokens = count_tokens(format_chunk(1, doc, ""))
+            text = truncate_to_tokens(text, token_budget - header_tokens)
+            if not text:
+                skipped += 1
+                continue
+            cost = count_tokens(format_chunk(1, doc, text))
+        packed.append((doc, text))
+        tokens_used += cost
+        trimmed_chars += trimmed
+        source, chunk_idx = doc.metadata.get('source'), doc.metadata.get('chunk_index')
+        if source is not None and isinstance(chunk_idx, int):
+            packed_by_key[(source, chunk_idx)] = doc
+    stats = {
+        "tokens": tokens_used,
+        "budget": token_budget,
+        "chunks": len(packed),
+        "skipped_over_budget": skipped,
+        "overlap_chars_trimmed": trimmed_chars,
+        "tokenizer": tokenizer_name(),
+    }
+    return packed, stats
+
+# --- END OF FILE context_packer.py ---
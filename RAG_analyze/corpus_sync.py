@@ -0,0 +1,403 @@
+# --- START OF FILE corpus_sync.py ---
+
+# Incremental sync of the default PDF folder into the vector store.
+# A manifest stored next to the index (FAISS_FOLDER/manifest.json) records, per indexed file:
+# path, size, mtime, content hash, chunk count and the vector position range it occupies.
+# A sync diffs the folder against it and only re-indexes added or changed files and removes
+# deleted ones. Unchanged files cost one stat() each (the content hash is only recomputed
+# when size or mtime change, see text_store.get_file_hash).
+# watch_folder() polls the folder and syncs new drops once their size/mtime have settled.
+#
+# Bulk builds are pipelined: a process pool extracts files concurrently, at most
+# CORPUS_BUILD_QUEUE_DEPTH files ahead of the embedding stage (bounding memory), and chunks are
+# embedded and persisted in checkpoints of CORPUS_BUILD_CHECKPOINT_CHUNKS. The manifest records
+# each checkpoint, so a crashed build resumes after the last one.
+import os
+import json
+import time
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from config import (
+    FAISS_FOLDER, DEFAULT_PDFS_FOLDER, DEFAULT_PDFS_WATCH_INTERVAL,
+    CORPUS_BUILD_WORKERS, CORPUS_BUILD_QUEUE_DEPTH, CORPUS_BUILD_CHECKPOINT_CHUNKS
+)
+import ai_core
+import chunk_store
+import text_store
+import pdf_workers
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILENAME = "manifest.json"
+_MANIFEST_VERSION = 1
+
+_sync_lock = threading.Lock() # One sync at a time (watcher thread vs. explicit calls)
+_watcher_thread: threading.Thread | None = None
+_watcher_stop = threading.Event()
+
+
+def manifest_path(folder: str = FAISS_FOLDER) -> str:
+    return os.path.join(folder, MANIFEST_FILENAME)
+
+
+def load_manifest() -> dict:
+    """Returns {'version': int, 'files': {filename: entry}, 'pending': [filename, ...]}
+    (empty if missing or unreadable). 'pending' lists files of an unfinished build checkpoint."""
+    path = manifest_path()
+    if os.path.exists(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            if manifest.get('version') == _MANIFEST_VERSION and isinstance(manifest.get('files'), dict):
+                manifest.setdefault('pending', [])
+                return manifest
+            logger.warning(f"Ignoring corpus manifest with unsupported format: {path}")
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not read corpus manifest {path} ({e}). The folder will be re-diffed against the index.")
+    return {'version': _MANIFEST_VERSION, 'files': {}, 'pending': []}
+
+
+def save_manifest(manifest: dict):
+    """Writes the manifest atomically."""
+    os.makedirs(FAISS_FOLDER, exist_ok=True)
+    path = manifest_path()
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def scan_folder(folder: str = DEFAULT_PDFS_FOLDER) -> dict[str, dict]:
+    """Stats the PDFs in `folder`: {filename: {'path', 'size', 'mtime_ns'}}.
+
+    Raises:
+        OSError: If the folder cannot be listed.
+    """
+    found = {}
+    for entry in os.scandir(folder):
+        if entry.is_file() and entry.name.lower().endswith('.pdf') and not entry.name.startswith('~'):
+            stat = entry.stat()
+            found[entry.name] = {'path': entry.path, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    return found
+
+
+def _source_positions(filename: str):
+    vs = ai_core.vector_store
+    if vs is None:
+        return []
+    return chunk_store.positions_for_sources(vs.docstore, vs.index_to_docstore_id, [filename])
+
+
+def plan_sync(scan: dict[str, dict], manifest: dict) -> dict[str, list[str]]:
+    """Diffs a folder scan against the manifest.
+
+    Files whose size/mtime changed are hashed; if the content hash is unchanged they are only
+    'touched' (manifest refresh, no re-indexing). Files missing from the manifest but already
+    in the index (indexed before the manifest existed) are 'adopted' as they are.
+
+    Returns:
+        dict: Filenames per action: 'added', 'changed', 'deleted', 'touched', 'adopted', 'unchanged'.
+    """
+    files = manifest['files']
+    plan = {action: [] for action in ('added', 'changed', 'deleted', 'touched', 'adopted', 'unchanged')}
+    indexed = None
+    for filename, stat in sorted(scan.items()):
+        entry = files.get(filename)
+        if entry is None:
+            if indexed is None:
+                indexed = ai_core.indexed_sources()
+            plan['adopted' if filename in indexed else 'added'].append(filename)
+        elif entry['size'] == stat['size'] and entry['mtime_ns'] == stat['mtime_ns']:
+            plan['unchanged'].append(filename)
+        elif text_store.get_file_hash(stat['path']) == entry['sha256']:
+            plan['touched'].append(filename)
+        else:
+            plan['changed'].append(filename)
+    plan['deleted'] = sorted(set(files) - set(scan))
+    return plan
+
+
+def _manifest_entry(stat: dict, chunk_count: int, sha256: str | None = None) -> dict:
+    return {
+        'path': stat['path'],
+        'size': stat['size'],
+        'mtime_ns': stat['mtime_ns'],
+        'sha256': sha256 or text_store.get_file_hash(stat['path']),
+        'chunk_count': chunk_count,
+        'vector_range': None,
+        'indexed_at': time.time(),
+    }
+
+
+def refresh_vector_ranges(manifest: dict):
+    """Records each file's current [start, end) vector positions (positions shift on compaction)."""
+    for filename, entry in manifest['files'].items():
+        positions = _source_positions(filename)
+        entry['chunk_count'] = int(len(positions))
+        entry['vector_range'] = [int(positions[0]), int(positions[-1]) + 1] if len(positions) else None
+
+
+def _load_chunks(filename: str, text: str | None) -> list | None:
+    """Chunks the text of one file. Returns None (logged) if there is no text or no chunks."""
+    if not text:
+        logger.warning(f"Could not extract text from '{filename}'. Skipping this file.")
+        return None
+    documents = ai_core.create_chunks_from_text(text, filename)
+    if not documents:
+        logger.warning(f"Could not create document chunks for '{filename}', although text was extracted. Skipping file.")
+        return None
+    return documents
+
+
+def _stored_text(filename: str, path: str) -> tuple[str | None, str | None]:
+    """Hashes a file and looks up its text in the text store.
+
+    Returns:
+        tuple: (content hash or None if the file cannot be read, stored text or None on a miss).
+    """
+    try:
+        content_hash = text_store.get_file_hash(path)
+    except OSError as e:
+        logger.warning(f"Could not read '{filename}': {e}. Skipping this file.")
+        return None, None
+    entry = text_store.load_entry(content_hash)
+    return content_hash, (entry.get('text') or None) if entry else None
+
+
+def _iter_prepared_files(filenames: list[str], scan: dict[str, dict]):
+    """Yields (filename, documents or None on failure, content hash or None) for each file.
+
+    Text already in the text store is chunked straight away. Misses are extracted in a process
+    pool when there are several files (at most CORPUS_BUILD_QUEUE_DEPTH ahead of the consumer;
+    results arrive in completion order and the pool keeps extracting while the consumer embeds).
+    Workers only run pdf_workers.extract_document; the text store is written here, in the parent,
+    so the app's text cache (which loads from the store) stays coherent.
+    """
+    workers = min(CORPUS_BUILD_WORKERS, len(filenames))
+    if workers <= 1:
+        for filename in filenames:
+            path = scan[filename]['path']
+            content_hash, text = _stored_text(filename, path)
+            if content_hash is None:
+                yield filename, None, None
+                continue
+            if text is None:
+                text, page_offsets = ai_core.extract_text_with_offsets(path)
+                if text:
+                    text_store.save_entry(content_hash, text, page_offsets)
+            yield filename, _load_chunks(filename, text), content_hash
+        return
+
+    depth = max(CORPUS_BUILD_QUEUE_DEPTH or 2 * workers, workers)
+    remaining = iter(filenames)
+    in_flight = {}
+    pool = None # Started on the first text store miss
+    try:
+        while True:
+            while len(in_flight) < depth:
+                filename = next(remaining, None)
+                if filename is None:
+                    break
+                path = scan[filename]['path']
+                content_hash, text = _stored_text(filename, path)
+                if content_hash is None:
+                    yield filename, None, None
+                elif text is not None:
+                    yield filename, _load_chunks(filename, text), content_hash
+                else:
+                    if pool is None:
+                        # Files are the unit of parallelism here, so large PDFs are not additionally
+                        # sharded across pdf_extract's page pool
+                        pool = ProcessPoolExecutor(max_workers=workers, mp_context=pdf_workers.spawn_context())
+                        logger.info(f"Extracting PDFs with {workers} processes (up to {depth} files ahead of embedding).")
+                    in_flight[pool.submit(pdf_workers.extract_document, path)] = (filename, content_hash)
+            if not in_flight:
+                return
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                filename, content_hash = in_flight.pop(future)
+                try:
+                    text, page_offsets, page_errors = future.result()
+                except Exception as e: # Unreadable file, worker crashed or the pool broke
+                    logger.error(f"Extracting '{filename}' failed in a build worker: {e}")
+                    yield filename, None, None
+                    continue
+                for page_num, page_err in page_errors:
+                    logger.warning(f"Error processing page {page_num+1} of {filename}: {page_err}")
+                if text:
+                    text_store.save_entry(content_hash, text, page_offsets)
+                yield filename, _load_chunks(filename, text), content_hash
+    finally:
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+
+def _index_files(plan: dict, scan: dict[str, dict], manifest: dict):
+    """Indexes plan['added'] and plan['changed'], recording them in the manifest as they complete.
+
+    New files are embedded in checkpoints of about CORPUS_BUILD_CHECKPOINT_CHUNKS chunks (whole
+    files only). Before a checkpoint its files are listed in manifest['pending'], so if the build
+    dies mid-checkpoint the next sync removes their partial chunks and indexes them again.
+    Changed files have their chunks replaced one file at a time.
+    """
+    files = manifest['files']
+    total = len(plan['added']) + len(plan['changed'])
+    changed = set(plan['changed'])
+    batch, batch_entries = [], {}
+    done_count = 0
+    started_at = time.perf_counter()
+
+    def checkpoint():
+        if not batch:
+            return
+        manifest['pending'] = sorted(set(manifest['pending']) | set(batch_entries))
+        save_manifest(manifest)
+        if ai_core.add_documents_to_vector_store(batch):
+            files.update(batch_entries)
+            manifest['pending'] = [f for f in manifest['pending'] if f not in batch_entries]
+            logger.info(f"Checkpoint: {len(files)} file(s) in the manifest, {done_count}/{total} processed in this sync "
+                        f"({time.perf_counter() - started_at:.1f}s).")
+        else:
+            # Left in 'pending': partially added chunks are cleaned up by the next sync
+            logger.error(f"Failed to add the chunks of {len(batch_entries)} new file(s) to the FAISS index.")
+            plan['failed'].extend(batch_entries)
+        save_manifest(manifest)
+        batch.clear()
+        batch_entries.clear()
+
+    for filename, documents, content_hash in _iter_prepared_files(plan['added'] + plan['changed'], scan):
+        done_count += 1
+        if documents is None:
+            plan['failed'].append(filename)
+            continue
+        if filename in changed:
+            # New chunks replace the old ones (the document stays searchable meanwhile)
+            ai_core.document_texts_cache.pop(filename) # Drop the stale cached text
+            if not ai_core.replace_source_documents(filename, documents):
+                logger.error(f"Failed to re-index the changed file '{filename}'.")
+                plan['failed'].append(filename)
+                continue
+            files[filename] = _manifest_entry(scan[filename], len(documents), content_hash)
+            save_manifest(manifest)
+            logger.info(f"Re-indexed changed file '{filename}' ({len(documents)} chunks).")
+            continue
+        batch.extend(documents)
+        batch_entries[filename] = _manifest_entry(scan[filename], len(documents), content_hash)
+        if len(batch) >= CORPUS_BUILD_CHECKPOINT_CHUNKS:
+            checkpoint()
+    checkpoint()
+
+
+def _discard_interrupted_checkpoint(manifest: dict):
+    """Removes chunks left by a build that died mid-checkpoint (see _index_files)."""
+    for filename in list(manifest['pending']):
+        if filename not in manifest['files']:
+            deleted = ai_core.delete_source_documents(filename)
+            if deleted is None:
+                continue # Stays pending; retried next sync
+            if deleted:
+                logger.warning(f"Removed {deleted} partially indexed chunks of '{filename}' left by an interrupted build.")
+        manifest['pending'].remove(filename)
+    save_manifest(manifest)
+
+
+def sync_folder(folder: str = DEFAULT_PDFS_FOLDER) -> dict:
+    """Brings the vector store in line with `folder`: indexes added and changed files, removes
+    the chunks of deleted files, and updates the manifest as files complete (so an interrupted
+    sync resumes where it stopped).
+
+    Returns:
+        dict: {'added', 'changed', 'deleted', 'touched', 'adopted', 'unchanged', 'failed'}: filenames.
+        A file is recorded in the manifest only once indexed, so failed files are retried next sync.
+    """
+    with _sync_lock:
+        manifest = load_manifest()
+        if manifest['pending']:
+            _discard_interrupted_checkpoint(manifest)
+        scan = scan_folder(folder)
+        plan = plan_sync(scan, manifest)
+        plan['failed'] = []
+        files = manifest['files']
+        started_at = time.perf_counter()
+
+        for filename in plan['deleted']:
+            if ai_core.delete_source_documents(filename) is None:
+                plan['failed'].append(filename)
+                continue
+            ai_core.document_texts_cache.pop(filename)
+            del files[filename]
+            save_manifest(manifest)
+            logger.info(f"Removed '{filename}' (deleted from {folder}) from the index.")
+
+        for filename in plan['touched'] + plan['adopted']:
+            files[filename] = _manifest_entry(scan[filename], int(len(_source_positions(filename))))
+        if plan['touched'] or plan['adopted']:
+            save_manifest(manifest)
+            if plan['adopted']:
+                logger.info(f"Adopted {len(plan['adopted'])} file(s) indexed before the manifest existed: {plan['adopted']}")
+
+        _index_files(plan, scan, manifest)
+
+        refresh_vector_ranges(manifest)
+        save_manifest(manifest)
+        summary = ", ".join(f"{len(names)} {action}" for action, names in plan.items() if names)
+        logger.info(f"Corpus sync of {folder} finished in {time.perf_counter() - started_at:.2f}s: {summary or 'no PDFs'}.")
+        return plan
+
+
+def has_pending_changes(scan: dict[str, dict], manifest: dict) -> bool:
+    """True if the scan differs from the manifest by name, size or mtime (no hashing)."""
+    files = manifest['files']
+    if set(scan) != set(files):
+        return True
+    return any(files[name]['size'] != stat['size'] or files[name]['mtime_ns'] != stat['mtime_ns'] for name, stat in scan.items())
+
+
+def watch_folder(folder: str = DEFAULT_PDFS_FOLDER, interval: float = DEFAULT_PDFS_WATCH_INTERVAL,
+                 stop_event: threading.Event | None = None, on_sync=None):
+    """Polls `folder` and syncs it whenever files are added, changed or removed.
+
+    A change is synced once two consecutive polls see the same sizes and mtimes, so files
+    still being copied into the folder are not indexed half-written.
+
+    Args:
+        on_sync (Callable[[dict], None] | None): Optional; called with the plan of each sync.
+    """
+    stop_event = stop_event or threading.Event()
+    logger.info(f"Watching {folder} for PDF changes (every {interval}s).")
+    previous_scan = None
+    while not stop_event.is_set():
+        try:
+            scan = scan_folder(folder)
+            if has_pending_changes(scan, load_manifest()):
+                if scan == previous_scan:
+                    plan = sync_folder(folder)
+                    if on_sync:
+                        on_sync(plan)
+                else:
+                    logger.debug(f"Changes detected in {folder}; waiting for files to settle.")
+            previous_scan = scan
+        except Exception as e:
+            logger.error(f"Corpus watch of {folder} failed: {e}", exc_info=True)
+        stop_event.wait(interval)
+    logger.info(f"Stopped watching {folder}.")
+
+
+def start_watcher(folder: str = DEFAULT_PDFS_FOLDER, interval: float = DEFAULT_PDFS_WATCH_INTERVAL) -> threading.Thread:
+    """Runs watch_folder in a daemon thread (used by the web app)."""
+    global _watcher_thread
+    if _watcher_thread and _watcher_thread.is_alive():
+        return _watcher_thread
+    _watcher_stop.clear()
+    _watcher_thread = threading.Thread(target=watch_folder, args=(folder, interval, _watcher_stop), name="corpus-watch", daemon=True)
+    _watcher_thread.start()
+    return _watcher_thread
+
+
+def stop_watcher():
+    _watcher_stop.set()
+
+# --- END OF FILE corpus_sync.py ---
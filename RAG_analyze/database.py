@@ -39,11 +39,6 @@ def init_db():
 
         logger.info(f"Initializing database schema in '{DATABASE_PATH}'...")
 
-        # Get existing columns to handle potential schema migrations gracefully
-        cursor.execute("PRAGMA table_info(messages)")
-        existing_columns = {row['name'] for row in cursor.fetchall()}
-        logger.debug(f"Existing columns in 'messages' table: {existing_columns}")
-
         # Create messages table if it doesn't exist
         # Use TEXT for timestamp, store as ISO8601 UTC string
         # Ensure PRIMARY KEY constraint is correctly defined
@@ -61,6 +56,12 @@ def init_db():
         ''')
         logger.info("Table 'messages' checked/created.")
 
+        # Get existing columns to handle potential schema migrations gracefully
+        # (after CREATE TABLE, so a fresh database does not try to re-add its own columns)
+        cursor.execute("PRAGMA table_info(messages)")
+        existing_columns = {row['name'] for row in cursor.fetchall()}
+        logger.debug(f"Existing columns in 'messages' table: {existing_columns}")
+
         # Add columns if they don't exist (simple migration)
         if 'references_json' not in existing_columns:
             cursor.execute("ALTER TABLE messages ADD COLUMN references_json TEXT")
@@ -80,6 +81,35 @@ def init_db():
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_session_timestamp ON messages (session_id, timestamp);")
         logger.info("Index 'idx_session_timestamp' checked/created.")
 
+        # Cached /analyze results, keyed by what determines the LLM output
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS analysis_cache (
+                doc_hash TEXT NOT NULL,      -- SHA-256 of the document text sent to the LLM
+                analysis_type TEXT NOT NULL, -- faq | topics | mindmap
+                prompt_hash TEXT NOT NULL,   -- SHA-256 of the ANALYSIS_PROMPTS template
+                model TEXT NOT NULL,
+                filename TEXT,               -- Informational; the same text under another name shares the entry
+                content TEXT NOT NULL,
+                thinking TEXT,
+                created_at TEXT NOT NULL DEFAULT (STRFTIME('%Y-%m-%dT%H:%M:%fZ', 'NOW')),
+                PRIMARY KEY (doc_hash, analysis_type, prompt_hash, model)
+            )
+        ''')
+        logger.info("Table 'analysis_cache' checked/created.")
+
+        # Cached map-reduce steps of long-document analysis (section notes, merged notes), shared by all analysis types
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS analysis_step_cache (
+                input_hash TEXT NOT NULL,  -- SHA-256 of the section text / notes being condensed
+                prompt_hash TEXT NOT NULL, -- SHA-256 of the map or merge prompt template
+                model TEXT NOT NULL,
+                output TEXT NOT NULL,
+                created_at TEXT NOT NULL DEFAULT (STRFTIME('%Y-%m-%dT%H:%M:%fZ', 'NOW')),
+                PRIMARY KEY (input_hash, prompt_hash, model)
+            )
+        ''')
+        logger.info("Table 'analysis_step_cache' checked/created.")
+
         conn.commit()
         logger.info(f"Database '{DATABASE_PATH}' schema initialization/update complete.")
 
@@ -240,4 +270,90 @@ def get_messages_by_session(session_id: str) -> list[dict] | None:
         if conn:
             conn.close()
 
+
+def get_cached_analysis(doc_hash: str, analysis_type: str, prompt_hash: str, model: str) -> tuple[str, str | None] | None:
+    """Looks up a stored analysis result.
+
+    Returns:
+        (content, thinking) if cached, otherwise None (also on database errors).
+    """
+    conn = None
+    try:
+        conn = get_db_connection()
+        row = conn.execute(
+            """
+            SELECT content, thinking FROM analysis_cache
+            WHERE doc_hash = ? AND analysis_type = ? AND prompt_hash = ? AND model = ?
+            """,
+            (doc_hash, analysis_type, prompt_hash, model)
+        ).fetchone()
+        return (row['content'], row['thinking']) if row else None
+    except sqlite3.Error as e:
+        logger.error(f"Database error reading analysis cache ({analysis_type}, {doc_hash[:12]}): {e}", exc_info=True)
+        return None
+    finally:
+        if conn:
+            conn.close()
+
+def save_cached_analysis(doc_hash: str, analysis_type: str, prompt_hash: str, model: str, filename: str,
+                         content: str, thinking: str | None) -> bool:
+    """Stores (or replaces) an analysis result. Returns True on success."""
+    conn = None
+    try:
+        conn = get_db_connection()
+        conn.execute(
+            """
+            INSERT OR REPLACE INTO analysis_cache
+            (doc_hash, analysis_type, prompt_hash, model, filename, content, thinking)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            """,
+            (doc_hash, analysis_type, prompt_hash, model, filename, content, thinking)
+        )
+        conn.commit()
+        logger.info(f"Cached '{analysis_type}' analysis for '{filename}' (model: {model}).")
+        return True
+    except sqlite3.Error as e:
+        logger.error(f"Database error saving analysis cache for '{filename}' ({analysis_type}): {e}", exc_info=True)
+        if conn: conn.rollback()
+        return False
+    finally:
+        if conn:
+            conn.close()
+
+def get_cached_analysis_step(input_hash: str, prompt_hash: str, model: str) -> str | None:
+    """Looks up the stored output of one map-reduce analysis step. Returns None if missing (or on error)."""
+    conn = None
+    try:
+        conn = get_db_connection()
+        row = conn.execute(
+            "SELECT output FROM analysis_step_cache WHERE input_hash = ? AND prompt_hash = ? AND model = ?",
+            (input_hash, prompt_hash, model)
+        ).fetchone()
+        return row['output'] if row else None
+    except sqlite3.Error as e:
+        logger.error(f"Database error reading analysis step cache ({input_hash[:12]}): {e}", exc_info=True)
+        return None
+    finally:
+        if conn:
+            conn.close()
+
+def save_cached_analysis_step(input_hash: str, prompt_hash: str, model: str, output: str) -> bool:
+    """Stores the output of one map-reduce analysis step. Returns True on success."""
+    conn = None
+    try:
+        conn = get_db_connection()
+        conn.execute(
+            "INSERT OR REPLACE INTO analysis_step_cache (input_hash, prompt_hash, model, output) VALUES (?, ?, ?, ?)",
+            (input_hash, prompt_hash, model, output)
+        )
+        conn.commit()
+        return True
+    except sqlite3.Error as e:
+        logger.error(f"Database error saving analysis step cache ({input_hash[:12]}): {e}", exc_info=True)
+        if conn: conn.rollback()
+        return False
+    finally:
+        if conn:
+            conn.close()
+
 # --- END OF FILE database.py ---
\ No newline at end of file
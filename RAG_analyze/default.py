@@ -1,78 +1,57 @@
 import os
 import logging
 import sys
-import requests
+import argparse
+import ai_core
+import corpus_sync
+import database
 from config import (
     DEFAULT_PDFS_FOLDER, FAISS_FOLDER, setup_logging,
-    OLLAMA_BASE_URL
+    OLLAMA_BASE_URLS, FAISS_INDEX_TYPE, DEFAULT_PDFS_WATCH_INTERVAL
 )
+from ollama_pool import check_ollama_connection
 # Import necessary functions and global variables
 from ai_core import (
-    initialize_ai_components, load_vector_store, extract_text_from_pdf,
-    create_chunks_from_text, add_documents_to_vector_store, save_vector_store,
-    vector_store, embeddings, llm  # Import globals for consistency
+    initialize_ai_components, load_vector_store, compact_vector_store,
+    rebuild_ann_index, ann_recall_report, snapshot_needs_compaction
 )
 
 # Setup logging for this script
 setup_logging()
 logger = logging.getLogger(__name__)
 
-def check_ollama_connection(base_url: str, timeout: int = 5) -> bool:
+def finalize_index(force_rebuild: bool = False) -> bool:
     """
-    Performs a basic check to see if the Ollama server is reachable.
-
-    Args:
-        base_url (str): The base URL of the Ollama server.
-        timeout (int): Connection timeout in seconds.
-
-    Returns:
-        bool: True if the server responds successfully, False otherwise.
-    """
-    check_url = base_url.rstrip('/') + "/api/tags"  # Use a known API endpoint
-    logger.info(f"Checking Ollama connection at {check_url} (timeout: {timeout}s)...")
-    try:
-        response = requests.get(check_url, timeout=timeout)
-        response.raise_for_status()  # Raises HTTPError for bad responses (4xx or 5xx)
-        response.json()  # Ensure it’s valid JSON
-        logger.info(f"Ollama server responded successfully (Status: {response.status_code}).")
-        return True
-    except requests.exceptions.Timeout:
-        logger.error(f"Ollama connection timed out after {timeout} seconds connecting to {check_url}.")
-        return False
-    except requests.exceptions.ConnectionError:
-        logger.error(f"Ollama connection refused at {check_url}. Is the Ollama server running and accessible?")
-        return False
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Ollama connection failed for {check_url}: {e}")
-        return False
-    except ValueError:  # Handles JSONDecodeError if response isn’t valid JSON
-        logger.error(f"Ollama server at {check_url} did not return valid JSON. Unexpected response.")
-        return False
-
-def get_existing_sources_from_index(vs):
-    """
-    Attempts to retrieve the set of source filenames currently in the FAISS index metadata.
-    Handles potential errors if the docstore structure changes or is large.
+    Brings the on-disk index into its final form: converts/trains it as FAISS_INDEX_TYPE
+    (Flat, HNSW, IVFFlat, IVFPQ) when configured, then folds any pending write-ahead log
+    into a snapshot.
     """
-    if not vs or not hasattr(vs, 'docstore') or not hasattr(vs.docstore, '_dict'):
-        logger.warning("Vector store or docstore not found/structured as expected. Cannot determine existing sources.")
-        return set()
-    try:
-        sources = set()
-        for doc_id, doc in getattr(vs.docstore, '_dict', {}).items():
-            if hasattr(doc, 'metadata') and isinstance(doc.metadata, dict):
-                source = doc.metadata.get('source')
-                if source:
-                    sources.add(source)
-        logger.info(f"Found {len(sources)} unique sources in the existing index metadata.")
-        return sources
-    except Exception as e:
-        logger.error(f"Error retrieving existing sources from FAISS docstore: {e}. Treating all default PDFs as new.", exc_info=True)
-        return set()
-
-def build_initial_faiss_index():
+    success = True
+    if not rebuild_ann_index(FAISS_INDEX_TYPE, force=force_rebuild):
+        logger.error(f"Could not build the configured FAISS index type '{FAISS_INDEX_TYPE}'. The existing index is kept.")
+        success = False
+    if snapshot_needs_compaction() and not compact_vector_store():
+        logger.warning("New documents are persisted in the write-ahead log, but compacting them into a snapshot failed. It will be retried later.")
+    # Compaction renumbers vectors; record the final ranges in the corpus manifest
+    manifest = corpus_sync.load_manifest()
+    corpus_sync.refresh_vector_ranges(manifest)
+    corpus_sync.save_manifest(manifest)
+    return success
+
+def log_recall_report(num_queries: int = 200, k: int = 10):
+    """Logs recall@k and per-query latency of the current index against exact flat search."""
+    rows = ann_recall_report(num_queries=num_queries, k=k)
+    if not rows:
+        logger.warning("Recall report unavailable: no vector store loaded.")
+        return
+    logger.info(f"--- Recall@{k} vs. latency ({num_queries} sampled queries) ---")
+    for row in rows:
+        logger.info(f"{row['setting']:<28} recall@{k}={row['recall_at_k']:.4f}  {row['ms_per_query']:.3f} ms/query")
+
+def build_initial_faiss_index(force_rebuild: bool = False):
     """
-    Processes PDFs in DEFAULT_PDFS_FOLDER, creates/updates the FAISS index, and saves it.
+    Syncs DEFAULT_PDFS_FOLDER into the FAISS index (added, changed and deleted PDFs, tracked
+    in the corpus manifest), finalizes the index and saves it.
     Checks existing index metadata and Ollama connection first.
     """
     logger.info("--- Starting Initial FAISS Index Build/Update from Default PDFs ---")
@@ -87,112 +66,93 @@ def build_initial_faiss_index():
 
     # Pre-check Ollama Connection
     logger.info("Performing pre-check for Ollama server accessibility...")
-    if not check_ollama_connection(OLLAMA_BASE_URL):
-        logger.critical(f"Ollama server is not reachable at {OLLAMA_BASE_URL}. Please ensure it's running and accessible.")
+    if not any([check_ollama_connection(url) for url in OLLAMA_BASE_URLS]):
+        logger.critical(f"No Ollama server is reachable at {', '.join(OLLAMA_BASE_URLS)}. Please ensure one is running and accessible.")
         logger.critical("Cannot proceed with index build without Ollama.")
         return False
     logger.info("Ollama connection pre-check successful.")
 
     # 2. Initialize AI Embeddings & LLM
     logger.info("Initializing AI components (Embeddings required)...")
-    embeddings_new, llm_new = initialize_ai_components()  # Capture returned objects
-
-    # Assign to globals explicitly (since other functions in ai_core rely on them)
-    global embeddings, llm
-    embeddings = embeddings_new
-    llm = llm_new
-
-    # Debugging logs to verify state
-    logger.debug(f"Returned embeddings: {type(embeddings_new)}, llm: {type(llm_new)}")
-    logger.debug(f"Global embeddings is None? {embeddings is None}, llm is None? {llm is None}")
+    initialize_ai_components()  # Sets ai_core.embeddings and ai_core.llm, which the index functions use
+    logger.debug(f"Initialized embeddings: {type(ai_core.embeddings)}, llm: {type(ai_core.llm)}")
 
     # Check initialization success
-    if embeddings is None or llm is None:
+    if ai_core.embeddings is None or ai_core.llm is None:
         logger.critical("Failed to initialize AI Embeddings/LLM components. Cannot build/update index. Check Ollama connection/model details and logs.")
-        logger.critical(f"Failure check: embeddings is None={embeddings is None}, llm is None={llm is None}")
+        logger.critical(f"Failure check: embeddings is None={ai_core.embeddings is None}, llm is None={ai_core.llm is None}")
         return False
     logger.info("AI Embeddings and LLM components initialized successfully.")
 
     # 3. Load existing index if present
     logger.info("Attempting to load existing FAISS index...")
     index_loaded = load_vector_store()  # Uses global embeddings internally
-    if index_loaded and vector_store:
-        index_size = getattr(getattr(vector_store, 'index', None), 'ntotal', 0)
+    if index_loaded and ai_core.vector_store:
+        index_size = getattr(getattr(ai_core.vector_store, 'index', None), 'ntotal', 0)
         logger.info(f"Existing FAISS index loaded. Contains {index_size} vectors.")
-        existing_filenames = get_existing_sources_from_index(vector_store)
     else:
         logger.info("No existing FAISS index found or loaded. A new index will be created.")
-        existing_filenames = set()
-        vector_store = None  # Ensure vector_store is None if load failed
 
-    # 4. Find PDF files in the default folder
+    # 4. Sync the folder against the corpus manifest: index added/changed PDFs, drop deleted ones
     try:
-        all_files = os.listdir(DEFAULT_PDFS_FOLDER)
-        pdf_files = sorted([f for f in all_files if f.lower().endswith('.pdf') and not f.startswith('~')])
-        logger.info(f"Found {len(pdf_files)} PDF(s) in {DEFAULT_PDFS_FOLDER}: {pdf_files if pdf_files else 'None'}")
+        plan = corpus_sync.sync_folder(DEFAULT_PDFS_FOLDER)
     except OSError as e:
-        logger.error(f"Error listing files in {DEFAULT_PDFS_FOLDER}: {e}", exc_info=True)
+        logger.error(f"Error syncing {DEFAULT_PDFS_FOLDER}: {e}", exc_info=True)
         return False
 
-    # 5. Identify *new* PDFs to process
-    new_pdfs_to_process = [f for f in pdf_files if f not in existing_filenames]
-
-    if not new_pdfs_to_process:
-        if pdf_files:
-            logger.info("All PDFs in the default folder seem to be present in the existing index (by filename). No new files to add.")
-        else:
-            logger.info(f"No PDFs found in {DEFAULT_PDFS_FOLDER}.")
+    if not ai_core.vector_store:
+        if plan['failed']:
+            logger.error("No document chunks were indexed due to processing errors. Index not created.")
+            return False
+        logger.info(f"No PDFs found in {DEFAULT_PDFS_FOLDER}. Index not created.")
         return True
 
-    logger.info(f"Found {len(new_pdfs_to_process)} new PDF(s) to process: {new_pdfs_to_process}")
-
-    # 6. Process each *new* PDF
-    all_new_documents = []
-    processing_errors = 0
-    for filename in new_pdfs_to_process:
-        pdf_path = os.path.join(DEFAULT_PDFS_FOLDER, filename)
-        logger.info(f"Processing '{filename}'...")
-        text = extract_text_from_pdf(pdf_path)
-        if text:
-            logger.debug(f"Extracted text from '{filename}'. Creating chunks...")
-            documents = create_chunks_from_text(text, filename)
-            if documents:
-                all_new_documents.extend(documents)
-                logger.info(f"Successfully created {len(documents)} chunks for '{filename}'.")
-            else:
-                logger.warning(f"Could not create document chunks for '{filename}', although text was extracted. Skipping file.")
-                processing_errors += 1
-        else:
-            logger.warning(f"Could not extract text from '{filename}'. Skipping this file.")
-            processing_errors += 1
+    # 5. Train/convert the configured index type and leave a clean snapshot behind
+    success = finalize_index(force_rebuild)
+    final_count = getattr(getattr(ai_core.vector_store, 'index', None), 'ntotal', 'N/A')
+    if plan['failed']:
+        logger.error(f"{len(plan['failed'])} PDF(s) could not be indexed and will be retried on the next run: {plan['failed']}")
+        return False
+    logger.info(f"Index is in sync with {DEFAULT_PDFS_FOLDER}. Final vector count: {final_count}")
+    return success
 
-    # 7. Add new documents to FAISS Index and Save
-    if not all_new_documents:
-        if processing_errors > 0:
-            logger.error("No new document chunks were generated due to processing errors. Index not updated.")
-            return False
-        else:
-            logger.warning("No new valid document chunks were generated. Index not updated.")
-            return True
+def watch_default_pdfs(interval: float = DEFAULT_PDFS_WATCH_INTERVAL):
+    """Keeps syncing DEFAULT_PDFS_FOLDER into the index until interrupted (Ctrl+C)."""
+    def _after_sync(plan):
+        if ai_core.vector_store:
+            finalize_index()
 
-    logger.info(f"Attempting to add {len(all_new_documents)} new document chunks to the FAISS index...")
-    success = add_documents_to_vector_store(all_new_documents)
+    try:
+        corpus_sync.watch_folder(DEFAULT_PDFS_FOLDER, interval, on_sync=_after_sync)
+    except KeyboardInterrupt:
+        logger.info("Watch mode interrupted.")
 
-    if success:
-        final_count = getattr(getattr(vector_store, 'index', None), 'ntotal', 'N/A')
-        logger.info(f"Successfully added new documents and saved index. Final vector count: {final_count}")
-        return True
-    else:
-        logger.error("Failed to add new documents to the FAISS index or save it.")
-        return False
+def precompute_default_analyses():
+    """Fills the analysis cache (SQLite) for every default PDF, so /analyze is served instantly."""
+    database.init_db() # Creates the analysis_cache table if this runs before the app ever did
+    ai_core.precompute_document_analyses()
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build/update the FAISS index from the default PDFs folder.")
+    parser.add_argument("--rebuild-index", action="store_true", help=f"Retrain the index as FAISS_INDEX_TYPE ({FAISS_INDEX_TYPE}) even if it already matches or is small.")
+    parser.add_argument("--recall-report", action="store_true", help="After building, log recall@k and latency of the index against exact flat search.")
+    parser.add_argument("--precompute-analyses", action="store_true", help="After building, generate and cache FAQ/Topics/Mindmap analyses for every default PDF.")
+    parser.add_argument("--watch", action="store_true", help=f"After building, keep watching {DEFAULT_PDFS_FOLDER} and sync added, changed or deleted PDFs.")
+    parser.add_argument("--watch-interval", type=float, default=DEFAULT_PDFS_WATCH_INTERVAL, help="Seconds between folder polls in --watch mode.")
+    args = parser.parse_args()
+
     logger.info("Running default PDF processing script...")
     # Uncomment to enable DEBUG logging for more detail
     # logging.getLogger().setLevel(logging.DEBUG)
     try:
-        if build_initial_faiss_index():
+        if build_initial_faiss_index(force_rebuild=args.rebuild_index):
             logger.info("--- Default index build/update process completed successfully. ---")
+            if args.recall_report:
+                log_recall_report()
+            if args.precompute_analyses:
+                precompute_default_analyses()
+            if args.watch:
+                watch_default_pdfs(args.watch_interval)
             sys.exit(0)  # Exit with success code
         else:
             logger.error("--- Default index build/update process failed. See logs above for details. ---")
@@ -0,0 +1,158 @@
+# --- START OF FILE embedding_cache.py ---
+
+# Persistent, content-addressed embedding cache.
+# One store per embedding model: vectors are appended to a raw float32 file that is read
+# through a memory map, and a SQLite table maps sha256(normalized chunk text) -> row number.
+# Appends happen inside a SQLite write transaction, which serializes writers across
+# processes (e.g. the web app and default.py running at the same time).
+import os
+import re
+import hashlib
+import logging
+import sqlite3
+import threading
+import numpy as np
+from config import EMBED_CACHE_FOLDER
+
+logger = logging.getLogger(__name__)
+
+_SQL_IN_BATCH = 500 # Max parameters per "IN (...)" lookup
+_stores: dict[str, "EmbeddingStore"] = {}
+_stores_lock = threading.Lock()
+
+
+def normalize_text(text: str) -> str:
+    """Normalizes chunk text for cache keys (whitespace runs collapsed, ends stripped)."""
+    return " ".join(text.split())
+
+
+def text_hash(text: str) -> str:
+    """Content hash used as the cache key for a chunk."""
+    return hashlib.sha256(normalize_text(text).encode('utf-8')).hexdigest()
+
+
+class EmbeddingStore:
+    """Embedding cache for a single model (SQLite index + memory-mapped float32 vectors)."""
+
+    def __init__(self, model_name: str, folder: str = EMBED_CACHE_FOLDER):
+        self.model_name = model_name
+        slug = re.sub(r'[^A-Za-z0-9_.-]+', '_', model_name)
+        self.db_path = os.path.join(folder, f"{slug}.sqlite")
+        self.vectors_path = os.path.join(folder, f"{slug}.f32")
+        self.dim: int | None = None
+        self._mmap: np.memmap | None = None
+        self._mmap_rows = 0
+        self._mmap_lock = threading.Lock()
+        os.makedirs(folder, exist_ok=True)
+        self._init_db()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL;")
+        conn.execute("PRAGMA busy_timeout = 30000;")
+        return conn
+
+    def _init_db(self):
+        conn = self._connect()
+        try:
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS vectors (text_hash TEXT PRIMARY KEY, row INTEGER NOT NULL)")
+            conn.commit()
+            row = conn.execute("SELECT value FROM meta WHERE key = 'dim'").fetchone()
+            self.dim = int(row[0]) if row else None
+        finally:
+            conn.close()
+
+    def _vectors(self, min_rows: int) -> np.ndarray:
+        """Returns a read-only memory map covering at least `min_rows` rows, remapping if the file grew."""
+        with self._mmap_lock:
+            if self._mmap is None or self._mmap_rows < min_rows:
+                row_bytes = self.dim * 4
+                rows = os.path.getsize(self.vectors_path) // row_bytes
+                self._mmap = np.memmap(self.vectors_path, dtype=np.float32, mode='r', shape=(rows, self.dim))
+                self._mmap_rows = rows
+            return self._mmap
+
+    def get_many(self, hashes: list[str]) -> dict[str, list[float]]:
+        """Looks up cached vectors by text hash. Missing hashes are absent from the result."""
+        if not hashes or self.dim is None:
+            return {}
+        rows_by_hash = {}
+        conn = self._connect()
+        try:
+            unique_hashes = list(dict.fromkeys(hashes))
+            for i in range(0, len(unique_hashes), _SQL_IN_BATCH):
+                batch = unique_hashes[i:i + _SQL_IN_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows_by_hash.update(conn.execute(
+                    f"SELECT text_hash, row FROM vectors WHERE text_hash IN ({placeholders})", batch
+                ).fetchall())
+        finally:
+            conn.close()
+        if not rows_by_hash:
+            return {}
+        vectors = self._vectors(max(rows_by_hash.values()) + 1)
+        return {h: vectors[row].tolist() for h, row in rows_by_hash.items()}
+
+    def put_many(self, hashes: list[str], vectors: list[list[float]]):
+        """Appends vectors for hashes that are not cached yet."""
+        if not hashes:
+            return
+        array = np.asarray(vectors, dtype=np.float32)
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE") # Serializes appenders across threads and processes
+            row = conn.execute("SELECT value FROM meta WHERE key = 'dim'").fetchone()
+            if row is None:
+                conn.execute("INSERT INTO meta (key, value) VALUES ('dim', ?)", (str(array.shape[1]),))
+                self.dim = array.shape[1]
+            else:
+                self.dim = int(row[0])
+            if array.shape[1] != self.dim:
+                raise ValueError(f"Embedding dimension {array.shape[1]} does not match cached dimension {self.dim} for model '{self.model_name}'.")
+
+            existing = set()
+            for i in range(0, len(hashes), _SQL_IN_BATCH):
+                batch = hashes[i:i + _SQL_IN_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                existing.update(r[0] for r in conn.execute(f"SELECT text_hash FROM vectors WHERE text_hash IN ({placeholders})", batch))
+            new_items = {}
+            for h, vec in zip(hashes, array):
+                if h not in existing and h not in new_items:
+                    new_items[h] = vec
+            if not new_items:
+                conn.rollback()
+                return
+
+            row_bytes = self.dim * 4
+            with open(self.vectors_path, 'ab') as f:
+                # Drop a torn trailing record left by a crash mid-append
+                size = f.tell()
+                if size % row_bytes:
+                    f.truncate(size - size % row_bytes)
+                first_row = f.seek(0, os.SEEK_END) // row_bytes
+                f.write(np.stack(list(new_items.values())).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            conn.executemany(
+                "INSERT INTO vectors (text_hash, row) VALUES (?, ?)",
+                [(h, first_row + i) for i, h in enumerate(new_items)]
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+
+def get_store(model_name: str) -> EmbeddingStore:
+    """Returns the (process-wide) cache store for an embedding model."""
+    with _stores_lock:
+        store = _stores.get(model_name)
+        if store is None:
+            store = EmbeddingStore(model_name)
+            _stores[model_name] = store
+        return store
+
+# --- END OF FILE embedding_cache.py ---
@@ -0,0 +1,169 @@
+# --- START OF FILE embedding_pipeline.py ---
+
+# Batched, concurrent embedding pipeline.
+# Chunks are embedded in fixed-size batches with a bounded number of requests in flight
+# against the Ollama embed endpoint. Failed batches are retried with exponential backoff,
+# and results are yielded in input order so callers can feed FAISS incrementally.
+# Each batch consults the persistent embedding cache first; only misses hit Ollama.
+import time
+import random
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Callable, Iterator, Sequence
+from config import (
+    EMBED_BATCH_SIZE, EMBED_MAX_IN_FLIGHT, EMBED_MAX_RETRIES, EMBED_RETRY_BACKOFF_SECONDS,
+    EMBED_CACHE_ENABLED, OLLAMA_EMBED_MODEL
+)
+import embedding_cache
+import ollama_gateway
+
+logger = logging.getLogger(__name__)
+
+# Metrics of the most recent pipeline run (exposed via /status)
+_stats_lock = threading.Lock()
+latest_run_stats: dict = {}
+
+
+def _embed_batch_with_retry(embeddings, texts: list[str], batch_number: int, request_class: str) -> list[list[float]]:
+    """Embeds one batch, retrying with exponential backoff (plus jitter) on failure."""
+    attempt = 0
+    while True:
+        try:
+            with ollama_gateway.slot(request_class):
+                vectors = embeddings.embed_documents(texts)
+            if len(vectors) != len(texts):
+                raise ValueError(f"Embedding server returned {len(vectors)} vectors for {len(texts)} texts.")
+            return vectors
+        except Exception as e:
+            attempt += 1
+            if attempt > EMBED_MAX_RETRIES:
+                logger.error(f"Embedding batch {batch_number} failed after {EMBED_MAX_RETRIES} retries: {e}")
+                raise
+            delay = EMBED_RETRY_BACKOFF_SECONDS * (2 ** (attempt - 1)) * (1 + random.random() * 0.25)
+            logger.warning(f"Embedding batch {batch_number} failed ({type(e).__name__}: {e}). Retry {attempt}/{EMBED_MAX_RETRIES} in {delay:.1f}s.")
+            time.sleep(delay)
+
+
+def _embed_batch(embeddings, texts: list[str], batch_number: int,
+                 request_class: str = ollama_gateway.BULK) -> tuple[list[list[float]], int]:
+    """Embeds one batch, serving cached vectors and embedding only the misses.
+
+    Returns:
+        tuple[list[list[float]], int]: (vectors in input order, number of cache hits)
+    """
+    if not EMBED_CACHE_ENABLED:
+        return _embed_batch_with_retry(embeddings, texts, batch_number, request_class), 0
+
+    store = embedding_cache.get_store(getattr(embeddings, 'model', None) or OLLAMA_EMBED_MODEL)
+    hashes = [embedding_cache.text_hash(t) for t in texts]
+    try:
+        cached = store.get_many(hashes)
+    except Exception as e:
+        logger.warning(f"Embedding cache lookup failed for batch {batch_number} ({e}). Embedding all texts.")
+        cached = {}
+
+    miss_positions = [i for i, h in enumerate(hashes) if h not in cached]
+    if miss_positions:
+        miss_vectors = _embed_batch_with_retry(embeddings, [texts[i] for i in miss_positions], batch_number, request_class)
+        miss_hashes = [hashes[i] for i in miss_positions]
+        try:
+            store.put_many(miss_hashes, miss_vectors)
+        except Exception as e:
+            logger.warning(f"Could not store embeddings of batch {batch_number} in the cache: {e}")
+        cached.update(zip(miss_hashes, miss_vectors))
+    return [cached[h] for h in hashes], len(texts) - len(miss_positions)
+
+
+def iter_embedded_batches(
+    embeddings,
+    texts: Sequence[str],
+    batch_size: int = EMBED_BATCH_SIZE,
+    max_in_flight: int = EMBED_MAX_IN_FLIGHT,
+    progress_callback: Callable[[int, int], None] | None = None,
+) -> Iterator[tuple[int, list[list[float]]]]:
+    """Embeds texts in batches with bounded concurrency, yielding results in input order.
+
+    At most `max_in_flight` batches are submitted at any time, so memory stays bounded even
+    for very large inputs.
+
+    Args:
+        embeddings: A LangChain Embeddings instance (e.g. OllamaEmbeddings).
+        texts (Sequence[str]): Texts to embed.
+        batch_size (int): Texts per embed request.
+        max_in_flight (int): Maximum concurrent embed requests.
+        progress_callback (Callable[[int, int], None] | None): Called with (embedded_count, total).
+
+    Yields:
+        tuple[int, list[list[float]]]: (start_offset, vectors) for each batch, in order.
+
+    Raises:
+        Exception: The last error of a batch that exhausted its retries.
+    """
+    total = len(texts)
+    batch_size = max(batch_size, 1)
+    max_in_flight = max(max_in_flight, 1)
+    batch_starts = range(0, total, batch_size)
+    started_at = time.perf_counter()
+    embedded_count = 0
+    cache_hits = 0
+
+    with ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="embed") as executor:
+        pending: deque[tuple[int, Future]] = deque()
+        next_batch = iter(enumerate(batch_starts))
+
+        def _submit_next() -> bool:
+            item = next(next_batch, None)
+            if item is None:
+                return False
+            batch_number, start = item
+            batch_texts = list(texts[start:start + batch_size])
+            pending.append((start, executor.submit(_embed_batch, embeddings, batch_texts, batch_number)))
+            return True
+
+        for _ in range(max_in_flight):
+            if not _submit_next():
+                break
+
+        try:
+            while pending:
+                start, future = pending.popleft()
+                vectors, batch_cache_hits = future.result()
+                _submit_next() # Keep the window full while the caller consumes this batch
+                embedded_count += len(vectors)
+                cache_hits += batch_cache_hits
+                if progress_callback:
+                    progress_callback(embedded_count, total)
+                yield start, vectors
+        finally:
+            for _, future in pending:
+                future.cancel()
+            elapsed = time.perf_counter() - started_at
+            _record_stats(embedded_count, total, elapsed, batch_size, max_in_flight, cache_hits)
+
+
+def _record_stats(embedded_count: int, total: int, elapsed: float, batch_size: int, max_in_flight: int, cache_hits: int):
+    """Logs and stores throughput metrics for the finished (or aborted) run."""
+    throughput = embedded_count / elapsed if elapsed > 0 else 0.0
+    stats = {
+        "chunks_embedded": embedded_count,
+        "chunks_requested": total,
+        "cache_hits": cache_hits,
+        "elapsed_seconds": round(elapsed, 3),
+        "chunks_per_second": round(throughput, 2),
+        "batch_size": batch_size,
+        "max_in_flight": max_in_flight,
+    }
+    with _stats_lock:
+        latest_run_stats.clear()
+        latest_run_stats.update(stats)
+    logger.info(f"Embedded {embedded_count}/{total} chunks in {elapsed:.2f}s ({throughput:.1f} chunks/s, {cache_hits} from cache, batch={batch_size}, in-flight={max_in_flight}).")
+
+
+def get_latest_stats() -> dict:
+    """Returns a copy of the metrics from the most recent pipeline run."""
+    with _stats_lock:
+        return dict(latest_run_stats)
+
+# --- END OF FILE embedding_pipeline.py ---
@@ -0,0 +1,220 @@
+# --- START OF FILE jobs.py ---
+
+# Background processing of uploaded PDFs.
+# /upload only saves the file and enqueues a job; a small worker pool runs
+# extract -> chunk -> embed -> index and records progress that /jobs/<id> reports.
+import os
+import time
+import uuid
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from config import UPLOAD_JOB_WORKERS, UPLOAD_JOB_RETENTION_SECONDS
+import ai_core
+
+logger = logging.getLogger(__name__)
+
+# Job lifecycle: queued -> running (stage: extracting/chunking/embedding/indexing) -> completed | failed
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+STATUS_COMPLETED = 'completed'
+STATUS_FAILED = 'failed'
+
+# Overall percent at which each stage starts; embedding progress fills the gap up to 'indexing'
+_STAGE_START_PERCENT = {
+    'queued': 0,
+    'extracting': 5,
+    'chunking': 15,
+    'embedding': 20,
+    'indexing': 95,
+    'done': 100,
+}
+
+_jobs: dict[str, dict] = {}
+_jobs_lock = threading.Lock()
+_executor: ThreadPoolExecutor | None = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    """Lazily creates the upload worker pool."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=max(UPLOAD_JOB_WORKERS, 1), thread_name_prefix="upload-job")
+            logger.info(f"Started upload job pool with {max(UPLOAD_JOB_WORKERS, 1)} worker(s).")
+        return _executor
+
+
+def _update_job(job_id: str, **fields):
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        if job is not None:
+            job.update(fields)
+            job['updated_at'] = time.time()
+
+
+def _set_stage(job_id: str, stage: str):
+    _update_job(job_id, status=STATUS_RUNNING, stage=stage, percent=_STAGE_START_PERCENT[stage])
+    logger.debug(f"Upload job {job_id}: stage '{stage}'.")
+
+
+def _finish_job(job_id: str, status: str, message: str, **fields):
+    """Marks a job completed or failed. Failed jobs keep the percent they reached."""
+    if status == STATUS_COMPLETED:
+        fields['percent'] = 100
+    _update_job(job_id, status=status, stage='done', message=message, finished_at=time.time(), **fields)
+
+
+def _prune_finished_jobs():
+    """Forgets finished jobs older than UPLOAD_JOB_RETENTION_SECONDS."""
+    cutoff = time.time() - UPLOAD_JOB_RETENTION_SECONDS
+    with _jobs_lock:
+        expired = [jid for jid, job in _jobs.items() if job.get('finished_at') and job['finished_at'] < cutoff]
+        for jid in expired:
+            del _jobs[jid]
+    if expired:
+        logger.debug(f"Pruned {len(expired)} finished upload job(s).")
+
+
+def _remove_file(filepath: str, reason: str):
+    try:
+        os.remove(filepath)
+        logger.info(f"Removed file {filepath} because {reason}.")
+    except OSError as rm_err:
+        logger.error(f"Error removing file {filepath} after {reason}: {rm_err}")
+
+
+def _run_upload_job(job_id: str, filepath: str, filename: str):
+    """Worker body: extract -> chunk -> embed -> index for one uploaded file."""
+    started_at = time.perf_counter()
+    try:
+        # 1. Extract text (persists to the text store)
+        _set_stage(job_id, 'extracting')
+        text = ai_core.get_document_text(filepath)
+        if not text:
+            _remove_file(filepath, "text extraction failed")
+            logger.error(f"Could not extract text from uploaded file: {filename}. It might be empty, corrupted, or password-protected.")
+            _finish_job(job_id, STATUS_FAILED, "Text extraction failed.",
+                        error=f"Could not read text from '{filename}'. Please check if the PDF is valid and not password-protected.")
+            return
+        ai_core.document_texts_cache.put(filename, text)
+        logger.info(f"Text extracted ({len(text)} chars) and cached for {filename}.")
+
+        # 2. Chunk
+        _set_stage(job_id, 'chunking')
+        documents = ai_core.create_chunks_from_text(text, filename)
+        if not documents:
+            # Text extracted but chunking failed. Keep file & cache, but RAG won't work.
+            logger.error(f"Could not create document chunks for {filename}, although text was extracted. File kept and cached, but cannot add to knowledge base for chat.")
+            _finish_job(job_id, STATUS_FAILED, "Chunking failed.",
+                        error=f"Could not process the structure of '{filename}' into searchable chunks. Analysis might work, but chat context cannot be added for this file.")
+            return
+
+        # 3. Embed + 4. Index (the embedding pipeline reports progress per batch)
+        _set_stage(job_id, 'embedding')
+        _update_job(job_id, chunks_total=len(documents), chunks_embedded=0)
+        embed_span = _STAGE_START_PERCENT['indexing'] - _STAGE_START_PERCENT['embedding']
+
+        def _on_progress(embedded_count: int, total: int):
+            percent = _STAGE_START_PERCENT['embedding'] + int(embed_span * embedded_count / max(total, 1))
+            _update_job(job_id, chunks_embedded=embedded_count, percent=percent)
+            if embedded_count >= total:
+                _set_stage(job_id, 'indexing')
+
+        # Re-uploading a file replaces its previously indexed chunks instead of duplicating them
+        if not ai_core.replace_source_documents(filename, documents, progress_callback=_on_progress):
+            logger.error(f"Failed to add document chunks for '{filename}' to the vector store or save the index. Check logs.")
+            _finish_job(job_id, STATUS_FAILED, "Indexing failed.",
+                        error=f"File '{filename}' processed, but failed to update the knowledge base index. Consult server logs.")
+            return
+
+        vector_count = -1
+        if ai_core.vector_store and hasattr(ai_core.vector_store, 'index'):
+            vector_count = getattr(ai_core.vector_store.index, 'ntotal', 0)
+        elapsed = time.perf_counter() - started_at
+        logger.info(f"Upload job {job_id}: processed, cached, and indexed '{filename}' in {elapsed:.2f}s. New vector count: {vector_count}")
+        _finish_job(job_id, STATUS_COMPLETED, f"File '{filename}' uploaded and added to knowledge base successfully.",
+                    vector_count=vector_count, elapsed_seconds=round(elapsed, 3))
+
+    except Exception as e:
+        logger.error(f"Unexpected error in upload job {job_id} for '{filename}': {e}", exc_info=True)
+        if os.path.exists(filepath):
+            _remove_file(filepath, "an upload processing error")
+        _finish_job(job_id, STATUS_FAILED, "Unexpected error.",
+                    error=f"An unexpected server error occurred while processing the file: {type(e).__name__}. Please check server logs.")
+
+
+def find_active_job(filename: str) -> dict | None:
+    """Returns a snapshot of the queued/running job for `filename`, if any."""
+    with _jobs_lock:
+        for job in _jobs.values():
+            if job['filename'] == filename and job['status'] in (STATUS_QUEUED, STATUS_RUNNING):
+                return dict(job)
+    return None
+
+
+def reserve_upload_job(filename: str) -> tuple[dict, bool]:
+    """Registers a queued job for `filename` unless a queued/running job already holds that name.
+
+    The check and the registration happen under one lock, so two concurrent uploads of the
+    same name cannot both save over the file. Call this before saving the upload, then
+    start_upload_job() once it is saved or release_upload_job() if saving fails.
+
+    Returns:
+        tuple[dict, bool]: A snapshot of the new job and True, or a snapshot of the
+                           conflicting active job and False.
+    """
+    _prune_finished_jobs()
+    now = time.time()
+    job = {
+        'job_id': uuid.uuid4().hex,
+        'filename': filename,
+        'status': STATUS_QUEUED,
+        'stage': 'queued',
+        'percent': 0,
+        'chunks_total': None,
+        'chunks_embedded': 0,
+        'vector_count': None,
+        'message': "Waiting for a worker.",
+        'error': None,
+        'created_at': now,
+        'updated_at': now,
+        'finished_at': None,
+    }
+    with _jobs_lock:
+        for active in _jobs.values():
+            if active['filename'] == filename and active['status'] in (STATUS_QUEUED, STATUS_RUNNING):
+                return dict(active), False
+        _jobs[job['job_id']] = job
+        return dict(job), True
+
+
+def release_upload_job(job_id: str):
+    """Drops a reserved job whose upload could not be saved."""
+    with _jobs_lock:
+        _jobs.pop(job_id, None)
+
+
+def start_upload_job(job_id: str, filepath: str, filename: str):
+    """Queues a reserved job on the worker pool once its file is saved."""
+    _get_executor().submit(_run_upload_job, job_id, filepath, filename)
+    logger.info(f"Queued upload job {job_id} for '{filename}'.")
+
+
+def get_job(job_id: str) -> dict | None:
+    """Returns a snapshot of a job's state, or None if unknown (or pruned)."""
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        return dict(job) if job else None
+
+
+def get_job_counts() -> dict:
+    """Counts of known jobs per status (for /status)."""
+    counts = {STATUS_QUEUED: 0, STATUS_RUNNING: 0, STATUS_COMPLETED: 0, STATUS_FAILED: 0}
+    with _jobs_lock:
+        for job in _jobs.values():
+            counts[job['status']] = counts.get(job['status'], 0) + 1
+    return counts
+
+# --- END OF FILE jobs.py ---
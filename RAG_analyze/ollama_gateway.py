@@ -0,0 +1,196 @@
+# --- START OF FILE ollama_gateway.py ---
+
+# Shared scheduler for every request the app sends to Ollama.
+# LLM and embedding calls run inside `slot(request_class)`. A slot is granted while fewer than
+# OLLAMA_MAX_CONCURRENCY requests are in flight and the class is under its own limit (both per
+# healthy backend, see ollama_pool.py, so capacity scales with the number of servers). Waiting
+# requests are served by class priority (chat > analysis > bulk), FIFO within a class, so a bulk
+# upload can neither hold every slot nor jump ahead of an interactive chat. A request that cannot
+# start before its class deadline fails with QueueTimeout instead of queueing indefinitely.
+# Queue wait and service time are tracked per class for /status.
+# Each backend's ChatOllama / OllamaEmbeddings clients keep a keep-alive HTTP connection pool,
+# sized by `http_client_kwargs()`.
+import time
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Iterator
+import httpx
+import numpy as np
+from config import (
+    OLLAMA_MAX_CONCURRENCY, OLLAMA_CHAT_CONCURRENCY, OLLAMA_ANALYSIS_CONCURRENCY, OLLAMA_BULK_CONCURRENCY,
+    OLLAMA_CHAT_QUEUE_TIMEOUT, OLLAMA_ANALYSIS_QUEUE_TIMEOUT, OLLAMA_BULK_QUEUE_TIMEOUT, OLLAMA_HTTP_KEEPALIVE_SECONDS
+)
+
+logger = logging.getLogger(__name__)
+
+CHAT = "chat" # Interactive: chat synthesis, sub-query generation, query embeddings
+ANALYSIS = "analysis" # /analyze and its map-reduce steps
+BULK = "bulk" # Upload / corpus embedding
+REQUEST_CLASSES = (CHAT, ANALYSIS, BULK) # Highest priority first
+
+_SAMPLE_WINDOW = 512 # Recent requests per class used for latency percentiles
+
+
+class QueueTimeout(TimeoutError):
+    """Raised when a request could not get an Ollama slot before its deadline."""
+
+
+class _ClassMetrics:
+    def __init__(self):
+        self.completed = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.waits: deque[float] = deque(maxlen=_SAMPLE_WINDOW)
+        self.services: deque[float] = deque(maxlen=_SAMPLE_WINDOW)
+
+    @staticmethod
+    def _summary(samples: deque) -> dict:
+        if not samples:
+            return {"avg_ms": None, "p95_ms": None}
+        values = np.fromiter(samples, dtype=np.float64) * 1000
+        return {"avg_ms": round(float(values.mean()), 1), "p95_ms": round(float(np.percentile(values, 95)), 1)}
+
+    def snapshot(self) -> dict:
+        return {
+            "completed": self.completed,
+            "failed": self.failed,
+            "timeouts": self.timeouts,
+            "queue_wait": self._summary(self.waits),
+            "service_time": self._summary(self.services),
+        }
+
+
+class OllamaGateway:
+    """Priority scheduler with a global and per-class concurrency limit and queue deadlines."""
+
+    def __init__(self, max_concurrency: int, class_limits: dict[str, int], queue_timeouts: dict[str, float]):
+        self.max_concurrency = max(int(max_concurrency), 1)
+        self.class_limits = {cls: max(int(class_limits.get(cls, self.max_concurrency)), 1) for cls in REQUEST_CLASSES}
+        self.queue_timeouts = {cls: float(queue_timeouts.get(cls, 0)) for cls in REQUEST_CLASSES}
+        self._cond = threading.Condition()
+        self._in_flight = {cls: 0 for cls in REQUEST_CLASSES}
+        self._waiting: dict[str, deque[object]] = {cls: deque() for cls in REQUEST_CLASSES}
+        self._metrics = {cls: _ClassMetrics() for cls in REQUEST_CLASSES}
+        self._backends = 1 # Healthy Ollama servers; all limits are per server
+
+    def set_backend_count(self, count: int):
+        """Scales the concurrency limits to `count` healthy backends (at least 1)."""
+        with self._cond:
+            self._backends = max(int(count), 1)
+            self._cond.notify_all()
+
+    def _can_start(self, request_class: str, ticket: object) -> bool:
+        if self._waiting[request_class][0] is not ticket:
+            return False # FIFO within a class
+        if (sum(self._in_flight.values()) >= self.max_concurrency * self._backends
+                or self._in_flight[request_class] >= self.class_limits[request_class] * self._backends):
+            return False
+        for cls in REQUEST_CLASSES:
+            if cls == request_class:
+                return True
+            # A higher class that is waiting and could start takes precedence
+            if self._waiting[cls] and self._in_flight[cls] < self.class_limits[cls] * self._backends:
+                return False
+        return True
+
+    @contextmanager
+    def slot(self, request_class: str, timeout: float | None = None) -> Iterator[None]:
+        """Holds one Ollama slot of `request_class` for the duration of the block.
+
+        Args:
+            request_class (str): CHAT, ANALYSIS or BULK.
+            timeout (float | None): Max seconds to wait for the slot; defaults to the class
+                deadline (OLLAMA_*_QUEUE_TIMEOUT, 0 = no deadline).
+
+        Raises:
+            QueueTimeout: If no slot became free before the deadline.
+        """
+        if request_class not in self._waiting:
+            raise ValueError(f"Unknown Ollama request class '{request_class}'. Expected one of {REQUEST_CLASSES}.")
+        timeout = self.queue_timeouts[request_class] if timeout is None else timeout
+        enqueued_at = time.monotonic()
+        deadline = enqueued_at + timeout if timeout and timeout > 0 else None
+        ticket = object()
+        metrics = self._metrics[request_class]
+        with self._cond:
+            self._waiting[request_class].append(ticket)
+            try:
+                while not self._can_start(request_class, ticket):
+                    remaining = deadline - time.monotonic() if deadline is not None else None
+                    if remaining is not None and remaining <= 0:
+                        metrics.timeouts += 1
+                        raise QueueTimeout(f"No Ollama slot for a '{request_class}' request within {timeout:.0f}s "
+                                           f"({sum(self._in_flight.values())} in flight, {sum(map(len, self._waiting.values())) - 1} queued).")
+                    self._cond.wait(remaining)
+            except BaseException:
+                self._waiting[request_class].remove(ticket)
+                self._cond.notify_all() # The next request of this class may now be at the head
+                raise
+            self._waiting[request_class].popleft()
+            self._in_flight[request_class] += 1
+            self._cond.notify_all() # The next request of this class may start too
+        started_at = time.monotonic()
+        failed = False
+        try:
+            yield
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            with self._cond:
+                self._in_flight[request_class] -= 1
+                metrics.waits.append(started_at - enqueued_at)
+                metrics.services.append(time.monotonic() - started_at)
+                if failed:
+                    metrics.failed += 1
+                else:
+                    metrics.completed += 1
+                self._cond.notify_all()
+
+    def stats(self) -> dict:
+        """Returns per-class load and latency metrics suitable for the /status endpoint."""
+        with self._cond:
+            return {
+                "max_concurrency": self.max_concurrency * self._backends,
+                "in_flight": sum(self._in_flight.values()),
+                "classes": {
+                    cls: {
+                        "limit": self.class_limits[cls] * self._backends,
+                        "in_flight": self._in_flight[cls],
+                        "queued": len(self._waiting[cls]),
+                        **self._metrics[cls].snapshot(),
+                    }
+                    for cls in REQUEST_CLASSES
+                },
+            }
+
+
+gateway = OllamaGateway(
+    OLLAMA_MAX_CONCURRENCY,
+    {CHAT: OLLAMA_CHAT_CONCURRENCY, ANALYSIS: OLLAMA_ANALYSIS_CONCURRENCY, BULK: OLLAMA_BULK_CONCURRENCY},
+    {CHAT: OLLAMA_CHAT_QUEUE_TIMEOUT, ANALYSIS: OLLAMA_ANALYSIS_QUEUE_TIMEOUT, BULK: OLLAMA_BULK_QUEUE_TIMEOUT},
+)
+
+
+def slot(request_class: str, timeout: float | None = None):
+    """Holds a slot of the shared gateway (see OllamaGateway.slot)."""
+    return gateway.slot(request_class, timeout)
+
+
+def stats() -> dict:
+    return gateway.stats()
+
+
+def http_client_kwargs() -> dict:
+    """httpx client settings for one backend's ChatOllama / OllamaEmbeddings: a keep-alive pool with room for every slot."""
+    return {
+        "limits": httpx.Limits(
+            max_connections=gateway.max_concurrency * 2,
+            max_keepalive_connections=gateway.max_concurrency,
+            keepalive_expiry=OLLAMA_HTTP_KEEPALIVE_SECONDS,
+        )
+    }
+
+# --- END OF FILE ollama_gateway.py ---
@@ -0,0 +1,272 @@
+# --- START OF FILE ollama_pool.py ---
+
+# Pool of Ollama servers (OLLAMA_BASE_URLS) behind the app's single `llm` / `embeddings` objects.
+# PooledChatOllama and PooledOllamaEmbeddings are drop-in LangChain models: each call goes to the
+# healthy backend with the fewest outstanding requests (ties rotate). A backend is ejected after
+# OLLAMA_EJECT_AFTER_FAILURES consecutive connection failures (the request is retried on another
+# backend) or a failed health probe, and re-admitted once a probe succeeds again. With several
+# backends, probes run every OLLAMA_HEALTH_CHECK_INTERVAL seconds in a background thread.
+# The gateway's concurrency limits (ollama_gateway) scale with the number of healthy backends.
+import logging
+import threading
+from typing import Any, Callable, Iterator
+import httpx
+import ollama
+import requests
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+from langchain_ollama import OllamaEmbeddings, ChatOllama
+from config import OLLAMA_BASE_URLS, OLLAMA_HEALTH_CHECK_INTERVAL, OLLAMA_HEALTH_CHECK_TIMEOUT, OLLAMA_EJECT_AFTER_FAILURES
+import ollama_gateway
+
+logger = logging.getLogger(__name__)
+
+
+def check_ollama_connection(base_url: str, timeout: float = 5, verbose: bool = True) -> bool:
+    """
+    Performs a basic check to see if the Ollama server is reachable.
+
+    Args:
+        base_url (str): The base URL of the Ollama server.
+        timeout (float): Connection timeout in seconds.
+        verbose (bool): Log the outcome at INFO/ERROR; False logs at DEBUG (periodic probes).
+
+    Returns:
+        bool: True if the server responds successfully, False otherwise.
+    """
+    log_info = logger.info if verbose else logger.debug
+    log_error = logger.error if verbose else logger.debug
+    check_url = base_url.rstrip('/') + "/api/tags"  # Use a known API endpoint
+    log_info(f"Checking Ollama connection at {check_url} (timeout: {timeout}s)...")
+    try:
+        response = requests.get(check_url, timeout=timeout)
+        response.raise_for_status()  # Raises HTTPError for bad responses (4xx or 5xx)
+        response.json()  # Ensure it’s valid JSON
+        log_info(f"Ollama server responded successfully (Status: {response.status_code}).")
+        return True
+    except requests.exceptions.Timeout:
+        log_error(f"Ollama connection timed out after {timeout} seconds connecting to {check_url}.")
+        return False
+    except requests.exceptions.ConnectionError:
+        log_error(f"Ollama connection refused at {check_url}. Is the Ollama server running and accessible?")
+        return False
+    except requests.exceptions.RequestException as e:
+        log_error(f"Ollama connection failed for {check_url}: {e}")
+        return False
+    except ValueError:  # Handles JSONDecodeError if response isn’t valid JSON
+        log_error(f"Ollama server at {check_url} did not return valid JSON. Unexpected response.")
+        return False
+
+
+def is_backend_failure(error: BaseException) -> bool:
+    """True if the error means the server is unreachable or broken (not a problem with the request)."""
+    if isinstance(error, (ConnectionError, httpx.TransportError)):
+        return True
+    return isinstance(error, ollama.ResponseError) and getattr(error, 'status_code', 0) >= 500
+
+
+class OllamaBackend:
+    """One Ollama server with its LangChain clients and routing state."""
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url
+        self.chat: ChatOllama | None = None
+        self.embeddings: OllamaEmbeddings | None = None
+        self.healthy = True
+        self.outstanding = 0
+        self.consecutive_failures = 0
+        self.requests = 0
+        self.failures = 0
+        self.ejections = 0
+        self.last_error: str | None = None
+
+
+class BackendPool:
+    """Least-outstanding-requests routing over Ollama backends, with ejection and re-admission."""
+
+    def __init__(self, base_urls: list[str]):
+        self.backends = [OllamaBackend(url) for url in dict.fromkeys(base_urls)]
+        self._lock = threading.Lock()
+        self._rotation = 0 # Tie-break offset, so equally loaded backends take turns
+        self._stop_probes = threading.Event()
+        self._probe_thread: threading.Thread | None = None
+        ollama_gateway.gateway.set_backend_count(len(self.backends)) # All start healthy
+
+    def create_clients(self, chat_model: str, embed_model: str, client_kwargs: dict):
+        """Creates the ChatOllama / OllamaEmbeddings clients of every backend."""
+        for backend in self.backends:
+            backend.chat = ChatOllama(model=chat_model, base_url=backend.base_url, client_kwargs=client_kwargs)
+            backend.embeddings = OllamaEmbeddings(model=embed_model, base_url=backend.base_url, client_kwargs=client_kwargs)
+
+    def healthy_count(self) -> int:
+        with self._lock:
+            return sum(backend.healthy for backend in self.backends)
+
+    def acquire(self, exclude: list[OllamaBackend] = ()) -> OllamaBackend | None:
+        """Picks the least-loaded healthy backend not in `exclude` and counts the request against it.
+
+        If every remaining backend is ejected, they are tried anyway (the probe may lag behind).
+        Returns None if no backend is left.
+        """
+        with self._lock:
+            remaining = [backend for backend in self.backends if backend not in exclude]
+            candidates = [backend for backend in remaining if backend.healthy] or remaining
+            if not candidates:
+                return None
+            count = len(self.backends)
+            backend = min(candidates, key=lambda b: (b.outstanding, (self.backends.index(b) - self._rotation) % count))
+            self._rotation = (self._rotation + 1) % count
+            backend.outstanding += 1
+            backend.requests += 1
+            return backend
+
+    def release(self, backend: OllamaBackend, error: BaseException | None = None):
+        """Ends a request; backend failures count towards ejection, successes reset the count."""
+        with self._lock:
+            backend.outstanding -= 1
+            if error is None:
+                backend.consecutive_failures = 0
+                return
+            if not is_backend_failure(error):
+                return
+            backend.failures += 1
+            backend.consecutive_failures += 1
+            backend.last_error = f"{type(error).__name__}: {error}"[:200]
+            if backend.healthy and backend.consecutive_failures >= OLLAMA_EJECT_AFTER_FAILURES:
+                self._set_health(backend, False, f"{backend.consecutive_failures} consecutive failures ({backend.last_error})")
+
+    def can_retry(self, error: BaseException, tried: list[OllamaBackend]) -> bool:
+        """True if a failed request should be retried on another backend."""
+        return is_backend_failure(error) and len(tried) < len(self.backends)
+
+    def call(self, fn: Callable[[OllamaBackend], Any]) -> Any:
+        """Runs `fn(backend)` on the least-loaded backend, retrying backend failures on the others."""
+        tried = []
+        while True:
+            backend = self.acquire(exclude=tried)
+            try:
+                result = fn(backend)
+            except Exception as e:
+                self.release(backend, e)
+                tried.append(backend)
+                if not self.can_retry(e, tried):
+                    raise
+                logger.warning(f"Ollama backend {backend.base_url} failed ({type(e).__name__}: {e}). Retrying on another backend.")
+                continue
+            self.release(backend)
+            return result
+
+    def _set_health(self, backend: OllamaBackend, healthy: bool, reason: str):
+        """Ejects or re-admits a backend (caller holds the lock) and rescales the gateway."""
+        backend.healthy = healthy
+        if healthy:
+            backend.consecutive_failures = 0
+            logger.info(f"Ollama backend {backend.base_url} re-admitted ({reason}).")
+        else:
+            backend.ejections += 1
+            logger.warning(f"Ollama backend {backend.base_url} ejected: {reason}.")
+        ollama_gateway.gateway.set_backend_count(sum(b.healthy for b in self.backends))
+
+    def probe_all(self):
+        """Health-checks every backend, ejecting unreachable ones and re-admitting recovered ones."""
+        for backend in self.backends:
+            reachable = check_ollama_connection(backend.base_url, OLLAMA_HEALTH_CHECK_TIMEOUT, verbose=False)
+            with self._lock:
+                if reachable != backend.healthy:
+                    self._set_health(backend, reachable, "health probe succeeded" if reachable else "health probe failed")
+
+    def _probe_loop(self, interval: float):
+        while not self._stop_probes.wait(interval):
+            try:
+                self.probe_all()
+            except Exception as e:
+                logger.error(f"Ollama health probe failed unexpectedly: {e}", exc_info=True)
+
+    def start_health_checks(self, interval: float = OLLAMA_HEALTH_CHECK_INTERVAL):
+        """Starts the background probe thread (only useful with more than one backend)."""
+        if len(self.backends) < 2 or (self._probe_thread and self._probe_thread.is_alive()):
+            return
+        self._stop_probes.clear()
+        self._probe_thread = threading.Thread(target=self._probe_loop, args=(interval,), name="ollama-health", daemon=True)
+        self._probe_thread.start()
+        logger.info(f"Probing {len(self.backends)} Ollama backends every {interval:.0f}s.")
+
+    def stop_health_checks(self):
+        self._stop_probes.set()
+        if self._probe_thread:
+            self._probe_thread.join()
+            self._probe_thread = None
+
+    def stats(self) -> list[dict]:
+        """Returns per-backend state suitable for the /status endpoint."""
+        with self._lock:
+            return [
+                {
+                    "url": backend.base_url,
+                    "healthy": backend.healthy,
+                    "outstanding": backend.outstanding,
+                    "requests": backend.requests,
+                    "failures": backend.failures,
+                    "ejections": backend.ejections,
+                    "last_error": backend.last_error,
+                }
+                for backend in self.backends
+            ]
+
+
+pool = BackendPool(OLLAMA_BASE_URLS)
+
+
+class PooledChatOllama(BaseChatModel):
+    """ChatOllama over the backend pool: each invoke/stream is routed to the least-loaded backend."""
+
+    model: str
+
+    @property
+    def _llm_type(self) -> str:
+        return "pooled-chat-ollama"
+
+    def _generate(self, messages: list[BaseMessage], stop: list[str] | None = None,
+                  run_manager: CallbackManagerForLLMRun | None = None, **kwargs: Any) -> ChatResult:
+        return pool.call(lambda backend: backend.chat._generate(messages, stop=stop, run_manager=run_manager, **kwargs))
+
+    def _stream(self, messages: list[BaseMessage], stop: list[str] | None = None,
+                run_manager: CallbackManagerForLLMRun | None = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        tried = []
+        while True:
+            backend = pool.acquire(exclude=tried)
+            streamed = False
+            try:
+                for chunk in backend.chat._stream(messages, stop=stop, run_manager=run_manager, **kwargs):
+                    streamed = True
+                    yield chunk
+            except Exception as e:
+                pool.release(backend, e)
+                tried.append(backend)
+                if streamed or not pool.can_retry(e, tried): # Output already sent cannot be replayed elsewhere
+                    raise
+                logger.warning(f"Ollama backend {backend.base_url} failed before streaming ({type(e).__name__}: {e}). Retrying on another backend.")
+                continue
+            except BaseException: # Consumer stopped early (e.g. client disconnected)
+                pool.release(backend)
+                raise
+            pool.release(backend)
+            return
+
+
+class PooledOllamaEmbeddings(Embeddings):
+    """OllamaEmbeddings over the backend pool: each request goes to the least-loaded backend."""
+
+    def __init__(self, model: str):
+        self.model = model
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return pool.call(lambda backend: backend.embeddings.embed_documents(texts))
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embed_documents([text])[0]
+
+# --- END OF FILE ollama_pool.py ---
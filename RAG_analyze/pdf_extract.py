@@ -0,0 +1,97 @@
+# --- START OF FILE pdf_extract.py ---
+
+# Page-sharded PDF text extraction engine.
+# Small PDFs are extracted inline; large PDFs are split into page ranges that are
+# extracted concurrently by a shared process pool and joined once at the end.
+# The per-page work lives in pdf_workers, which pool workers import instead of this module
+# (or the app), so they start without LangChain, FAISS or Ollama clients.
+import os
+import atexit
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import fitz  # PyMuPDF
+from config import (
+    PDF_EXTRACT_WORKERS, PDF_EXTRACT_PAGES_PER_SHARD, PDF_EXTRACT_PARALLEL_MIN_PAGES
+)
+import pdf_workers
+from pdf_workers import EXTRACTOR_VERSION, PAGE_SEPARATOR, join_pages # Re-exported for text_store / ai_core
+
+logger = logging.getLogger(__name__)
+
+_pool: ProcessPoolExecutor | None = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    """Lazily creates the shared extraction process pool."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Workers import pdf_workers only (not the app's __main__), see pdf_workers.spawn_context
+            _pool = ProcessPoolExecutor(
+                max_workers=PDF_EXTRACT_WORKERS,
+                mp_context=pdf_workers.spawn_context()
+            )
+            logger.info(f"Started PDF extraction process pool with {PDF_EXTRACT_WORKERS} workers.")
+        return _pool
+
+
+def shutdown_pool():
+    """Shuts down the shared extraction pool (registered with atexit)."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+            logger.debug("PDF extraction process pool shut down.")
+
+atexit.register(shutdown_pool)
+
+
+def extract_pdf_pages(pdf_path: str) -> list[str] | None:
+    """Extracts cleaned text for every page of a PDF, sharding large files across the process pool.
+
+    Args:
+        pdf_path (str): The full path to the PDF file.
+
+    Returns:
+        list[str] | None: One cleaned string per page, or None if the file could not be opened.
+    """
+    filename = os.path.basename(pdf_path)
+    try:
+        with fitz.open(pdf_path) as doc:
+            if doc.needs_pass:
+                logger.error(f"Error extracting text from PDF {filename}: File is password-protected.")
+                return None
+            num_pages = len(doc)
+    except Exception as e:
+        logger.error(f"Error opening PDF {filename} for extraction: {e}", exc_info=True)
+        return None
+
+    shard_size = max(PDF_EXTRACT_PAGES_PER_SHARD, 1)
+    use_pool = PDF_EXTRACT_WORKERS > 1 and num_pages >= PDF_EXTRACT_PARALLEL_MIN_PAGES
+    logger.debug(f"Starting text extraction from {filename} ({num_pages} pages, {'parallel' if use_pool else 'inline'})...")
+
+    if not use_pool:
+        shard_results = [pdf_workers.extract_page_range(pdf_path, 0, num_pages)]
+    else:
+        shards = [(start, min(start + shard_size, num_pages)) for start in range(0, num_pages, shard_size)]
+        try:
+            pool = _get_pool()
+            futures = [pool.submit(pdf_workers.extract_page_range, pdf_path, start, end) for start, end in shards]
+            shard_results = [future.result() for future in futures] # Preserves page order
+        except Exception as pool_err:
+            # A broken pool (e.g. killed worker) should not fail the upload; fall back to inline extraction
+            logger.warning(f"Parallel extraction failed for {filename} ({pool_err}). Falling back to inline extraction.")
+            shutdown_pool()
+            shard_results = [pdf_workers.extract_page_range(pdf_path, 0, num_pages)]
+
+    page_texts = []
+    for shard_pages, shard_errors in shard_results:
+        page_texts.extend(shard_pages)
+        for page_num, page_err in shard_errors:
+            logger.warning(f"Error processing page {page_num+1} of {filename}: {page_err}")
+    return page_texts
+
+# --- END OF FILE pdf_extract.py ---
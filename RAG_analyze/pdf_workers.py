@@ -0,0 +1,124 @@
+# --- START OF FILE pdf_workers.py ---
+
+# Code that runs inside PDF extraction worker processes (pdf_extract, corpus_sync), and the
+# process context that starts them.
+# With the 'spawn' start method, each worker normally re-imports the parent's __main__ module
+# (as __mp_main__). When that is app.py or default.py, every worker would import ai_core,
+# LangChain and FAISS and repeat the app's startup. Workers started from `spawn_context()` are
+# given an empty __main__ instead, so they only import the module a task function lives in.
+# Task functions must therefore be top-level functions of importable modules, and this module
+# only imports the standard library and PyMuPDF (not config), so workers start quickly.
+import re
+import sys
+import types
+import threading
+import multiprocessing
+import multiprocessing.context
+import fitz  # PyMuPDF
+
+# Bump whenever the cleaning/joining rules below change, so persisted text derived
+# from an older extractor is recognised as stale.
+EXTRACTOR_VERSION = "2"
+
+PAGE_SEPARATOR = "\n\n" # Double newline between pages (same as the original serial extractor)
+
+# Precompiled cleaning patterns (previously recompiled per page)
+_HORIZONTAL_WS_RE = re.compile(r'[ \t\f\v]+') # Horizontal whitespace -> single space
+_MULTI_NEWLINE_RE = re.compile(r'\n+')        # Collapse runs of newlines
+
+_main_swap_lock = threading.Lock()
+
+
+def clean_page_text(raw_text: str) -> str:
+    """Applies the basic whitespace cleaning used for every extracted page."""
+    page_text = raw_text.strip()
+    page_text = _HORIZONTAL_WS_RE.sub(' ', page_text)
+    page_text = _MULTI_NEWLINE_RE.sub('\n', page_text)
+    return page_text
+
+
+def extract_page_range(pdf_path: str, start_page: int, end_page: int | None = None) -> tuple[list[str], list[tuple[int, str]]]:
+    """Extracts and cleans pages [start_page, end_page) of a PDF (to the last page if end_page is None).
+
+    Returns:
+        tuple[list[str], list[tuple[int, str]]]: (page_texts, page_errors). page_texts has one entry
+            per page in the range ("" for empty or failed pages); page_errors lists (page_num, error).
+    """
+    page_texts = []
+    page_errors = []
+    doc = fitz.open(pdf_path)
+    try:
+        if doc.needs_pass:
+            raise ValueError("File is password-protected.")
+        for page_num in range(start_page, len(doc) if end_page is None else end_page):
+            try:
+                page = doc.load_page(page_num)
+                # Use "text" with sort=True for reading order. flags=0 is default.
+                page_texts.append(clean_page_text(page.get_text("text", sort=True, flags=0)))
+            except Exception as page_err:
+                page_texts.append("")
+                page_errors.append((page_num, str(page_err)))
+    finally:
+        doc.close()
+    return page_texts, page_errors
+
+
+def join_pages(page_texts: list[str]) -> tuple[str, list[int]]:
+    """Joins cleaned page texts once and computes the start offset of every page.
+
+    Empty pages contribute no text (nor a separator); their offset is the end of the text so far.
+
+    Returns:
+        tuple[str, list[int]]: (full_text, page_offsets) with len(page_offsets) == len(page_texts).
+    """
+    parts = []
+    page_offsets = []
+    position = 0
+    for page_text in page_texts:
+        if parts and page_text:
+            position += len(PAGE_SEPARATOR)
+        page_offsets.append(position)
+        if page_text:
+            parts.append(page_text)
+            position += len(page_text)
+    return PAGE_SEPARATOR.join(parts), page_offsets
+
+
+def extract_document(pdf_path: str) -> tuple[str, list[int], list[tuple[int, str]]]:
+    """Extracts a whole PDF in the calling process (a corpus build task: one file per worker).
+
+    Returns:
+        tuple[str, list[int], list[tuple[int, str]]]: (text, page_offsets, page_errors).
+
+    Raises:
+        Exception: If the file cannot be opened or is password-protected.
+    """
+    page_texts, page_errors = extract_page_range(pdf_path, 0)
+    text, page_offsets = join_pages(page_texts)
+    return text, page_offsets, page_errors
+
+
+class _SpawnProcess(multiprocessing.context.SpawnProcess):
+    def start(self):
+        # The spawned child imports whatever sys.modules['__main__'] points to while it is launched
+        with _main_swap_lock:
+            main_module = sys.modules.get('__main__')
+            sys.modules['__main__'] = types.ModuleType('__main__')
+            try:
+                super().start()
+            finally:
+                sys.modules['__main__'] = main_module
+
+
+class _SpawnContext(multiprocessing.context.SpawnContext):
+    Process = _SpawnProcess
+
+
+def spawn_context() -> multiprocessing.context.BaseContext:
+    """'spawn' context whose workers do not re-import the parent's __main__ module.
+
+    'spawn' (not 'fork') also avoids forking the multi-threaded web server process.
+    """
+    return _SpawnContext()
+
+# --- END OF FILE pdf_workers.py ---
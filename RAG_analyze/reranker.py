@@ -0,0 +1,100 @@
+# --- START OF FILE reranker.py ---
+
+# Second-stage reranking of RAG candidates (see ai_core.perform_rag_search).
+# A larger candidate pool is retrieved cheaply, then reordered here before the RAG_CHUNK_K cut:
+#   - relevance comes from the first stage (fused rank / distance) or, in 'cross-encoder' mode,
+#     from a small CPU cross-encoder scoring (query, chunk) pairs in batches,
+#   - a maximal marginal relevance (MMR) pass then trades relevance against similarity to the
+#     chunks already picked, so near-duplicate neighbours do not crowd out other context.
+# The cross-encoder needs the optional `sentence-transformers` package; without it, 'mmr' is used.
+# It is imported on first use (it pulls in torch), so other modes and processes never pay for it.
+import logging
+import threading
+import numpy as np
+from config import RAG_CROSS_ENCODER_MODEL, RAG_RERANK_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+RERANK_MODES = ("none", "mmr", "cross-encoder")
+
+_cross_encoder = None
+_cross_encoder_failed = False
+_cross_encoder_lock = threading.Lock()
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+def _scale(scores: np.ndarray) -> np.ndarray:
+    """Min-max scales scores to [0, 1] (all 1.0 if they are equal)."""
+    low, high = float(scores.min()), float(scores.max())
+    if high - low < 1e-12:
+        return np.ones_like(scores, dtype=np.float32)
+    return ((scores - low) / (high - low)).astype(np.float32)
+
+
+def mmr_order(relevance: np.ndarray, vectors: np.ndarray, k: int, lambda_mult: float) -> list[int]:
+    """Maximal marginal relevance selection.
+
+    All pairwise cosine similarities come from one matrix product; each of the k greedy steps is
+    then a vectorized update over the candidates.
+
+    Args:
+        relevance (np.ndarray): Per-candidate relevance, higher is better (any scale).
+        vectors (np.ndarray): Candidate embeddings, one row per candidate.
+        k (int): Number of candidates to select.
+        lambda_mult (float): 1.0 ranks by relevance only; lower values favour diversity.
+
+    Returns:
+        list[int]: Indices of the selected candidates, in selection order.
+    """
+    n = len(relevance)
+    k = min(k, n)
+    if k <= 0:
+        return []
+    relevance = _scale(np.asarray(relevance, dtype=np.float32))
+    unit = _normalize_rows(np.asarray(vectors, dtype=np.float32))
+    similarity = unit @ unit.T
+    redundancy = np.zeros(n, dtype=np.float32) # Max similarity to any selected candidate
+    available = np.ones(n, dtype=bool)
+    selected = []
+    for _ in range(k):
+        scores = lambda_mult * relevance - (1.0 - lambda_mult) * redundancy
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        redundancy = np.maximum(redundancy, similarity[best])
+    return selected
+
+
+def _get_cross_encoder():
+    """Loads the cross-encoder once (CPU). Returns None if unavailable."""
+    global _cross_encoder, _cross_encoder_failed
+    with _cross_encoder_lock:
+        if _cross_encoder is None and not _cross_encoder_failed:
+            try:
+                from sentence_transformers import CrossEncoder
+            except ImportError: # Optional; cross-encoder mode falls back to MMR over first-stage scores
+                logger.warning("RAG_RERANK_MODE is 'cross-encoder' but 'sentence-transformers' is not installed. Reranking with MMR over first-stage scores instead.")
+                _cross_encoder_failed = True
+            else:
+                try:
+                    logger.info(f"Loading cross-encoder reranker '{RAG_CROSS_ENCODER_MODEL}' on CPU...")
+                    _cross_encoder = CrossEncoder(RAG_CROSS_ENCODER_MODEL, device="cpu")
+                except Exception as e:
+                    logger.error(f"Could not load cross-encoder '{RAG_CROSS_ENCODER_MODEL}': {e}. Reranking with MMR over first-stage scores instead.", exc_info=True)
+                    _cross_encoder_failed = True
+        return _cross_encoder
+
+
+def cross_encoder_scores(query: str, texts: list[str]) -> np.ndarray | None:
+    """Relevance of each text to the query from the cross-encoder (batched), or None if unavailable."""
+    model = _get_cross_encoder()
+    if model is None:
+        return None
+    return np.asarray(model.predict([(query, text) for text in texts], batch_size=RAG_RERANK_BATCH_SIZE), dtype=np.float32)
+
+# --- END OF FILE reranker.py ---
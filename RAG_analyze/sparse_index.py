@@ -0,0 +1,280 @@
+# --- START OF FILE sparse_index.py ---
+
+# BM25 inverted index over the same chunks as the FAISS index, keyed by index position.
+# Dense retrieval misses exact terms (part numbers, symbols, equation names); this sparse side
+# catches them and is fused with the dense results (see ai_core.perform_rag_search).
+# A snapshot is a single file, FAISS_FOLDER/sparse.bin, written with every vector store snapshot:
+#   - the vocabulary as a sorted fixed-width byte array (term lookup is a binary search),
+#   - per-term posting ranges into two columns: chunk positions and term frequencies,
+#   - the token length of every chunk.
+# The file is memory-mapped read-only. Chunks added after the snapshot are indexed in memory
+# (the FAISS write-ahead log replay re-adds them at startup); deleted chunks are excluded at
+# query time via the vector store's tombstones until the next snapshot drops them.
+#
+# Layout: magic (8) | header length (uint64) | header JSON | terms | term offsets (int64, n_terms + 1)
+#         | posting positions (int32) | posting frequencies (uint16) | chunk lengths (uint32).
+#         Sections are 8-byte aligned.
+import os
+import re
+import json
+import math
+import mmap
+import struct
+import logging
+import threading
+from array import array
+from collections import Counter
+from typing import Iterable
+import numpy as np
+from config import BM25_K1, BM25_B
+
+logger = logging.getLogger(__name__)
+
+SPARSE_FILENAME = "sparse.bin"
+_MAGIC = b"SPARSE01"
+_LENGTH = struct.Struct("<Q")
+_ARRAY_SECTIONS = ("terms_offset", "term_offsets_offset", "postings_offset", "frequencies_offset", "lengths_offset")
+MAX_TERM_BYTES = 32 # Longer tokens are truncated
+_MAX_FREQUENCY = np.iinfo(np.uint16).max
+
+# Words, numbers and compound identifiers such as "M8x1.25", "ISO-4017", "v2.1" or "dP/dt"
+_TOKEN_RE = re.compile(r"\w+(?:[-./:]\w+)*")
+_COMPOUND_SPLIT_RE = re.compile(r"[-./:]")
+# Identifier-like words: contain a digit, inner punctuation or are upper-case acronyms
+_IDENTIFIER_RE = re.compile(r"\d|\w[-_./:]\w|^[A-Z]{2,}$")
+_STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have in is it its of on or that the this to was were "
+    "which with what how why when where who do does can".split()
+)
+
+
+def _pad8(length: int) -> int:
+    return -length % 8
+
+
+def tokenize(text: str) -> list[bytes]:
+    """Lower-cased terms of `text`; compound identifiers yield the whole token and its parts."""
+    terms = []
+    for token in _TOKEN_RE.findall(text.lower()):
+        parts = _COMPOUND_SPLIT_RE.split(token)
+        if len(parts) > 1:
+            terms.append(token)
+        terms.extend(part for part in parts if part and part not in _STOPWORDS)
+    return [term.encode('utf-8')[:MAX_TERM_BYTES] for term in terms]
+
+
+def is_keyword_query(query: str, max_terms: int) -> bool:
+    """True for short queries built around identifiers (part numbers, symbols, codes) rather than
+    prose, for which LLM sub-queries add little beyond the exact-term match."""
+    words = query.split()
+    if not words or len(words) > max_terms:
+        return False
+    return any(_IDENTIFIER_RE.search(word.strip("?!,;()[]\"'")) for word in words)
+
+
+class BM25Index:
+    """BM25 index over a memory-mapped sparse.bin snapshot plus an in-memory overlay of chunks
+    added since. Positions are FAISS index positions; additions must be contiguous."""
+
+    def __init__(self, path: str | None = None):
+        self.path = path
+        self._lock = threading.Lock() # Overlay updates vs. concurrent searches
+        self._base_count = 0
+        self._base_total_length = 0
+        self._terms = np.zeros(0, dtype=f"S{MAX_TERM_BYTES}")
+        self._term_offsets = np.zeros(1, dtype=np.int64)
+        self._postings = np.zeros(0, dtype=np.int32)
+        self._frequencies = np.zeros(0, dtype=np.uint16)
+        self._lengths = np.zeros(0, dtype=np.uint32)
+        # Overlay: term -> (positions, frequencies) and the token length of each added chunk
+        self._added: dict[bytes, tuple[array, array]] = {}
+        self._added_lengths = array('I')
+        self._added_total_length = 0
+        if path:
+            self._open(path)
+
+    def _open(self, path: str):
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(_MAGIC)] != _MAGIC:
+            raise ValueError(f"{path} is not a sparse index file.")
+        (header_length,) = _LENGTH.unpack_from(self._mmap, len(_MAGIC))
+        header_start = len(_MAGIC) + _LENGTH.size
+        header = json.loads(self._mmap[header_start:header_start + header_length])
+        self._base_count = header['count']
+        self._base_total_length = header['total_length']
+        n_terms, n_postings = header['n_terms'], header['n_postings']
+        self._terms = np.frombuffer(self._mmap, dtype=f"S{header['term_width']}", count=n_terms, offset=header['terms_offset'])
+        self._term_offsets = np.frombuffer(self._mmap, dtype=np.int64, count=n_terms + 1, offset=header['term_offsets_offset'])
+        self._postings = np.frombuffer(self._mmap, dtype=np.int32, count=n_postings, offset=header['postings_offset'])
+        self._frequencies = np.frombuffer(self._mmap, dtype=np.uint16, count=n_postings, offset=header['frequencies_offset'])
+        self._lengths = np.frombuffer(self._mmap, dtype=np.uint32, count=self._base_count, offset=header['lengths_offset'])
+
+    @property
+    def count(self) -> int:
+        """Number of indexed positions (snapshot + overlay), including deleted ones."""
+        return self._base_count + len(self._added_lengths)
+
+    def add(self, start: int, texts: Iterable[str]):
+        """Indexes `texts` at positions start, start + 1, ... (start must equal `count`).
+
+        Raises:
+            ValueError: If the positions would not directly follow the indexed ones.
+        """
+        tokenized = [Counter(tokenize(text)) for text in texts] # Outside the lock
+        with self._lock:
+            if start != self.count:
+                raise ValueError(f"Sparse index holds {self.count} chunks; cannot add at position {start}.")
+            for offset, frequencies in enumerate(tokenized):
+                position = start + offset
+                for term, frequency in frequencies.items():
+                    postings = self._added.get(term)
+                    if postings is None:
+                        postings = self._added[term] = (array('i'), array('H'))
+                    postings[0].append(position)
+                    postings[1].append(min(frequency, _MAX_FREQUENCY))
+                length = sum(frequencies.values())
+                self._added_lengths.append(length)
+                self._added_total_length += length
+
+    def _term_postings(self, term: bytes) -> tuple[np.ndarray, np.ndarray]:
+        """(positions, frequencies) of a term across snapshot and overlay. Caller holds _lock."""
+        positions, frequencies = [], []
+        if len(self._terms) and len(term) <= self._terms.dtype.itemsize:
+            i = int(np.searchsorted(self._terms, term))
+            if i < len(self._terms) and self._terms[i] == term:
+                start, end = int(self._term_offsets[i]), int(self._term_offsets[i + 1])
+                positions.append(self._postings[start:end])
+                frequencies.append(self._frequencies[start:end])
+        added = self._added.get(term)
+        if added is not None:
+            positions.append(np.frombuffer(added[0], dtype=np.int32).copy())
+            frequencies.append(np.frombuffer(added[1], dtype=np.uint16).copy())
+        if not positions:
+            return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.uint16)
+        return np.concatenate(positions), np.concatenate(frequencies)
+
+    def _chunk_lengths(self, positions: np.ndarray) -> np.ndarray:
+        """Token lengths of the chunks at `positions`. Caller holds _lock."""
+        lengths = np.empty(len(positions), dtype=np.float32)
+        in_base = positions < self._base_count
+        lengths[in_base] = self._lengths[positions[in_base]]
+        if not in_base.all():
+            added = np.frombuffer(self._added_lengths, dtype=np.uint32)
+            lengths[~in_base] = added[positions[~in_base] - self._base_count]
+        return lengths
+
+    def search(self, query: str, k: int, exclude: np.ndarray | None = None,
+               allowed: np.ndarray | None = None) -> list[tuple[int, float]]:
+        """Top-k chunks for `query` by BM25 (Okapi, k1 = BM25_K1, b = BM25_B).
+
+        Args:
+            exclude (np.ndarray | None): Positions to skip (deleted chunks).
+            allowed (np.ndarray | None): If given, only these positions are searched.
+
+        Returns:
+            list[tuple[int, float]]: (position, score) pairs, best first.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms or k <= 0:
+            return []
+        hit_positions, hit_scores = [], []
+        with self._lock:
+            n = self.count
+            if n == 0:
+                return []
+            average_length = max((self._base_total_length + self._added_total_length) / n, 1.0)
+            for term in terms:
+                positions, frequencies = self._term_postings(term)
+                if not len(positions):
+                    continue
+                idf = math.log(1.0 + (n - len(positions) + 0.5) / (len(positions) + 0.5))
+                tf = frequencies.astype(np.float32)
+                norm = BM25_K1 * (1.0 - BM25_B + BM25_B * self._chunk_lengths(positions) / average_length)
+                hit_positions.append(positions)
+                hit_scores.append(idf * tf * (BM25_K1 + 1.0) / (tf + norm))
+        if not hit_positions:
+            return []
+        positions = np.concatenate(hit_positions)
+        scores = np.concatenate(hit_scores)
+        keep = np.ones(len(positions), dtype=bool)
+        if exclude is not None and len(exclude):
+            keep &= ~np.isin(positions, exclude)
+        if allowed is not None:
+            keep &= np.isin(positions, allowed)
+        positions, scores = positions[keep], scores[keep]
+        if not len(positions):
+            return []
+        unique_positions, inverse = np.unique(positions, return_inverse=True)
+        totals = np.bincount(inverse, weights=scores)
+        top = np.argsort(-totals, kind='stable')[:k]
+        return [(int(unique_positions[i]), float(totals[i])) for i in top]
+
+    def write_snapshot(self, path: str, positions: np.ndarray | None = None):
+        """Writes snapshot + overlay to a new sparse.bin at `path` (temp file, fsync, rename).
+
+        If `positions` (ascending) is given, only those chunks are kept, renumbered from 0;
+        this drops deleted chunks (as chunk_store.write_snapshot does).
+        """
+        with self._lock:
+            added_terms = sorted(self._added)
+            base_terms = np.asarray(self._terms)
+            vocabulary = np.union1d(base_terms, np.array(added_terms, dtype=f"S{MAX_TERM_BYTES}")) if added_terms else base_terms
+            # Flatten every posting to (term id, position, frequency), then filter/renumber and regroup
+            base_term_ids = np.searchsorted(vocabulary, base_terms) if len(base_terms) else np.zeros(0, dtype=np.int64)
+            term_ids = [np.repeat(base_term_ids, np.diff(self._term_offsets))]
+            postings = [np.asarray(self._postings, dtype=np.int64)]
+            frequencies = [np.asarray(self._frequencies)]
+            for term in added_terms:
+                added_positions, added_frequencies = self._added[term]
+                term_ids.append(np.full(len(added_positions), np.searchsorted(vocabulary, term), dtype=np.int64))
+                postings.append(np.frombuffer(added_positions, dtype=np.int32).astype(np.int64))
+                frequencies.append(np.frombuffer(added_frequencies, dtype=np.uint16).copy())
+            lengths = np.concatenate([np.asarray(self._lengths), np.frombuffer(self._added_lengths, dtype=np.uint32)])
+        term_ids = np.concatenate(term_ids)
+        postings = np.concatenate(postings)
+        frequencies = np.concatenate(frequencies)
+
+        if positions is not None:
+            positions = np.asarray(positions, dtype=np.int64)
+            keep = np.isin(postings, positions)
+            term_ids, frequencies = term_ids[keep], frequencies[keep]
+            postings = np.searchsorted(positions, postings[keep])
+            lengths = lengths[positions]
+        order = np.lexsort((postings, term_ids)) # By term, then position
+        term_ids, postings, frequencies = term_ids[order], postings[order], frequencies[order]
+        used_terms, term_counts = np.unique(term_ids, return_counts=True) # Drops terms left without postings
+        term_offsets = np.concatenate([[0], np.cumsum(term_counts)]).astype(np.int64)
+        terms = vocabulary[used_terms]
+        term_width = max(terms.dtype.itemsize if len(terms) else 1, 1)
+        arrays = (terms.astype(f"S{term_width}"), term_offsets, postings.astype(np.int32),
+                  frequencies.astype(np.uint16), lengths.astype(np.uint32))
+
+        header = {
+            "count": int(len(lengths)), "total_length": int(lengths.sum()), "term_width": term_width,
+            "n_terms": int(len(terms)), "n_postings": int(len(postings)),
+        }
+        # Section offsets are stored in the header, so lay out until the header length is stable
+        header_bytes = b""
+        while True:
+            cursor = len(_MAGIC) + _LENGTH.size + len(header_bytes) + _pad8(len(header_bytes))
+            for key, column in zip(_ARRAY_SECTIONS, arrays):
+                header[key] = cursor
+                cursor += column.nbytes + _pad8(column.nbytes)
+            encoded = json.dumps(header).encode('utf-8')
+            if len(encoded) == len(header_bytes):
+                header_bytes = encoded
+                break
+            header_bytes = encoded
+
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'wb') as out:
+            out.write(_MAGIC + _LENGTH.pack(len(header_bytes)) + header_bytes + b"\0" * _pad8(len(header_bytes)))
+            for column in arrays:
+                out.write(column.tobytes() + b"\0" * _pad8(column.nbytes))
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(tmp_path, path)
+        logger.debug(f"Wrote sparse index {path}: {header['count']} chunks, {header['n_terms']} terms, {header['n_postings']} postings.")
+
+# --- END OF FILE sparse_index.py ---
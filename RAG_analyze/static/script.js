@@ -8,6 +8,8 @@ document.addEventListener('DOMContentLoaded', () => {
     const STATUS_CHECK_INTERVAL = 10000; // Check backend status every 10 seconds
     const ERROR_MESSAGE_DURATION = 8000; // Auto-hide error messages (ms)
     const MAX_CHAT_HISTORY_MESSAGES = 100; // Limit displayed messages (optional)
+    const UPLOAD_JOB_POLL_INTERVAL = 1000; // Poll background upload jobs every second (ms)
+    const CHAT_STREAMING_ENABLED = true; // Use /chat/stream (Server-Sent Events) for incremental responses
 
     // --- DOM Elements ---
     const uploadInput = document.getElementById('pdf-upload');
@@ -35,6 +37,7 @@ document.addEventListener('DOMContentLoaded', () => {
     const sendSpinner = sendButton?.querySelector('.spinner-border');
     const voiceInputButton = document.getElementById('voice-input-button');
     const chatStatus = document.getElementById('chat-status'); // Element reference for chat status text
+    const chatScopeSelect = document.getElementById('chat-scope-select'); // Optional: limit chat retrieval to selected documents
 
     const statusMessage = document.getElementById('status-message');
     const statusMessageButton = statusMessage?.querySelector('.btn-close'); // Get close button inside
@@ -154,6 +157,7 @@ document.addEventListener('DOMContentLoaded', () => {
 
         // Chat Input
         disableChatInput(!canChat);
+        if (chatScopeSelect) chatScopeSelect.disabled = !(canChat && chatScopeSelect.options.length > 0);
 
         // Upload Button
         if (uploadButton) uploadButton.disabled = !(canUpload && uploadInput?.files?.length > 0);
@@ -515,6 +519,26 @@ document.addEventListener('DOMContentLoaded', () => {
         handleAnalysisFileSelection();
     }
 
+    function updateChatScopeSelect() {
+        if (!chatScopeSelect) return;
+        const previouslySelected = new Set(getChatScope() || []);
+        chatScopeSelect.innerHTML = ''; // Clear
+        [...allFiles.default, ...allFiles.uploaded].forEach(filename => {
+            const option = document.createElement('option');
+            option.value = filename;
+            option.textContent = filename;
+            option.selected = previouslySelected.has(filename); // Keep the scope across refreshes
+            chatScopeSelect.appendChild(option);
+        });
+    }
+
+    // Selected documents for chat retrieval, or null to search all documents
+    function getChatScope() {
+        if (!chatScopeSelect) return null;
+        const selected = Array.from(chatScopeSelect.selectedOptions).map(opt => opt.value);
+        return selected.length > 0 ? selected : null;
+    }
+
     function handleAnalysisFileSelection() {
         const fileSelected = analysisFileSelect && analysisFileSelect.value;
         const shouldEnable = fileSelected && backendStatus.ai;
@@ -577,6 +601,7 @@ document.addEventListener('DOMContentLoaded', () => {
             allFiles.uploaded = data.uploaded_files || [];
             console.log(`Loaded ${allFiles.default.length} default, ${allFiles.uploaded.length} uploaded docs.`);
             updateAnalysisDropdown(); // This now handles enabling/disabling based on files found
+            updateChatScopeSelect();
 
         } catch (error) {
             console.error("Error loading document list:", error);
@@ -606,12 +631,17 @@ document.addEventListener('DOMContentLoaded', () => {
             const result = await response.json();
             if (!response.ok) throw new Error(result.error || `Upload failed: ${response.status}`);
 
+            // Upload accepted; extraction/embedding/indexing continue in a background job
+            setElementStatus(uploadStatus, `Uploaded ${escapeHtml(result.filename)}. Queued for processing...`);
+            uploadInput.value = ''; // Clear file input; the server has the file now
+            const job = await pollUploadJob(result.job_id);
+            if (job.status !== 'completed') throw new Error(job.error || job.message || 'Processing failed.');
+
             // Success
-            const successMsg = result.message || `Processed ${escapeHtml(result.filename)}.`;
+            const successMsg = job.message || `Processed ${escapeHtml(job.filename)}.`;
             setElementStatus(uploadStatus, successMsg, 'success');
-            showStatusMessage(`File '${escapeHtml(result.filename)}' added. KB: ${result.vector_count >= 0 ? result.vector_count : 'N/A'} vectors.`, 'success');
+            showStatusMessage(`File '${escapeHtml(job.filename)}' added. KB: ${job.vector_count >= 0 ? job.vector_count : 'N/A'} vectors.`, 'success');
             await loadAndPopulateDocuments(); // Refresh dropdown
-            uploadInput.value = ''; // Clear file input on success
             handleFileInputChange(); // Update button state after clearing input
 
         } catch (error) {
@@ -620,7 +650,7 @@ document.addEventListener('DOMContentLoaded', () => {
             setElementStatus(uploadStatus, `Error: ${errorMsg}`, 'danger');
             showStatusMessage(`Upload Error: ${errorMsg}`, 'danger');
              // Keep file selected in input for retry? Or clear? Current behavior keeps it.
-             uploadButton.disabled = !backendStatus.ai; // Re-enable if AI still ok
+             uploadButton.disabled = !(uploadInput.files.length > 0 && backendStatus.ai); // Re-enable if AI still ok
         } finally {
              showSpinner(uploadSpinner, false);
              // Reset status after a delay?
@@ -628,6 +658,32 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
 
+    // Polls /jobs/<id> until the upload job finishes, mirroring its progress in the upload status line
+    async function pollUploadJob(jobId) {
+        const stageLabels = { queued: 'Queued', extracting: 'Extracting text', chunking: 'Chunking', embedding: 'Embedding', indexing: 'Updating index' };
+        let consecutiveErrors = 0;
+        while (true) {
+            await new Promise(resolve => setTimeout(resolve, UPLOAD_JOB_POLL_INTERVAL));
+            let job;
+            try {
+                const response = await fetch(`${API_BASE_URL}/jobs/${encodeURIComponent(jobId)}`);
+                job = await response.json();
+                if (!response.ok) throw new Error(job.error || `Job status failed: ${response.status}`);
+                consecutiveErrors = 0;
+            } catch (error) {
+                // Tolerate brief network hiccups; give up after several failures in a row
+                if (++consecutiveErrors >= 5) throw error;
+                console.warn("Upload job poll failed, retrying:", error);
+                continue;
+            }
+            if (job.status === 'completed' || job.status === 'failed') return job;
+
+            let progressText = `${stageLabels[job.stage] || job.stage}`;
+            if (job.stage === 'embedding' && job.chunks_total) progressText += ` ${job.chunks_embedded}/${job.chunks_total} chunks`;
+            setElementStatus(uploadStatus, `${escapeHtml(job.filename)}: ${progressText} (${job.percent}%)...`);
+        }
+    }
+
     // --- MODIFIED: handleAnalysis function ---
     async function handleAnalysis(analysisType) {
         // Ensure all required elements exist, including new reasoning ones
@@ -803,31 +859,12 @@ document.addEventListener('DOMContentLoaded', () => {
         showSpinner(sendSpinner, true);
 
         try {
-            const response = await fetch(`${API_BASE_URL}/chat`, {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ query: query, session_id: sessionId }),
-            });
-            const result = await response.json(); // Always try to parse JSON
-
-            if (!response.ok) {
-                 const errorDetail = result.error || `Request failed: ${response.status}`;
-                 // Use answer field if provided by backend error, fallback to detail
-                 const displayError = result.answer || `Sorry, error: ${errorDetail}`;
-                 // Pass thinking and references even on error if backend provides them
-                 addMessageToChat('bot', displayError, result.references || [], result.thinking || null);
-                 throw new Error(errorDetail);
-            }
-
-            // Success
-            if (result.session_id && sessionId !== result.session_id) {
-                sessionId = result.session_id;
-                localStorage.setItem('aiTutorSessionId', sessionId);
-                setSessionIdDisplay(sessionId);
-                console.log("Session ID updated:", sessionId);
+            // Stream tokens when the browser supports reading response bodies; otherwise wait for the full answer
+            if (CHAT_STREAMING_ENABLED && window.ReadableStream && window.TextDecoder) {
+                await sendMessageStreaming(query);
+            } else {
+                await sendMessageBlocking(query);
             }
-            // Pass all relevant fields to addMessageToChat
-            addMessageToChat('bot', result.answer, result.references || [], result.thinking || null);
             setChatStatus('Ready'); // Use the new function
 
         } catch (error) {
@@ -846,6 +883,178 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
 
+    function updateSessionId(newSessionId) {
+        if (newSessionId && sessionId !== newSessionId) {
+            sessionId = newSessionId;
+            localStorage.setItem('aiTutorSessionId', sessionId);
+            setSessionIdDisplay(sessionId);
+            console.log("Session ID updated:", sessionId);
+        }
+    }
+
+    async function sendMessageBlocking(query) {
+        const response = await fetch(`${API_BASE_URL}/chat`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ query: query, session_id: sessionId, sources: getChatScope() }),
+        });
+        const result = await response.json(); // Always try to parse JSON
+
+        if (!response.ok) {
+             const errorDetail = result.error || `Request failed: ${response.status}`;
+             // Use answer field if provided by backend error, fallback to detail
+             const displayError = result.answer || `Sorry, error: ${errorDetail}`;
+             // Pass thinking and references even on error if backend provides them
+             addMessageToChat('bot', displayError, result.references || [], result.thinking || null);
+             throw new Error(errorDetail);
+        }
+
+        // Success
+        updateSessionId(result.session_id);
+        // Pass all relevant fields to addMessageToChat
+        addMessageToChat('bot', result.answer, result.references || [], result.thinking || null);
+    }
+
+    // Parses one SSE frame ("event: x\ndata: {...}") into { event, data }
+    function parseSseEvent(rawEvent) {
+        let event = 'message';
+        const dataLines = [];
+        rawEvent.split('\n').forEach(line => {
+            if (line.startsWith('event:')) event = line.slice(6).trim();
+            else if (line.startsWith('data:')) dataLines.push(line.slice(5).trimStart());
+        });
+        if (dataLines.length === 0) return { event: null, data: null };
+        try {
+            return { event, data: JSON.parse(dataLines.join('\n')) };
+        } catch (e) {
+            console.warn("Could not parse SSE data:", rawEvent);
+            return { event: null, data: null };
+        }
+    }
+
+    // Creates a bot message that is re-rendered as thinking/answer tokens arrive
+    function createStreamingBotMessage() {
+        const messageWrapper = document.createElement('div');
+        messageWrapper.classList.add('message-wrapper', 'bot-wrapper', 'streaming');
+        const messageDiv = document.createElement('div');
+        messageDiv.classList.add('message', 'bot-message');
+        messageDiv.textContent = '…';
+        const thinkingDiv = document.createElement('div');
+        thinkingDiv.classList.add('message-thinking');
+        thinkingDiv.style.display = 'none';
+        thinkingDiv.innerHTML = `
+            <details open>
+                <summary class="text-info small fw-bold">Reasoning (live)</summary>
+                <pre><code></code></pre>
+            </details>`;
+        const thinkingCode = thinkingDiv.querySelector('code');
+        messageWrapper.appendChild(thinkingDiv);
+        messageWrapper.appendChild(messageDiv);
+        chatHistory.appendChild(messageWrapper);
+
+        let answerText = '';
+        let thinkingText = '';
+        let renderScheduled = false;
+
+        const render = () => {
+            renderScheduled = false;
+            if (thinkingText) {
+                thinkingDiv.style.display = 'block';
+                thinkingCode.textContent = thinkingText;
+            }
+            if (answerText) {
+                if (typeof marked !== 'undefined') {
+                    marked.setOptions({ breaks: true, gfm: true, sanitize: false }); // See warning in addMessageToChat
+                    messageDiv.innerHTML = marked.parse(answerText);
+                } else {
+                    messageDiv.textContent = answerText;
+                }
+            }
+            chatHistory.scrollTo({ top: chatHistory.scrollHeight, behavior: 'auto' });
+        };
+        // Re-render at most once per animation frame, however fast tokens arrive
+        const scheduleRender = () => {
+            if (!renderScheduled) {
+                renderScheduled = true;
+                requestAnimationFrame(render);
+            }
+        };
+
+        return {
+            appendAnswer(text) { answerText += text; scheduleRender(); },
+            appendThinking(text) { thinkingText += text; scheduleRender(); },
+            remove() { messageWrapper.remove(); }
+        };
+    }
+
+    async function sendMessageStreaming(query) {
+        const response = await fetch(`${API_BASE_URL}/chat/stream`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json', 'Accept': 'text/event-stream' },
+            body: JSON.stringify({ query: query, session_id: sessionId, sources: getChatScope() }),
+        });
+        const contentType = response.headers.get('Content-Type') || '';
+        if (!response.ok || !contentType.includes('text/event-stream') || !response.body) {
+            // Validation/availability errors are returned as JSON, same as /chat
+            const result = await response.json().catch(() => ({}));
+            const errorDetail = result.error || `Request failed: ${response.status}`;
+            addMessageToChat('bot', result.answer || `Sorry, error: ${errorDetail}`, result.references || [], result.thinking || null);
+            throw new Error(errorDetail);
+        }
+
+        const streamingMessage = createStreamingBotMessage();
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let finished = false;
+
+        const handleEvent = ({ event, data }) => {
+            if (!event || !data) return;
+            switch (event) {
+                case 'session':
+                    updateSessionId(data.session_id);
+                    break;
+                case 'status':
+                    setChatStatus(data.stage === 'retrieving' ? 'Searching documents...' : 'AI Tutor is writing...');
+                    break;
+                case 'thinking':
+                    streamingMessage.appendThinking(data.text || '');
+                    break;
+                case 'answer':
+                    streamingMessage.appendAnswer(data.text || '');
+                    break;
+                case 'done':
+                    // Replace the live message with the final parsed answer, reasoning and references
+                    finished = true;
+                    streamingMessage.remove();
+                    updateSessionId(data.session_id);
+                    addMessageToChat('bot', data.answer, data.references || [], data.thinking || null);
+                    break;
+                case 'error':
+                    finished = true;
+                    streamingMessage.remove();
+                    addMessageToChat('bot', data.answer || `Sorry, error: ${data.error}`);
+                    throw new Error(data.error || 'Streaming failed.');
+            }
+        };
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            let separatorIndex;
+            while ((separatorIndex = buffer.indexOf('\n\n')) !== -1) {
+                const rawEvent = buffer.slice(0, separatorIndex);
+                buffer = buffer.slice(separatorIndex + 2);
+                handleEvent(parseSseEvent(rawEvent));
+            }
+        }
+        if (!finished) {
+            streamingMessage.remove();
+            throw new Error("Connection closed before the response completed.");
+        }
+    }
+
     async function loadChatHistory(sid) {
         if (!sid || !chatHistory || !API_BASE_URL || !backendStatus.db) {
              addMessageToChat('bot', 'Cannot load history: Missing session ID or database unavailable.');
@@ -0,0 +1,17 @@
+# Tests for RAG_analyze. Run from RAG_analyze/ with:
+#   python -m unittest discover -s tests -t .     (or: python -m pytest tests)
+# None of them needs a running Ollama server: models are replaced by fakes.
+# Before config is imported, every data folder is pointed at a temporary directory, so a test
+# run never touches the real index, caches or uploads.
+import os
+import sys
+import tempfile
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if APP_DIR not in sys.path:
+    sys.path.insert(0, APP_DIR)
+
+TEST_DATA_DIR = tempfile.mkdtemp(prefix="rag_analyze_tests_")
+for _name in ('FAISS_FOLDER', 'UPLOAD_FOLDER', 'DEFAULT_PDFS_FOLDER', 'TEXT_STORE_FOLDER', 'EMBED_CACHE_FOLDER'):
+    os.environ[_name] = os.path.join(TEST_DATA_DIR, _name.lower())
+os.environ.setdefault('OLLAMA_BASE_URL', 'http://127.0.0.1:9') # Nothing listens here; tests must not need Ollama
@@ -0,0 +1,57 @@
+# Shared fakes for the tests: a deterministic embedding model that records what it embeds, and a
+# reset of ai_core's module-level vector store state between tests.
+import os
+import shutil
+
+from langchain_community.embeddings import DeterministicFakeEmbedding
+from langchain.docstore.document import Document
+
+import ai_core
+from config import FAISS_FOLDER
+
+EMBEDDING_SIZE = 16
+
+
+class RecordingEmbedding(DeterministicFakeEmbedding):
+    """DeterministicFakeEmbedding (same text -> same vector) that records every embedded text."""
+    embedded_texts: list = []
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        self.embedded_texts.extend(texts)
+        return super().embed_documents(texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        self.embedded_texts.append(text)
+        return super().embed_query(text)
+
+
+def reset_vector_store() -> RecordingEmbedding:
+    """Drops the loaded index and everything persisted under FAISS_FOLDER, and installs a fresh fake model."""
+    if ai_core._compaction_thread is not None:
+        ai_core._compaction_thread.join()
+    ai_core.vector_store = None
+    ai_core.bm25_index = None
+    ai_core._tombstones.clear()
+    ai_core._index_is_mmapped = False
+    ai_core.query_embedding_cache.clear()
+    shutil.rmtree(FAISS_FOLDER, ignore_errors=True)
+    os.makedirs(FAISS_FOLDER, exist_ok=True)
+    ai_core.embeddings = RecordingEmbedding(size=EMBEDDING_SIZE, embedded_texts=[])
+    return ai_core.embeddings
+
+
+def make_chunks(source: str, texts: list[str]) -> list[Document]:
+    return [Document(page_content=text, metadata={'source': source, 'chunk_index': i}) for i, text in enumerate(texts)]
+
+
+def reload_vector_store() -> bool:
+    """Drops the in-memory store and loads it again from FAISS_FOLDER (snapshot + write-ahead log)."""
+    if ai_core._compaction_thread is not None:
+        ai_core._compaction_thread.join()
+    ai_core.vector_store = None
+    return ai_core.load_vector_store()
+
+
+def search_texts(query: str, k: int = 100, sources: list[str] | None = None) -> set[str]:
+    """Texts of the chunks a dense search returns."""
+    return {doc.page_content for doc, _ in ai_core.batched_similarity_search([query], k, sources=sources)[0]}
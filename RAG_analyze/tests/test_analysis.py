@@ -0,0 +1,65 @@
+import os
+import threading
+import time
+import unittest
+from unittest import mock
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from tests import TEST_DATA_DIR
+import ai_core
+import database
+
+
+class SlowChatModel(FakeListChatModel):
+    """Fake LLM that records its calls and takes a moment, so concurrent requests overlap."""
+    calls: list = []
+
+    def invoke(self, *args, **kwargs):
+        self.calls.append(1)
+        time.sleep(0.2)
+        return super().invoke(*args, **kwargs)
+
+
+class AnalysisLockTest(unittest.TestCase):
+    def test_locks_are_per_key_and_bounded(self):
+        key = ("text hash", "faq", "template hash", "model")
+        self.assertIs(ai_core._analysis_lock(key), ai_core._analysis_lock(tuple(key)))
+        locks = {id(ai_core._analysis_lock((f"hash {i}", "faq", "template", "model"))) for i in range(10000)}
+        self.assertLessEqual(len(locks), ai_core._ANALYSIS_LOCK_STRIPES)
+        self.assertEqual(len(ai_core._analysis_locks), ai_core._ANALYSIS_LOCK_STRIPES)
+
+
+class AnalysisCacheTest(unittest.TestCase):
+    def setUp(self):
+        patch = mock.patch.object(database, 'DATABASE_PATH', os.path.join(TEST_DATA_DIR, f"{self.id()}.db"))
+        patch.start()
+        self.addCleanup(patch.stop)
+        database.init_db()
+        self.llm = SlowChatModel(responses=["<thinking>t</thinking>Q: a\nA: b"] * 10, calls=[])
+        patch = mock.patch.object(ai_core, 'llm', self.llm)
+        patch.start()
+        self.addCleanup(patch.stop)
+        ai_core.document_texts_cache.put('notes.pdf', 'some text ' * 50)
+        self.addCleanup(ai_core.document_texts_cache.pop, 'notes.pdf')
+
+    def test_concurrent_requests_run_the_llm_once(self):
+        results = [None] * 3
+        threads = [threading.Thread(target=lambda i=i: results.__setitem__(i, ai_core.generate_document_analysis('notes.pdf', 'faq')))
+                   for i in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [("Q: a\nA: b", "t")] * 3)
+        self.assertEqual(len(self.llm.calls), 1)
+
+        ai_core.generate_document_analysis('notes.pdf', 'topics') # Another key runs again
+        self.assertEqual(len(self.llm.calls), 2)
+        ai_core.document_texts_cache.put('notes.pdf', 'changed text ' * 50) # So does changed text
+        ai_core.generate_document_analysis('notes.pdf', 'faq')
+        self.assertEqual(len(self.llm.calls), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import os
+import subprocess
+import sys
+import unittest
+from unittest import mock
+from urllib.parse import quote
+
+from tests import APP_DIR
+from tests.fakes import reset_vector_store, make_chunks
+import ai_core
+import app
+import config
+import warmup
+
+
+class WarmupStartTest(unittest.TestCase):
+    def test_importing_the_app_starts_nothing(self):
+        script = ("import threading, app, warmup; "
+                  "print(sorted(warmup.stats()), [t.name for t in threading.enumerate() if t.name.startswith('warmup-')])")
+        result = subprocess.run([sys.executable, "-c", script], cwd=APP_DIR, capture_output=True, text=True, timeout=120)
+        self.assertEqual(result.returncode, 0, result.stderr[-2000:])
+        self.assertEqual(result.stdout.strip().splitlines()[-1], "[] []")
+
+    def test_child_processes_do_not_warm_up(self):
+        with mock.patch.object(app.multiprocessing, 'parent_process', return_value=object()), \
+                mock.patch.object(warmup, 'start') as start:
+            app.app.initialized = False
+            app.initialize_app()
+        start.assert_not_called()
+        self.assertFalse(app.app.initialized)
+
+
+class DeleteDocumentTest(unittest.TestCase):
+    UPLOADED = "Quarterly report é.pdf" # Changed by secure_filename, but a valid listed name
+    DEFAULT = "default manual.pdf"
+
+    def setUp(self):
+        reset_vector_store()
+        app.app.initialized = True # No warm-up: the test installs the index itself
+        patch = mock.patch.object(app, '_wait_ready', return_value=True)
+        patch.start()
+        self.addCleanup(patch.stop)
+        for folder, filename in ((config.UPLOAD_FOLDER, self.UPLOADED), (config.DEFAULT_PDFS_FOLDER, self.DEFAULT)):
+            os.makedirs(folder, exist_ok=True)
+            path = os.path.join(folder, filename)
+            with open(path, 'wb') as f:
+                f.write(b"%PDF-1.4")
+            self.addCleanup(lambda path=path: os.path.exists(path) and os.remove(path))
+            self.assertTrue(ai_core.add_documents_to_vector_store(make_chunks(filename, [f"{filename} chunk {i}" for i in range(3)])))
+        self.client = app.app.test_client()
+
+    def delete(self, filename: str):
+        return self.client.delete(f"/documents/{quote(filename)}")
+
+    def test_uploaded_document_with_spaces_and_accents_is_deleted(self):
+        response = self.delete(self.UPLOADED)
+        self.assertEqual(response.status_code, 200, response.json)
+        self.assertEqual(response.json['chunks_deleted'], 3)
+        self.assertTrue(response.json['file_removed'])
+        self.assertFalse(os.path.exists(os.path.join(config.UPLOAD_FOLDER, self.UPLOADED)))
+        self.assertEqual(ai_core.indexed_sources(), {self.DEFAULT})
+
+    def test_default_folder_document_is_refused(self):
+        response = self.delete(self.DEFAULT)
+        self.assertEqual(response.status_code, 409)
+        self.assertIn(self.DEFAULT, ai_core.indexed_sources())
+
+    def test_unknown_and_invalid_names(self):
+        self.assertEqual(self.delete("missing.pdf").status_code, 404)
+        self.assertEqual(self.client.delete("/documents/sub/x.pdf").status_code, 400)
+        self.assertEqual(self.delete("..\\x.pdf").status_code, 400)
+        self.assertEqual(len(ai_core.indexed_sources()), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import time
+import unittest
+from unittest import mock
+
+import numpy as np
+
+import tests  # noqa: F401 (test data folders)
+import caching
+from caching import LRUCache, SemanticCache
+
+
+class LRUCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cache = LRUCache("test", max_bytes=10, size_fn=len)
+
+    def test_least_recently_used_entries_are_evicted_to_stay_in_budget(self):
+        self.cache.put("a", "xxxx")
+        self.cache.put("b", "xxxx")
+        self.assertEqual(self.cache.get("a"), "xxxx") # "b" is now least recently used
+        self.cache.put("c", "xxxx")
+        self.assertNotIn("b", self.cache)
+        self.assertIn("a", self.cache)
+        stats = self.cache.stats()
+        self.assertEqual((stats['entries'], stats['resident_bytes'], stats['evictions']), (2, 8, 1))
+
+    def test_value_over_budget_is_not_cached(self):
+        self.cache.put("a", "xxxx")
+        self.assertFalse(self.cache.put("big", "x" * 11))
+        self.assertNotIn("big", self.cache)
+        self.assertIn("a", self.cache)
+
+    def test_replacing_and_popping_keep_the_byte_count(self):
+        self.cache.put("a", "xxxx")
+        self.cache.put("a", "xx")
+        self.assertEqual(self.cache.stats()['resident_bytes'], 2)
+        self.assertEqual(self.cache.pop("a"), "xx")
+        self.assertEqual(self.cache.stats()['resident_bytes'], 0)
+
+    def test_lazy_loading(self):
+        loads = []
+
+        def loader(key):
+            loads.append(key)
+            return None if key == "missing" else "value"
+
+        self.assertEqual(self.cache.get_or_load("k", loader), "value")
+        self.assertEqual(self.cache.get_or_load("k", loader), "value")
+        self.assertIsNone(self.cache.get_or_load("missing", loader))
+        self.assertIsNone(self.cache.get_or_load("missing", loader)) # None is not cached
+        self.assertEqual(loads, ["k", "missing", "missing"])
+        self.assertEqual(self.cache.stats()['hit_rate'], 0.25)
+
+
+class SemanticCacheTest(unittest.TestCase):
+    KEY = ("model", "chunks")
+
+    def setUp(self):
+        self.cache = SemanticCache("test", max_entries=2, ttl_seconds=60, threshold=0.95)
+
+    def test_similar_query_under_the_same_key_hits(self):
+        self.cache.put(self.KEY, np.array([1.0, 0.0]), "answer", generation=1)
+        self.assertEqual(self.cache.get(self.KEY, np.array([1.0, 0.05]), generation=1), "answer")
+        self.assertIsNone(self.cache.get(self.KEY, np.array([0.0, 1.0]), generation=1)) # Dissimilar question
+        self.assertIsNone(self.cache.get(("model", "other chunks"), np.array([1.0, 0.0]), generation=1))
+
+    def test_least_recently_used_entry_is_evicted(self):
+        self.cache.put(self.KEY, np.array([1.0, 0.0]), "answer 0", generation=1)
+        self.cache.put(self.KEY, np.array([0.0, 1.0]), "answer 1", generation=1)
+        self.cache.get(self.KEY, np.array([1.0, 0.0]), generation=1) # "answer 1" is now least recently used
+        self.cache.put(self.KEY, np.array([1.0, 1.0]), "answer 2", generation=1)
+        self.assertEqual(len(self.cache), 2)
+        self.assertEqual(self.cache.get(self.KEY, np.array([1.0, 0.0]), generation=1), "answer 0")
+        self.assertIsNone(self.cache.get(self.KEY, np.array([0.0, 1.0]), generation=1))
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+
+    def test_newer_generation_drops_entries_and_stale_writes_are_ignored(self):
+        self.cache.put(self.KEY, np.array([1.0, 0.0]), "old", generation=1)
+        self.assertIsNone(self.cache.get(self.KEY, np.array([1.0, 0.0]), generation=2))
+        self.assertFalse(self.cache.put(self.KEY, np.array([1.0, 0.0]), "stale", generation=1))
+        self.assertEqual(len(self.cache), 0)
+
+    def test_expired_entries_are_not_served(self):
+        now = time.monotonic()
+        self.cache.put(self.KEY, np.array([1.0, 0.0]), "answer", generation=1)
+        with mock.patch.object(caching.time, 'monotonic', return_value=now + 61):
+            self.assertIsNone(self.cache.get(self.KEY, np.array([1.0, 0.0]), generation=1))
+        self.assertEqual(len(self.cache), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
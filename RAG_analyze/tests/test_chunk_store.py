@@ -0,0 +1,72 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from langchain_community.docstore.in_memory import InMemoryDocstore
+
+from tests import TEST_DATA_DIR
+from tests.fakes import make_chunks
+import chunk_store
+
+# 5 chunks of a.pdf, then 3 of b.pdf, at positions 0..7
+DOCS = make_chunks("a.pdf", [f"alpha {i} – ünïcode" for i in range(5)]) + make_chunks("b.pdf", [f"bravo {i}" for i in range(3)])
+IDS = [f"id-{position}" for position in range(len(DOCS))]
+
+
+class ChunkStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp(dir=TEST_DATA_DIR)
+        self.path = os.path.join(self.folder, chunk_store.CHUNKS_FILENAME)
+        patch = mock.patch.object(chunk_store, 'CHUNK_STORE_BLOCK_SIZE', 3) # Several blocks, one partial
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def write(self, positions=None) -> chunk_store.ChunkStore:
+        docstore = InMemoryDocstore(dict(zip(IDS, DOCS)))
+        mapping = dict(enumerate(IDS))
+        count = len(DOCS) if positions is None else len(positions)
+        chunk_store.write_snapshot(self.path, docstore, mapping, count, positions=positions)
+        return chunk_store.ChunkStore(self.path)
+
+    def test_round_trip(self):
+        store = self.write()
+        self.assertEqual(len(store), len(DOCS))
+        found = store.search_many(IDS)
+        for doc_id, doc in zip(IDS, DOCS):
+            self.assertEqual(found[doc_id].page_content, doc.page_content)
+            self.assertEqual(found[doc_id].metadata, doc.metadata)
+        self.assertIsInstance(store.search("id-missing"), str) # LangChain's "not found" convention
+        self.assertEqual(dict(store.index_map), dict(enumerate(IDS)))
+        self.assertEqual(store.get_by_positions([6])[6].page_content, "bravo 1")
+        self.assertEqual(store.sources(), {"a.pdf", "b.pdf"})
+        self.assertEqual(store.positions_for_sources(["b.pdf"]).tolist(), [5, 6, 7])
+        self.assertEqual(store.positions_of_ids(["id-3", "id-missing"]), {"id-3": 3})
+
+    def test_overlay_adds_and_deletes(self):
+        store = self.write()
+        added = make_chunks("c.pdf", ["charlie 0"])[0]
+        store.add({"id-new": added})
+        store.index_map[len(DOCS)] = "id-new"
+        for position in (5, 6, 7):
+            doc_id = store.index_map[position]
+            del store.index_map[position]
+            store.delete([doc_id])
+
+        self.assertEqual(store.sources(), {"a.pdf", "c.pdf"})
+        self.assertEqual(store.positions_for_sources(["b.pdf", "c.pdf"]).tolist(), [len(DOCS)])
+        self.assertEqual(store.search("id-new").page_content, "charlie 0")
+        self.assertIsInstance(store.search("id-6"), str)
+        self.assertEqual([position for position, _, _ in store.iter_documents(len(DOCS) + 1)], [0, 1, 2, 3, 4, len(DOCS)])
+        with self.assertRaises(ValueError):
+            store.add({"id-0": added})
+
+    def test_snapshot_of_selected_positions_is_renumbered(self):
+        store = self.write(positions=[0, 2, 6])
+        self.assertEqual(dict(store.index_map), {0: "id-0", 1: "id-2", 2: "id-6"})
+        self.assertEqual(store.positions_for_sources(["a.pdf"]).tolist(), [0, 1])
+        self.assertEqual(store.get_by_positions([2])[2].page_content, "bravo 1")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import unittest
+from unittest import mock
+
+from langchain.docstore.document import Document
+
+import tests  # noqa: F401 (test data folders)
+import context_packer
+
+
+def chunk(source: str, index: int, text: str) -> Document:
+    return Document(page_content=text, metadata={'source': source, 'chunk_index': index})
+
+
+class ContextPackerTest(unittest.TestCase):
+    def setUp(self):
+        # Deterministic token counts (characters / 4) whether or not tiktoken's encoding is available
+        patches = (mock.patch.object(context_packer, '_encoding', None),
+                   mock.patch.object(context_packer, '_encoding_failed', True))
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_budget_skips_chunks_that_do_not_fit_in_favour_of_smaller_ones(self):
+        big, small = chunk("a.pdf", 0, "b" * 400), chunk("b.pdf", 0, "s" * 40)
+        first = chunk("c.pdf", 0, "f" * 200)
+        packed, stats = context_packer.pack_context([first, big, small], token_budget=100, max_chunks=5)
+        self.assertEqual([doc for doc, _ in packed], [first, small])
+        self.assertLessEqual(stats['tokens'], 100)
+        self.assertEqual(stats['skipped_over_budget'], 1)
+        self.assertEqual(stats['tokenizer'], f"approx:{context_packer.CONTEXT_CHARS_PER_TOKEN}chars")
+
+    def test_max_chunks_applies_without_a_budget(self):
+        docs = [chunk("a.pdf", i * 10, f"text {i}") for i in range(5)]
+        packed, stats = context_packer.pack_context(docs, token_budget=0, max_chunks=3)
+        self.assertEqual([doc for doc, _ in packed], docs[:3])
+        self.assertEqual(stats['chunks'], 3)
+
+    def test_oversized_best_chunk_is_truncated_rather_than_dropped(self):
+        packed, stats = context_packer.pack_context([chunk("a.pdf", 0, "w" * 1000)], token_budget=50, max_chunks=5)
+        self.assertEqual(len(packed), 1)
+        self.assertLess(len(packed[0][1]), 1000)
+        self.assertLessEqual(stats['tokens'], 50)
+
+    def test_overlap_with_a_packed_neighbour_is_sent_once(self):
+        shared = "shared sentence between both chunks. "
+        first = chunk("a.pdf", 0, "Opening text of the first chunk. " + shared)
+        second = chunk("a.pdf", 1, shared + "Closing text of the second chunk.")
+        packed, stats = context_packer.pack_context([first, second], token_budget=0, max_chunks=5)
+        self.assertEqual(packed[0][1], first.page_content)
+        self.assertEqual(packed[1][1], "Closing text of the second chunk.")
+        self.assertEqual(stats['overlap_chars_trimmed'], len(shared))
+
+    def test_short_coincidental_overlap_is_kept(self):
+        self.assertEqual(context_packer.overlap_length("ends with the", "the start"), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from tests import TEST_DATA_DIR
+from tests.test_pdf_workers import _make_pdf
+import corpus_sync
+import text_store
+
+
+class PreparedFilesTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp(dir=TEST_DATA_DIR)
+        self.scan = {}
+        for name, text in (("a.pdf", "alpha document"), ("b.pdf", "bravo document"), ("c.pdf", "charlie document")):
+            path = os.path.join(self.folder, name)
+            _make_pdf(path, [text])
+            self.scan[name] = {'path': path}
+
+    def prepare(self, workers: int) -> dict:
+        with mock.patch.object(corpus_sync, 'CORPUS_BUILD_WORKERS', workers):
+            results = list(corpus_sync._iter_prepared_files(sorted(self.scan), self.scan))
+        return {filename: (documents, content_hash) for filename, documents, content_hash in results}
+
+    def test_pool_extracts_misses_and_the_parent_fills_the_text_store(self):
+        stored_hash = text_store.get_file_hash(self.scan["a.pdf"]['path'])
+        text_store.save_entry(stored_hash, "stored alpha text", [0])
+
+        prepared = self.prepare(workers=2)
+
+        self.assertEqual(set(prepared), set(self.scan))
+        documents, content_hash = prepared["a.pdf"]
+        self.assertEqual(content_hash, stored_hash)
+        self.assertEqual(documents[0].page_content, "stored alpha text") # Served from the store, not re-extracted
+        for name, expected in (("b.pdf", "bravo document"), ("c.pdf", "charlie document")):
+            documents, content_hash = prepared[name]
+            self.assertEqual(documents[0].page_content, expected)
+            self.assertEqual(documents[0].metadata['source'], name)
+            self.assertEqual(text_store.load_entry(content_hash)['text'], expected)
+
+    def test_unreadable_file_is_reported_as_failed(self):
+        with open(self.scan["b.pdf"]['path'], 'wb') as f:
+            f.write(b"not a pdf")
+        for workers in (1, 2):
+            prepared = self.prepare(workers)
+            self.assertIsNone(prepared["b.pdf"][0])
+            self.assertIsNotNone(prepared["c.pdf"][0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import unittest
+from unittest import mock
+
+import tests  # noqa: F401 (test data folders)
+from tests.fakes import reset_vector_store, reload_vector_store, search_texts, make_chunks
+import ai_core
+
+ALPHA = [f"alpha chunk {i}" for i in range(6)]
+BRAVO = [f"bravo chunk {i}" for i in range(4)]
+
+
+class DeletionTest(unittest.TestCase):
+    def setUp(self):
+        reset_vector_store()
+        patch = mock.patch.object(ai_core, 'FAISS_TOMBSTONE_COMPACT_RATIO', 10.0) # Compact only when a test asks
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.assertTrue(ai_core.add_documents_to_vector_store(make_chunks("alpha.pdf", ALPHA)))
+        self.assertTrue(ai_core.add_documents_to_vector_store(make_chunks("bravo.pdf", BRAVO)))
+
+    def test_deleted_chunks_are_tombstoned_until_compaction(self):
+        generation = ai_core._index_generation
+        self.assertEqual(ai_core.delete_source_documents("alpha.pdf"), len(ALPHA))
+
+        self.assertGreater(ai_core._index_generation, generation)
+        self.assertEqual(ai_core.pending_deletion_count(), len(ALPHA))
+        self.assertEqual(ai_core.vector_store.index.ntotal, len(ALPHA) + len(BRAVO)) # Vectors stay until compaction
+        self.assertEqual(search_texts("chunk"), set(BRAVO))
+        self.assertEqual(ai_core.indexed_sources(), {"bravo.pdf"})
+        self.assertEqual(ai_core.delete_source_documents("alpha.pdf"), 0)
+
+        self.assertTrue(ai_core.compact_vector_store())
+        self.assertEqual(ai_core.pending_deletion_count(), 0)
+        self.assertEqual(ai_core.vector_store.index.ntotal, len(BRAVO))
+        self.assertEqual(search_texts("chunk"), set(BRAVO))
+
+    def test_deletion_survives_a_reload(self):
+        ai_core.delete_source_documents("bravo.pdf")
+        self.assertTrue(reload_vector_store())
+        self.assertEqual(search_texts("chunk"), set(ALPHA))
+        self.assertEqual(ai_core.indexed_sources(), {"alpha.pdf"})
+
+    def test_replace_swaps_a_documents_chunks(self):
+        updated = ["alpha revised 0", "alpha revised 1"]
+        self.assertTrue(ai_core.replace_source_documents("alpha.pdf", make_chunks("alpha.pdf", updated)))
+        self.assertEqual(search_texts("alpha", sources=["alpha.pdf"]), set(updated))
+        self.assertTrue(ai_core.compact_vector_store())
+        self.assertTrue(reload_vector_store())
+        self.assertEqual(search_texts("chunk"), set(updated) | set(BRAVO))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import threading
+import unittest
+
+import tests  # noqa: F401 (test data folders)
+import jobs
+
+
+class ReserveUploadJobTest(unittest.TestCase):
+    def setUp(self):
+        with jobs._jobs_lock:
+            jobs._jobs.clear()
+
+    def test_a_name_being_processed_cannot_be_reserved_again(self):
+        job, reserved = jobs.reserve_upload_job("manual.pdf")
+        self.assertTrue(reserved)
+        self.assertEqual(job['status'], jobs.STATUS_QUEUED)
+
+        conflict, reserved = jobs.reserve_upload_job("manual.pdf")
+        self.assertFalse(reserved)
+        self.assertEqual(conflict['job_id'], job['job_id'])
+        self.assertTrue(jobs.reserve_upload_job("other.pdf")[1])
+
+    def test_released_reservation_frees_the_name(self):
+        job, _ = jobs.reserve_upload_job("manual.pdf")
+        jobs.release_upload_job(job['job_id'])
+        self.assertIsNone(jobs.get_job(job['job_id']))
+        self.assertTrue(jobs.reserve_upload_job("manual.pdf")[1])
+
+    def test_concurrent_reservations_of_one_name_admit_a_single_upload(self):
+        results, barrier = [], threading.Barrier(8)
+
+        def reserve():
+            barrier.wait()
+            results.append(jobs.reserve_upload_job("manual.pdf"))
+
+        threads = [threading.Thread(target=reserve) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sum(reserved for _, reserved in results), 1)
+        self.assertEqual(len({job['job_id'] for job, _ in results}), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import threading
+import time
+import unittest
+
+import tests  # noqa: F401 (test data folders)
+from ollama_gateway import OllamaGateway, QueueTimeout, CHAT, ANALYSIS, BULK
+
+
+class OllamaGatewayTest(unittest.TestCase):
+    def make_gateway(self, max_concurrency: int, class_limits: dict | None = None) -> OllamaGateway:
+        return OllamaGateway(max_concurrency, class_limits or {}, {CHAT: 0, ANALYSIS: 0, BULK: 0})
+
+    def wait_until(self, condition):
+        deadline = time.monotonic() + 5
+        while not condition():
+            self.assertLess(time.monotonic(), deadline, "timed out")
+            time.sleep(0.005)
+
+    def start_request(self, gateway: OllamaGateway, request_class: str, started: list, release: threading.Event) -> threading.Thread:
+        def run():
+            with gateway.slot(request_class):
+                started.append(request_class)
+                release.wait(5)
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        self.addCleanup(thread.join, 5)
+        self.addCleanup(release.set)
+        return thread
+
+    def test_waiting_requests_start_by_class_priority(self):
+        gateway = self.make_gateway(1)
+        started, release = [], threading.Event()
+        holder_release = threading.Event()
+        self.start_request(gateway, BULK, [], holder_release)
+        self.wait_until(lambda: gateway.stats()['in_flight'] == 1)
+        for request_class in (BULK, ANALYSIS, CHAT): # Queued lowest priority first
+            self.start_request(gateway, request_class, started, release)
+            self.wait_until(lambda: gateway.stats()['classes'][request_class]['queued'] == 1)
+
+        holder_release.set()
+        release.set()
+        self.wait_until(lambda: len(started) == 3)
+        self.assertEqual(started, [CHAT, ANALYSIS, BULK])
+
+    def test_class_limit_leaves_room_for_other_classes(self):
+        gateway = self.make_gateway(2, {BULK: 1})
+        started, release = [], threading.Event()
+        self.start_request(gateway, BULK, started, release)
+        self.start_request(gateway, BULK, started, release)
+        self.wait_until(lambda: gateway.stats()['classes'][BULK]['queued'] == 1)
+        self.start_request(gateway, CHAT, started, release)
+        self.wait_until(lambda: len(started) == 2)
+        self.assertEqual(sorted(started), [BULK, CHAT])
+
+    def test_request_that_cannot_start_before_its_deadline_times_out(self):
+        gateway = self.make_gateway(1)
+        release = threading.Event()
+        self.start_request(gateway, BULK, [], release)
+        self.wait_until(lambda: gateway.stats()['in_flight'] == 1)
+        with self.assertRaises(QueueTimeout):
+            with gateway.slot(CHAT, timeout=0.05):
+                pass
+        stats = gateway.stats()['classes'][CHAT]
+        self.assertEqual((stats['timeouts'], stats['queued']), (1, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
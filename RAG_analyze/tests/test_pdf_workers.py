@@ -0,0 +1,69 @@
+import os
+import sys
+import json
+import subprocess
+import tempfile
+import textwrap
+import unittest
+import fitz  # PyMuPDF
+
+from tests import APP_DIR
+import pdf_workers
+
+
+def _make_pdf(path: str, pages: list[str]):
+    doc = fitz.open()
+    for text in pages:
+        doc.new_page().insert_text((72, 72), text)
+    doc.save(path)
+    doc.close()
+
+
+def loaded_modules() -> list[str]:
+    """Pool task: the modules imported by the worker process."""
+    return sorted(sys.modules)
+
+
+class ExtractDocumentTest(unittest.TestCase):
+    def test_pages_are_cleaned_and_offsets_point_at_page_starts(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "three.pdf")
+            _make_pdf(path, ["First   page", "", "Third    page"])
+            text, page_offsets, page_errors = pdf_workers.extract_document(path)
+        self.assertEqual(text, "First page" + pdf_workers.PAGE_SEPARATOR + "Third page")
+        self.assertEqual(page_errors, [])
+        self.assertEqual(len(page_offsets), 3)
+        self.assertTrue(text[page_offsets[2]:].startswith("Third"))
+        self.assertEqual(page_offsets[1], len("First page")) # An empty page adds no text
+
+
+class SpawnContextTest(unittest.TestCase):
+    def test_workers_do_not_import_the_parent_main_module(self):
+        # The parent's __main__ imports ai_core, as app.py and default.py do
+        script = textwrap.dedent(f"""
+            import sys, json
+            sys.path[:0] = [{APP_DIR!r}, {os.path.dirname(os.path.abspath(__file__))!r}]
+            import ai_core
+            print("MAIN MODULE RAN", file=sys.stderr)
+            import pdf_extract
+            from test_pdf_workers import loaded_modules
+            if __name__ == "__main__":
+                print(json.dumps(pdf_extract._get_pool().submit(loaded_modules).result()))
+                pdf_extract.shutdown_pool()
+        """)
+        with tempfile.TemporaryDirectory() as folder:
+            script_path = os.path.join(folder, "main_with_ai_core.py")
+            with open(script_path, "w", encoding="utf-8") as f:
+                f.write(script)
+            result = subprocess.run([sys.executable, script_path], capture_output=True, text=True, timeout=300,
+                                    env={**os.environ, "PDF_EXTRACT_WORKERS": "2"})
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stderr.count("MAIN MODULE RAN"), 1, "a worker re-ran the parent's __main__")
+        worker_modules = set(json.loads(result.stdout.strip().splitlines()[-1]))
+        self.assertIn("pdf_workers", worker_modules)
+        for heavy in ("ai_core", "config", "faiss", "langchain_core"):
+            self.assertNotIn(heavy, worker_modules)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+from unittest import mock
+
+import numpy as np
+
+import tests  # noqa: F401 (test data folders)
+from tests.fakes import reset_vector_store, make_chunks
+import ai_core
+import reranker
+
+
+class MmrOrderTest(unittest.TestCase):
+    def test_near_duplicate_gives_way_to_a_diverse_candidate(self):
+        relevance = np.array([1.0, 0.99, 0.5])
+        vectors = np.array([[1.0, 0.0], [1.0, 0.01], [0.0, 1.0]])
+        self.assertEqual(reranker.mmr_order(relevance, vectors, 2, 0.5), [0, 2])
+        self.assertEqual(reranker.mmr_order(relevance, vectors, 2, 1.0), [0, 1])
+
+
+class MmrRerankTest(unittest.TestCase):
+    def setUp(self):
+        self.embeddings = reset_vector_store()
+        texts = [f"gasket specification {i}" for i in range(40)]
+        self.assertTrue(ai_core.add_documents_to_vector_store(make_chunks("specs.pdf", texts)))
+
+    def test_search_collects_the_indexed_vectors_of_its_hits(self):
+        vectors = {}
+        hits = ai_core.batched_similarity_search(["gasket"], 10, vectors=vectors)[0]
+        self.assertEqual(len(hits), 10)
+        for doc, _ in hits:
+            expected = self.embeddings.embed_documents([doc.page_content])[0]
+            np.testing.assert_allclose(vectors[ai_core._chunk_key(doc)], expected, rtol=1e-6)
+
+    def test_mmr_does_not_embed_the_candidates(self):
+        patches = (
+            mock.patch.object(ai_core, 'RAG_RERANK_MODE', 'mmr'),
+            mock.patch.object(ai_core, 'RAG_MMR_LAMBDA', 0.5),
+            mock.patch.object(ai_core, 'MULTI_QUERY_COUNT', 0),
+            mock.patch.object(ai_core, 'RAG_HYBRID_ENABLED', False),
+            mock.patch.object(reranker, 'mmr_order', wraps=reranker.mmr_order),
+        )
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.embeddings.embedded_texts.clear()
+
+        context_docs, _, _ = ai_core.perform_rag_search("gasket")
+
+        self.assertEqual(len(context_docs), ai_core.RAG_CHUNK_K)
+        reranker.mmr_order.assert_called_once()
+        self.assertEqual(self.embeddings.embedded_texts, ["gasket"]) # Only the query
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from tests import TEST_DATA_DIR
+from tests.fakes import reset_vector_store, make_chunks
+import ai_core
+import sparse_index
+
+TEXTS = [
+    "Replace gasket PN-4471-B before restarting the pump.",  # 0
+    "The pump housing is cast iron.",                        # 1
+    "Torque the flange bolts to 40 Nm.",                     # 2
+    "Gasket PN-4471-B fits the inlet flange.",               # 3
+]
+
+
+class BM25IndexTest(unittest.TestCase):
+    def setUp(self):
+        self.index = sparse_index.BM25Index()
+        self.index.add(0, TEXTS)
+
+    def positions(self, query: str, **kwargs) -> list[int]:
+        return [position for position, _ in self.index.search(query, 10, **kwargs)]
+
+    def test_exact_identifier_matches(self):
+        self.assertEqual(sorted(self.positions("PN-4471-B")), [0, 3])
+        self.assertEqual(self.positions("cast iron"), [1])
+        self.assertEqual(self.positions("nothing matches this"), [])
+
+    def test_allowed_and_excluded_positions(self):
+        self.assertEqual(self.positions("gasket", allowed=np.array([3, 2])), [3])
+        self.assertEqual(self.positions("gasket", exclude=np.array([0])), [3])
+        self.assertEqual(self.positions("flange", allowed=np.array([], dtype=np.int64)), [])
+
+    def test_additions_must_be_contiguous(self):
+        with self.assertRaises(ValueError):
+            self.index.add(len(TEXTS) + 1, ["gap"])
+
+    def test_snapshot_round_trip_with_renumbering(self):
+        path = os.path.join(tempfile.mkdtemp(dir=TEST_DATA_DIR), sparse_index.SPARSE_FILENAME)
+        self.index.write_snapshot(path, positions=np.array([1, 2, 3]))
+        loaded = sparse_index.BM25Index(path)
+        self.assertEqual(loaded.count, 3)
+        self.assertEqual([position for position, _ in loaded.search("PN-4471-B", 10)], [2])
+        loaded.add(3, ["another gasket"])
+        self.assertEqual(sorted(position for position, _ in loaded.search("gasket", 10)), [2, 3])
+
+    def test_keyword_queries(self):
+        self.assertTrue(sparse_index.is_keyword_query("PN-4471-B", 4))
+        self.assertFalse(sparse_index.is_keyword_query("how do I replace the gasket", 4))
+
+
+class HybridSearchTest(unittest.TestCase):
+    def setUp(self):
+        patch = mock.patch.object(ai_core, 'RAG_HYBRID_ENABLED', True)
+        patch.start()
+        self.addCleanup(patch.stop)
+        reset_vector_store()
+        self.assertTrue(ai_core.add_documents_to_vector_store(make_chunks("pump.pdf", TEXTS[:2])))
+        self.assertTrue(ai_core.add_documents_to_vector_store(make_chunks("flange.pdf", TEXTS[2:])))
+
+    def sources(self, query: str, **kwargs) -> list[str]:
+        return [doc.metadata['source'] for doc, _ in ai_core.sparse_similarity_search([query], 10, **kwargs)[0]]
+
+    def test_source_filter_and_deleted_chunks(self):
+        self.assertEqual(sorted(self.sources("PN-4471-B")), ["flange.pdf", "pump.pdf"])
+        self.assertEqual(self.sources("PN-4471-B", sources=["flange.pdf"]), ["flange.pdf"])
+        self.assertEqual(self.sources("PN-4471-B", sources=["other.pdf"]), [])
+        ai_core.delete_source_documents("pump.pdf")
+        self.assertEqual(self.sources("PN-4471-B"), ["flange.pdf"])
+
+    def test_rank_fusion_rewards_chunks_found_by_both_rankings(self):
+        dense = [(doc, 0.0) for doc in make_chunks("a.pdf", ["x", "y", "z"])]
+        sparse = [dense[2]]
+        fused = ai_core._fuse_rankings([dense, sparse])
+        self.assertEqual([doc.page_content for doc, _ in fused], ["z", "x", "y"])
+
+
+if __name__ == '__main__':
+    unittest.main()
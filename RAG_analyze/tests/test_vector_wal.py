@@ -0,0 +1,66 @@
+import os
+import unittest
+from unittest import mock
+
+import tests  # noqa: F401 (test data folders)
+from tests.fakes import reset_vector_store, reload_vector_store, search_texts, make_chunks
+import ai_core
+import vector_wal
+from config import FAISS_FOLDER
+
+FIRST = [f"first batch {i}" for i in range(5)]
+SECOND = [f"second batch {i}" for i in range(3)]
+
+
+class WriteAheadLogTest(unittest.TestCase):
+    def setUp(self):
+        reset_vector_store()
+        patch = mock.patch.object(ai_core, 'FAISS_TOMBSTONE_COMPACT_RATIO', 10.0) # Compact only when a test asks
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.assertTrue(ai_core.add_documents_to_vector_store(make_chunks("first.pdf", FIRST))) # Writes the snapshot
+        self.snapshot_mtime = os.path.getmtime(os.path.join(FAISS_FOLDER, "index.faiss"))
+
+    def test_adds_after_the_snapshot_are_logged_and_replayed(self):
+        self.assertEqual(vector_wal.wal_size(), 0)
+        self.assertTrue(ai_core.add_documents_to_vector_store(make_chunks("second.pdf", SECOND)))
+
+        self.assertGreater(vector_wal.wal_size(), 0)
+        self.assertEqual(os.path.getmtime(os.path.join(FAISS_FOLDER, "index.faiss")), self.snapshot_mtime)
+        records = list(vector_wal.iter_records())
+        self.assertEqual([record['op'] for record in records], [vector_wal.OP_ADD])
+        self.assertEqual([doc.page_content for doc in records[0]['documents']], SECOND)
+
+        self.assertTrue(reload_vector_store())
+        self.assertEqual(ai_core.vector_store.index.ntotal, len(FIRST) + len(SECOND))
+        self.assertEqual(search_texts("batch"), set(FIRST) | set(SECOND))
+
+    def test_logged_deletes_are_replayed(self):
+        ai_core.add_documents_to_vector_store(make_chunks("second.pdf", SECOND))
+        ai_core.delete_source_documents("first.pdf")
+        self.assertEqual([record['op'] for record in vector_wal.iter_records()], [vector_wal.OP_ADD, vector_wal.OP_DELETE])
+
+        self.assertTrue(reload_vector_store())
+        self.assertEqual(search_texts("batch"), set(SECOND))
+        self.assertEqual(ai_core.pending_deletion_count(), len(FIRST))
+
+    def test_compaction_folds_the_log_into_the_snapshot(self):
+        ai_core.add_documents_to_vector_store(make_chunks("second.pdf", SECOND))
+        self.assertTrue(ai_core.compact_vector_store())
+        self.assertEqual(vector_wal.wal_size(), 0)
+        self.assertTrue(reload_vector_store())
+        self.assertEqual(search_texts("batch"), set(FIRST) | set(SECOND))
+
+    def test_torn_tail_is_truncated_and_earlier_records_survive(self):
+        ai_core.add_documents_to_vector_store(make_chunks("second.pdf", SECOND))
+        intact_size = vector_wal.wal_size()
+        with open(vector_wal.wal_path(), 'ab') as f:
+            f.write(b"FWAL\x00\x00") # Crash in the middle of the next header
+
+        self.assertTrue(reload_vector_store())
+        self.assertEqual(vector_wal.wal_size(), intact_size)
+        self.assertEqual(search_texts("batch"), set(FIRST) | set(SECOND))
+
+
+if __name__ == '__main__':
+    unittest.main()
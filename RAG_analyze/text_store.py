@@ -0,0 +1,145 @@
+# --- START OF FILE text_store.py ---
+
+# Persistent extracted-text store.
+# Text is stored gzip-compressed, keyed by the SHA-256 of the PDF bytes plus the extractor
+# version, so PyMuPDF only re-runs for new or changed files (or after extractor changes).
+# A small fingerprint index (path -> size, mtime, hash) avoids re-hashing unchanged files.
+import os
+import json
+import gzip
+import hashlib
+import logging
+import threading
+from typing import Callable
+from config import TEXT_STORE_FOLDER
+from pdf_extract import EXTRACTOR_VERSION
+
+logger = logging.getLogger(__name__)
+
+_FINGERPRINTS_FILE = os.path.join(TEXT_STORE_FOLDER, "fingerprints.json")
+_HASH_READ_BLOCK = 1024 * 1024 # 1MB reads while hashing
+
+_lock = threading.Lock()
+_fingerprints: dict[str, dict] | None = None # Lazily loaded from _FINGERPRINTS_FILE
+
+
+def _atomic_write_bytes(path: str, data: bytes):
+    """Writes bytes to a temp file next to `path` and renames it into place."""
+    tmp_path = f"{path}.tmp.{os.getpid()}.{threading.get_ident()}"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _load_fingerprints() -> dict[str, dict]:
+    """Returns the fingerprint index, loading it from disk on first use. Caller holds _lock."""
+    global _fingerprints
+    if _fingerprints is None:
+        _fingerprints = {}
+        if os.path.exists(_FINGERPRINTS_FILE):
+            try:
+                with open(_FINGERPRINTS_FILE, 'r', encoding='utf-8') as f:
+                    _fingerprints = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Could not read text store fingerprints ({e}). Files will be re-hashed.")
+                _fingerprints = {}
+    return _fingerprints
+
+
+def _save_fingerprints():
+    """Persists the fingerprint index. Caller holds _lock."""
+    try:
+        os.makedirs(TEXT_STORE_FOLDER, exist_ok=True)
+        _atomic_write_bytes(_FINGERPRINTS_FILE, json.dumps(_fingerprints).encode('utf-8'))
+    except OSError as e:
+        logger.warning(f"Could not save text store fingerprints: {e}")
+
+
+def compute_file_hash(file_path: str) -> str:
+    """Computes the SHA-256 hex digest of a file's bytes."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(_HASH_READ_BLOCK), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def get_file_hash(file_path: str) -> str:
+    """Returns the content hash of a file, reusing the stored hash if size and mtime are unchanged.
+
+    Raises:
+        OSError: If the file cannot be read.
+    """
+    abs_path = os.path.abspath(file_path)
+    stat = os.stat(abs_path)
+    with _lock:
+        entry = _load_fingerprints().get(abs_path)
+        if entry and entry.get('size') == stat.st_size and entry.get('mtime_ns') == stat.st_mtime_ns:
+            return entry['sha256']
+
+    content_hash = compute_file_hash(abs_path)
+    with _lock:
+        _load_fingerprints()[abs_path] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': content_hash}
+        _save_fingerprints()
+    return content_hash
+
+
+def _entry_path(content_hash: str) -> str:
+    """Path of the stored text for a content hash under the current extractor version."""
+    return os.path.join(TEXT_STORE_FOLDER, f"{content_hash}.v{EXTRACTOR_VERSION}.json.gz")
+
+
+def load_entry(content_hash: str) -> dict | None:
+    """Loads a stored entry ({'text': ..., 'page_offsets': [...]}) or None if absent/unreadable."""
+    path = _entry_path(content_hash)
+    if not os.path.exists(path):
+        return None
+    try:
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Stored text for {content_hash[:12]} is unreadable ({e}). It will be re-extracted.")
+        return None
+
+
+def save_entry(content_hash: str, text: str, page_offsets: list[int]) -> bool:
+    """Stores extracted text (and page offsets) for a content hash."""
+    try:
+        os.makedirs(TEXT_STORE_FOLDER, exist_ok=True)
+        payload = json.dumps({'text': text, 'page_offsets': page_offsets}).encode('utf-8')
+        _atomic_write_bytes(_entry_path(content_hash), gzip.compress(payload, compresslevel=6))
+        return True
+    except OSError as e:
+        logger.error(f"Failed to persist extracted text for {content_hash[:12]}: {e}", exc_info=True)
+        return False
+
+
+def get_or_extract(pdf_path: str, extract_fn: Callable[[str], tuple[str | None, list[int]]]) -> str | None:
+    """Returns the text of a PDF from the store, extracting and storing it only if needed.
+
+    Args:
+        pdf_path (str): The full path to the PDF file.
+        extract_fn (Callable): Extractor returning (text, page_offsets), e.g. ai_core.extract_text_with_offsets.
+
+    Returns:
+        str | None: The document text, or None if extraction failed.
+    """
+    filename = os.path.basename(pdf_path)
+    try:
+        content_hash = get_file_hash(pdf_path)
+    except OSError as e:
+        logger.error(f"Could not hash '{filename}' for the text store: {e}")
+        return None
+
+    entry = load_entry(content_hash)
+    if entry and entry.get('text'):
+        logger.debug(f"Text store hit for '{filename}' ({content_hash[:12]}).")
+        return entry['text']
+
+    logger.info(f"Text store miss for '{filename}'. Extracting...")
+    text, page_offsets = extract_fn(pdf_path)
+    if text:
+        save_entry(content_hash, text, page_offsets)
+    return text
+
+# --- END OF FILE text_store.py ---
@@ -78,6 +78,72 @@ def parse_llm_response(full_response: str | None) -> tuple[str, str | None]:
     return user_answer, thinking_content
 
 
+class ThinkingStreamSplitter:
+    """
+    Incrementally separates <thinking>...</thinking> content from answer text in a token stream.
+
+    Tags may be split across chunks, so a trailing partial tag is held back until the next
+    chunk (or `flush()`) decides it. Matching is case-insensitive and allows attributes on the
+    opening tag, mirroring `parse_llm_response`, which remains the source of truth for the
+    final stored message.
+    """
+    _OPEN_TAG = re.compile(r"<thinking\b[^>]*>", re.IGNORECASE)
+    _CLOSE_TAG = re.compile(r"</thinking>", re.IGNORECASE)
+    _MAX_OPEN_TAG_LEN = 200 # An unterminated '<thinking ...' longer than this is treated as text
+
+    def __init__(self):
+        self._buffer = ""
+        self._in_thinking = False
+
+    def feed(self, chunk: str) -> list[tuple[str, str]]:
+        """
+        Adds a chunk of model output.
+
+        Returns:
+            list[tuple[str, str]]: Ordered (kind, text) segments, kind being 'thinking' or 'answer'.
+        """
+        self._buffer += chunk or ""
+        segments = []
+        while self._buffer:
+            tag_re = self._CLOSE_TAG if self._in_thinking else self._OPEN_TAG
+            kind = 'thinking' if self._in_thinking else 'answer'
+            match = tag_re.search(self._buffer)
+            if match:
+                if match.start() > 0:
+                    segments.append((kind, self._buffer[:match.start()]))
+                self._buffer = self._buffer[match.end():]
+                self._in_thinking = not self._in_thinking
+                continue
+
+            # No complete tag: emit everything except a possible partial tag at the end
+            hold_from = self._partial_tag_start()
+            if hold_from > 0:
+                segments.append((kind, self._buffer[:hold_from]))
+                self._buffer = self._buffer[hold_from:]
+            break
+        return segments
+
+    def flush(self) -> list[tuple[str, str]]:
+        """Emits any held-back text at the end of the stream."""
+        segments = []
+        if self._buffer:
+            segments.append(('thinking' if self._in_thinking else 'answer', self._buffer))
+            self._buffer = ""
+        return segments
+
+    def _partial_tag_start(self) -> int:
+        """Index where a possibly incomplete tag begins at the end of the buffer (len if none)."""
+        last_lt = self._buffer.rfind('<')
+        if last_lt == -1:
+            return len(self._buffer)
+        tail = self._buffer[last_lt:].lower()
+        tag_name = "</thinking>" if self._in_thinking else "<thinking"
+        could_be_tag = tag_name.startswith(tail) or (
+            not self._in_thinking and tail.startswith(tag_name) and len(tail) <= self._MAX_OPEN_TAG_LEN
+        )
+        return last_lt if could_be_tag else len(self._buffer)
+
+
 def extract_references(answer_text: str, context_docs_map: dict[int, dict]) -> list[dict]:
     """
     Finds citation markers like [N] in the answer text and maps them back
@@ -0,0 +1,134 @@
+# --- START OF FILE vector_wal.py ---
+
+# Write-ahead log for incremental FAISS persistence.
+# Each add to the vector store appends one record (docstore ids, float32 vectors and the
+# Documents) to FAISS_FOLDER/index.wal instead of rewriting the snapshot; each deletion
+# appends the deleted docstore ids. On load the records are replayed on top of the last
+# snapshot; compaction writes a new snapshot and truncates the log.
+#
+# Record framing: magic (4 bytes) | crc32 of payload (uint32) | payload length (uint64) | payload.
+# A torn or corrupt tail (crash mid-append) is detected by the framing/CRC and truncated.
+import os
+import pickle
+import struct
+import logging
+import threading
+import zlib
+from typing import Iterator
+import numpy as np
+from config import FAISS_FOLDER, FAISS_WAL_FSYNC
+
+logger = logging.getLogger(__name__)
+
+WAL_FILENAME = "index.wal"
+_MAGIC = b"FWAL"
+_HEADER = struct.Struct("<4sIQ")
+OP_ADD = "add"
+OP_DELETE = "delete"
+
+_file_lock = threading.Lock()
+
+
+def wal_path(folder: str = FAISS_FOLDER) -> str:
+    return os.path.join(folder, WAL_FILENAME)
+
+
+def wal_size(folder: str = FAISS_FOLDER) -> int:
+    """Current size of the log in bytes (0 if it does not exist)."""
+    try:
+        return os.path.getsize(wal_path(folder))
+    except OSError:
+        return 0
+
+
+def _append_payload(record: dict, folder: str) -> int:
+    payload = pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+    header = _HEADER.pack(_MAGIC, zlib.crc32(payload), len(payload))
+    os.makedirs(folder, exist_ok=True)
+    with _file_lock:
+        with open(wal_path(folder), 'ab') as f:
+            f.write(header + payload)
+            f.flush()
+            if FAISS_WAL_FSYNC:
+                os.fsync(f.fileno())
+            return f.tell()
+
+
+def append_record(ids: list[str], vectors, documents: list, folder: str = FAISS_FOLDER) -> int:
+    """Appends one add operation to the log.
+
+    Args:
+        ids (list[str]): Docstore ids assigned to the documents.
+        vectors: Embeddings in the same order (list of lists or 2D array).
+        documents (list): The LangChain Documents stored under those ids.
+
+    Returns:
+        int: The log size in bytes after the append.
+    """
+    return _append_payload({
+        'op': OP_ADD,
+        'ids': list(ids),
+        'vectors': np.asarray(vectors, dtype=np.float32),
+        'documents': list(documents),
+    }, folder)
+
+
+def append_delete_record(ids: list[str], folder: str = FAISS_FOLDER) -> int:
+    """Appends one delete operation (the docstore ids removed) to the log.
+
+    Returns:
+        int: The log size in bytes after the append.
+    """
+    return _append_payload({'op': OP_DELETE, 'ids': list(ids)}, folder)
+
+
+def iter_records(folder: str = FAISS_FOLDER) -> Iterator[dict]:
+    """Yields logged records in append order, truncating a torn/corrupt tail once reached.
+
+    Yields:
+        dict: Add records {'op': 'add', 'ids': list[str], 'vectors': np.ndarray (float32),
+              'documents': list[Document]} or delete records {'op': 'delete', 'ids': list[str]}.
+    """
+    path = wal_path(folder)
+    if not os.path.exists(path):
+        return
+    good_end = 0
+    torn = False
+    with open(path, 'rb') as f:
+        while True:
+            header = f.read(_HEADER.size)
+            if not header:
+                break
+            if len(header) < _HEADER.size:
+                torn = True
+                break
+            magic, crc, length = _HEADER.unpack(header)
+            payload = f.read(length) if magic == _MAGIC else b""
+            if magic != _MAGIC or len(payload) < length or zlib.crc32(payload) != crc:
+                torn = True
+                break
+            good_end = f.tell()
+            record = pickle.loads(payload)
+            record.setdefault('op', OP_ADD) # Records written before deletes were logged
+            yield record
+    if torn:
+        logger.warning(f"Truncating torn/corrupt tail of FAISS write-ahead log at byte {good_end} ({path}).")
+        with _file_lock, open(path, 'r+b') as f:
+            f.truncate(good_end)
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def reset(folder: str = FAISS_FOLDER):
+    """Empties the log after its records have been folded into a snapshot."""
+    path = wal_path(folder)
+    with _file_lock:
+        if not os.path.exists(path):
+            return
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    logger.debug(f"FAISS write-ahead log reset ({path}).")
+
+# --- END OF FILE vector_wal.py ---
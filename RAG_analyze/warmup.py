@@ -0,0 +1,152 @@
+# --- START OF FILE warmup.py ---
+
+# Background warm-up of the app's components at process start.
+# Each component (database, models, index, documents) is loaded by its own thread, so a slow
+# step (e.g. the Ollama probe or extracting a large corpus) does not delay the others, and the
+# HTTP server starts accepting requests immediately. Readiness is tracked per component:
+#   pending -> running -> ready | failed
+# Routes wait only for the components they need (`wait`, bounded by STARTUP_WAIT_TIMEOUT), and
+# /status reports every component's state and load time without blocking.
+import time
+import logging
+import threading
+from typing import Callable, Iterable
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+RUNNING = "running"
+READY = "ready"
+FAILED = "failed"
+
+
+class _Component:
+    def __init__(self, name: str):
+        self.name = name
+        self.state = PENDING
+        self.detail: str | None = None # Short outcome, e.g. "12 documents" or the error
+        self.started_at: float | None = None
+        self.finished_at: float | None = None
+        self.done = threading.Event()
+
+    def snapshot(self) -> dict:
+        if self.started_at is None:
+            seconds = None
+        else:
+            seconds = round((self.finished_at or time.monotonic()) - self.started_at, 3)
+        return {"state": self.state, "seconds": seconds, "detail": self.detail}
+
+
+class Warmup:
+    """Runs named warm-up tasks in background threads and tracks their readiness."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._components: dict[str, _Component] = {}
+
+    def _component(self, name: str) -> _Component:
+        with self._lock:
+            if name not in self._components:
+                self._components[name] = _Component(name)
+            return self._components[name]
+
+    def start(self, name: str, task: Callable[[], str | None], requires: Iterable[str] = ()) -> bool:
+        """Runs `task` in a background thread once every component in `requires` is ready.
+
+        The task signals failure by raising; its return value (if any) is kept as the detail
+        shown by /status. A component whose requirement failed fails too, without running.
+
+        Returns:
+            bool: False if the component was already started (nothing is done).
+        """
+        component = self._component(name)
+        with self._lock:
+            if component.started_at is not None:
+                return False
+            component.started_at = time.monotonic()
+        requires = list(requires)
+        threading.Thread(target=self._run, args=(component, task, requires), name=f"warmup-{name}", daemon=True).start()
+        return True
+
+    def _run(self, component: _Component, task: Callable[[], str | None], requires: list[str]):
+        for required in requires:
+            self._component(required).done.wait()
+        missing = [required for required in requires if not self.is_ready(required)]
+        if missing:
+            self._finish(component, FAILED, f"requires {', '.join(missing)}")
+            return
+        component.state = RUNNING
+        try:
+            detail = task()
+        except Exception as e:
+            logger.error(f"Warm-up of '{component.name}' failed: {e}", exc_info=True)
+            self._finish(component, FAILED, f"{type(e).__name__}: {e}"[:200])
+            return
+        self._finish(component, READY, detail)
+
+    def _finish(self, component: _Component, state: str, detail: str | None):
+        component.detail = detail
+        component.finished_at = time.monotonic()
+        component.state = state
+        component.done.set()
+        seconds = component.finished_at - component.started_at
+        log = logger.info if state == READY else logger.warning
+        log(f"Warm-up: {component.name} {state} after {seconds:.2f}s" + (f" ({detail})" if detail else "") + ".")
+        if self.finished():
+            summary = ", ".join(f"{name}={snapshot['state']}" for name, snapshot in self.stats().items())
+            logger.info(f"--- Application warm-up complete: {summary} ---")
+
+    def is_ready(self, name: str) -> bool:
+        """True if the component finished successfully (never blocks)."""
+        return self._component(name).state == READY
+
+    def wait(self, name: str, timeout: float | None = None) -> bool:
+        """Blocks until the component has finished warming up (or `timeout` seconds pass).
+
+        Returns:
+            bool: True if the component is ready; False if it failed, was never started or is still loading.
+        """
+        component = self._component(name)
+        if component.started_at is None:
+            return False
+        if not component.done.wait(timeout):
+            logger.warning(f"Gave up waiting for '{name}' to finish warming up after {timeout:.0f}s.")
+            return False
+        return component.state == READY
+
+    def finished(self) -> bool:
+        """True once every started component has finished (ready or failed)."""
+        with self._lock:
+            components = list(self._components.values())
+        return all(component.done.is_set() for component in components if component.started_at is not None)
+
+    def stats(self) -> dict:
+        """Returns {component: {state, seconds, detail}} suitable for the /status endpoint."""
+        with self._lock:
+            components = list(self._components.values())
+        return {component.name: component.snapshot() for component in components}
+
+
+warmup = Warmup()
+
+
+def start(name: str, task: Callable[[], str | None], requires: Iterable[str] = ()) -> bool:
+    return warmup.start(name, task, requires)
+
+
+def is_ready(name: str) -> bool:
+    return warmup.is_ready(name)
+
+
+def wait(name: str, timeout: float | None = None) -> bool:
+    return warmup.wait(name, timeout)
+
+
+def finished() -> bool:
+    return warmup.finished()
+
+
+def stats() -> dict:
+    return warmup.stats()
+
+# --- END OF FILE warmup.py ---